@@ -0,0 +1,366 @@
+"""
+analytics.py
+Circulation analytics over the whole loan history, computed with NumPy. Loans are held as
+typed columns (LoanArrays: int32 ids, and dates as int32 days since 1970-01-01) and every
+figure is one vectorised pass over them, so the dashboard's statistics take milliseconds
+even with tens of millions of loans:
+
+    circulation by genre, by month, and genre x month
+    average loan duration
+    overdue rate per member cohort (members grouped by the month of their first loan)
+    turnover per title (loans, and the share of days the title has spent on loan)
+
+LibraryAnalytics keeps the arrays between refreshes and reads only what changed since the
+last one: loans with a higher id, and the return dates of the loans that were still out.
+Serial ids are handed out at INSERT but become visible at COMMIT, so a loan can appear
+below ids already read; each refresh re-reads the last RESCAN_IDS ids and keeps the loans
+it did not have. A loan committed later than that is only picked up by refresh(full=True),
+which the SmartLibrary dashboard runs every ANALYTICS_REBUILD_MINUTES.
+
+    python analytics.py                    # summary of the configured database
+    python analytics.py --backend sqlite
+
+bench_analytics.py times the passes on generated loans. Needs numpy (pip install numpy);
+the rest of SmartLibrary does not.
+"""
+import argparse
+import contextlib
+import datetime
+import sys
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from backends import BACKENDS, DB_BACKEND, open_database
+
+ANALYTICS_CHUNK_ROWS = 250_000  # rows turned into arrays at a time while loading
+ANALYTICS_TOP_N = 5
+RETURN_LOOKUP_BATCH = 1000      # loan ids per query when checking which active loans came back
+RESCAN_IDS = 1000               # ids below the newest already read that are read again
+NO_DATE = -1                    # return_day of a loan that is still out
+EPOCH = datetime.date(1970, 1, 1)
+UNKNOWN_GENRE = "Unknown"
+
+# Backend -> SQL turning a DATE column into days since EPOCH
+DAY_NUMBER_SQL = {
+    'postgres': "({0} - DATE '1970-01-01')",
+    'sqlite': "CAST(julianday({0}) - 2440587.5 AS INTEGER)",
+}
+
+
+def day_number(date):
+    return (date - EPOCH).days
+
+
+def month_of(days):
+    """Months since 1970-01 for an array of day numbers.
+
+    Converts each distinct day once and looks the rest up: datetime64 casts of millions of
+    values are the slowest step of any pass otherwise.
+    """
+    if not len(days):
+        return np.empty(0, dtype=np.int32)
+    low = int(days.min())
+    table = np.arange(low, int(days.max()) + 1).astype('datetime64[D]').astype('datetime64[M]').astype(np.int32)
+    return table[days - low]
+
+
+def month_label(month):
+    return f"{1970 + month // 12}-{month % 12 + 1:02d}"
+
+
+def first_per_group(groups, values, size):
+    """Smallest value per group id (int32 max where a group has none)."""
+    first = np.full(size, np.iinfo(np.int32).max, dtype=np.int32)
+    np.minimum.at(first, groups, values)
+    return first
+
+
+def int32_columns(rows, width):
+    """Turns an iterable of integer tuples into `width` int32 arrays, ANALYTICS_CHUNK_ROWS at a time."""
+    chunks, chunk = [], []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= ANALYTICS_CHUNK_ROWS:
+            chunks.append(np.array(chunk, dtype=np.int32))
+            chunk = []
+    if chunk:
+        chunks.append(np.array(chunk, dtype=np.int32))
+    if not chunks:
+        return [np.empty(0, dtype=np.int32) for _ in range(width)]
+    return [np.concatenate([c[:, i] for c in chunks]) for i in range(width)]
+
+
+def top_indices(counts, n):
+    """Indices of the n largest counts, largest first (ties by index), skipping zeros."""
+    n = min(n, int(np.count_nonzero(counts)))
+    if n == 0:
+        return np.empty(0, dtype=np.intp)
+    candidates = np.argpartition(-counts, n - 1)[:n]
+    return candidates[np.lexsort((candidates, -counts[candidates]))]
+
+
+class LoanArrays:
+    """Loans as parallel int32 columns ordered by loan id."""
+
+    COLUMNS = ('loan_id', 'book_id', 'user_id', 'borrow_day', 'due_day', 'return_day')
+
+    def __init__(self, loan_id, book_id, user_id, borrow_day, due_day, return_day):
+        self.loan_id = loan_id
+        self.book_id = book_id
+        self.user_id = user_id
+        self.borrow_day = borrow_day
+        self.due_day = due_day
+        self.return_day = return_day
+
+    def __len__(self):
+        return len(self.loan_id)
+
+    @classmethod
+    def empty(cls):
+        return cls(*(np.empty(0, dtype=np.int32) for _ in cls.COLUMNS))
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Builds the columns from (loan_id, book_id, user_id, borrow_day, due_day, return_day) rows."""
+        return cls(*int32_columns(rows, len(cls.COLUMNS)))
+
+    def merge(self, other):
+        """Adds the loans of `other` (in loan id order) that are not held yet, keeping loan id order."""
+        where = np.searchsorted(self.loan_id, other.loan_id)
+        held = where < len(self)
+        held[held] = self.loan_id[where[held]] == other.loan_id[held]
+        if held.all():
+            return self
+        return LoanArrays(*(np.insert(getattr(self, name), where[~held], getattr(other, name)[~held])
+                            for name in self.COLUMNS))
+
+
+class LibraryAnalytics:
+    """Circulation statistics over every loan, kept in memory and refreshed incrementally.
+
+    refresh() and summary() may be called from worker threads; they take turns.
+    """
+
+    def __init__(self, db=None):
+        self.db = db
+        self.loans = None
+        self.genres = [UNKNOWN_GENRE]               # genre code -> name
+        self.book_genre = np.empty(0, dtype=np.int32)  # book id -> genre code
+        self.first_month = 0
+        self.borrow_month = np.empty(0, dtype=np.int32)  # per loan, months after first_month
+        self.loan_genre = np.empty(0, dtype=np.int32)    # per loan
+        self._lock = threading.Lock()
+
+    def load(self, loans, genres, book_genre):
+        """Uses arrays built elsewhere (e.g. generated ones) instead of reading the database."""
+        with self._lock:
+            self.loans = loans
+            self.genres = list(genres)
+            self.book_genre = book_genre
+            self._derive()
+
+    # ---------------- Loading ----------------
+    def _day(self, column):
+        return DAY_NUMBER_SQL[self.db.backend_name].format(column)
+
+    def _load_loans(self, condition):
+        query = (f"SELECT id, book_id, user_id, {self._day('borrow_date')}, {self._day('due_date')}, "
+                 f"COALESCE({self._day('return_date')}, {NO_DATE}) FROM Loans WHERE {condition} ORDER BY id")
+        return LoanArrays.from_rows(self.db.stream_query(query))
+
+    def _apply_returns(self):
+        """Fills in return dates for loans that were out at the last refresh and have come back."""
+        positions = np.flatnonzero(self.loans.return_day == NO_DATE)
+        for start in range(0, len(positions), RETURN_LOOKUP_BATCH):
+            batch = positions[start:start + RETURN_LOOKUP_BATCH]
+            ids = ", ".join(str(int(i)) for i in self.loans.loan_id[batch])
+            query = (f"SELECT id, {self._day('return_date')} FROM Loans "
+                     f"WHERE id IN ({ids}) AND return_date IS NOT NULL")
+            returned = np.array(list(self.db.stream_query(query)), dtype=np.int32).reshape(-1, 2)
+            if len(returned):
+                where = np.searchsorted(self.loans.loan_id, returned[:, 0])
+                self.loans.return_day[where] = returned[:, 1]
+
+    def _load_genres(self):
+        codes = {UNKNOWN_GENRE: 0}
+        ids, book_codes = [], []
+        for book_id, genre in self.db.stream_query("SELECT id, genre FROM Books"):
+            ids.append(book_id)
+            book_codes.append(codes.setdefault(genre or UNKNOWN_GENRE, len(codes)))
+        size = max(ids, default=0) + 1
+        if len(self.loans):
+            size = max(size, int(self.loans.book_id.max()) + 1)  # a book deleted since its loans were read
+        book_genre = np.zeros(size, dtype=np.int32)
+        book_genre[np.array(ids, dtype=np.int64)] = book_codes
+        self.genres = list(codes)
+        self.book_genre = book_genre
+
+    def refresh(self, full=False):
+        """Reads loans added since the last refresh (all of them the first time or if `full`),
+        returns of loans that were out, and every book's genre. Returns the seconds taken.
+
+        Loans committed after later ids were read are caught while within RESCAN_IDS of the newest.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            if full or self.loans is None:
+                self.loans = self._load_loans("1 = 1")
+            else:
+                self._apply_returns()
+                last = int(self.loans.loan_id[-1]) if len(self.loans) else 0
+                self.loans = self.loans.merge(self._load_loans(f"id > {max(last - RESCAN_IDS, 0)}"))
+            self._load_genres()
+            self._derive()
+        return time.perf_counter() - start
+
+    def _derive(self):
+        months = month_of(self.loans.borrow_day)
+        self.first_month = int(months.min()) if len(months) else 0
+        self.borrow_month = months - np.int32(self.first_month)
+        self.loan_genre = self.book_genre[self.loans.book_id]
+
+    # ---------------- Vectorised passes ----------------
+    def circulation_by_genre(self):
+        """Loans per genre code (index into self.genres)."""
+        return np.bincount(self.loan_genre, minlength=len(self.genres))
+
+    def circulation_by_month(self):
+        """(first month, loans per month from then on)."""
+        return self.first_month, np.bincount(self.borrow_month)
+
+    def circulation_by_genre_and_month(self):
+        """(first month, loans as a genres x months grid)."""
+        months, genres = int(self.borrow_month.max(initial=-1)) + 1, len(self.genres)
+        cells = self.loan_genre * np.int32(months) + self.borrow_month
+        return self.first_month, np.bincount(cells, minlength=genres * months).reshape(genres, months)
+
+    def average_loan_days(self):
+        """Mean length of returned loans in days, or None if nothing has been returned."""
+        returned = self.loans.return_day != NO_DATE
+        if not returned.any():
+            return None
+        return float((self.loans.return_day[returned] - self.loans.borrow_day[returned]).mean())
+
+    def end_days(self, today):
+        """Return day of each loan, or `today` for loans still out."""
+        return np.where(self.loans.return_day == NO_DATE, np.int32(today), self.loans.return_day)
+
+    def overdue_mask(self, today):
+        """Loans returned after their due date, or still out past it."""
+        return self.end_days(today) > self.loans.due_day
+
+    def overdue_by_cohort(self, today):
+        """(first cohort month, loans per cohort, overdue loans per cohort).
+
+        A member's cohort is the month of their first loan.
+        """
+        loans = self.loans
+        if not len(loans):
+            return 0, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        first_day = first_per_group(loans.user_id, loans.borrow_day, int(loans.user_id.max()) + 1)
+        borrowers = first_day != np.iinfo(np.int32).max
+        member_cohort = np.zeros(len(first_day), dtype=np.int32)
+        member_cohort[borrowers] = month_of(first_day[borrowers])
+        first = int(member_cohort[borrowers].min())
+        cohort = member_cohort[loans.user_id] - np.int32(first)
+        total = np.bincount(cohort)
+        overdue = np.bincount(cohort[self.overdue_mask(today)], minlength=len(total))
+        return first, total, overdue
+
+    def turnover_by_title(self, today):
+        """(loans per book id, share of days on loan since the book's first loan per book id)."""
+        loans = self.loans
+        size = len(self.book_genre)
+        count = np.bincount(loans.book_id, minlength=size)
+        days_out = np.bincount(loans.book_id, weights=self.end_days(today) - loans.borrow_day, minlength=size)
+        first = first_per_group(loans.book_id, loans.borrow_day, size)
+        span = np.maximum(today - first.astype(np.int64) + 1, 1)
+        return count, np.where(count > 0, np.minimum(days_out / span, 1.0), 0.0)
+
+    # ---------------- Dashboard ----------------
+    def summary(self, today=None, top_n=ANALYTICS_TOP_N, months=12):
+        """The figures the dashboard shows, as plain Python values.
+
+        'top_titles' holds (book_id, loans, utilisation); the caller looks up titles.
+        """
+        today = day_number(today or datetime.date.today())
+        with self._lock:
+            loans = self.loans if self.loans is not None else LoanArrays.empty()
+            if not len(loans):
+                return {'loans': 0, 'active': 0, 'average_loan_days': None, 'overdue_rate': None,
+                        'genres': [], 'genres_this_month': [], 'months': [], 'cohorts': [], 'top_titles': []}
+            first_month, grid = self.circulation_by_genre_and_month()
+            by_genre = grid.sum(axis=1)
+            this_month = int(month_of(np.array([today], dtype=np.int32))[0]) - first_month
+            current = grid[:, this_month] if 0 <= this_month < grid.shape[1] else np.zeros(len(self.genres), np.int64)
+            per_month = grid.sum(axis=0)
+            cohort_first, cohort_loans, cohort_overdue = self.overdue_by_cohort(today)
+            turnover, utilisation = self.turnover_by_title(today)
+            top_titles = top_indices(turnover, top_n)
+            return {
+                'loans': len(loans),
+                'active': int(np.count_nonzero(loans.return_day == NO_DATE)),
+                'average_loan_days': self.average_loan_days(),
+                'overdue_rate': int(cohort_overdue.sum()) / len(loans),
+                'genres': [(self.genres[g], int(by_genre[g])) for g in top_indices(by_genre, top_n)],
+                'genres_this_month': [(self.genres[g], int(current[g])) for g in top_indices(current, top_n)],
+                'months': [(month_label(first_month + m), int(per_month[m]))
+                           for m in range(max(0, len(per_month) - months), len(per_month))],
+                'cohorts': [(month_label(cohort_first + c), int(total), int(cohort_overdue[c]) / int(total))
+                            for c, total in enumerate(cohort_loans) if total][-months:],
+                'top_titles': [(int(b), int(turnover[b]), float(utilisation[b])) for b in top_titles],
+            }
+
+
+def print_summary(summary, titles):
+    print(f"Loans: {summary['loans']:,} ({summary['active']:,} active)")
+    if summary['average_loan_days'] is not None:
+        print(f"Average loan: {summary['average_loan_days']:.1f} days")
+    if summary['overdue_rate'] is not None:
+        print(f"Overdue: {summary['overdue_rate']:.1%} of loans")
+    print("Top genres:", ", ".join(f"{g} ({n:,})" for g, n in summary['genres']))
+    print("Top genres this month:", ", ".join(f"{g} ({n:,})" for g, n in summary['genres_this_month']) or "-")
+    print("Loans per month:")
+    for label, loans in summary['months']:
+        print(f"  {label}  {loans:>10,}")
+    print("Overdue rate by member cohort (month of first loan):")
+    for label, loans, rate in summary['cohorts']:
+        print(f"  {label}  {rate:6.1%} of {loans:,} loans")
+    print("Highest turnover titles:")
+    for book_id, loans, utilisation in summary['top_titles']:
+        print(f"  {titles.get(book_id, book_id)}: {loans:,} loans, on loan {utilisation:.0%} of the time")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=BACKENDS, help="default: backends.DB_BACKEND")
+    parser.add_argument("--top", type=int, default=ANALYTICS_TOP_N)
+    args = parser.parse_args()
+    if np is None:
+        raise SystemExit("analytics.py needs numpy: pip install numpy")
+
+    backend = args.backend or DB_BACKEND
+    with contextlib.redirect_stdout(sys.stderr):
+        db = open_database(backend, **({'minconn': 1, 'maxconn': 1} if backend == 'postgres' else {}))
+    if not db.pool:
+        raise SystemExit(1)
+    try:
+        analytics = LibraryAnalytics(db)
+        elapsed = analytics.refresh()
+        start = time.perf_counter()
+        summary = analytics.summary(top_n=args.top)
+        computed = time.perf_counter() - start
+        titles = {row[0]: row[1] for row in db.get_books_by_ids([b for b, _, _ in summary['top_titles']])}
+    finally:
+        db.close()
+    print_summary(summary, titles)
+    print(f"Loaded in {elapsed:.1f} s, computed in {computed * 1000:.0f} ms", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
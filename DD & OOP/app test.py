@@ -451,20 +451,15 @@ class SmartLibraryApp(QMainWindow):
         stats_layout = QHBoxLayout()
         stats_layout.setSpacing(25)
 
-        total_books = self.get_count("SELECT COUNT(*) FROM Books")
-        available_books = self.get_count("SELECT COUNT(*) FROM Books WHERE available = TRUE")
-        borrowed_books = total_books - available_books
-        total_members = self.get_count("SELECT COUNT(*) FROM Users WHERE role_id = 2")
-        total_clubs = self.get_count("SELECT COUNT(*) FROM BookClubs")
-        overdue = self.get_count("SELECT COUNT(*) FROM Loans WHERE return_date IS NULL AND due_date < CURRENT_DATE")
+        stats = self.get_library_stats()
 
         cards = [
-            ("Total Books", total_books, "#415a77"),
-            ("Available", available_books, "#4CAF50"),
-            ("Borrowed", borrowed_books, "#FF5722"),
-            ("Members", total_members, "#2196F3"),
-            ("Clubs", total_clubs, "#9C27B0"),
-            ("Overdue", overdue, "#F44336"),
+            ("Total Books", stats['total_books'], "#415a77"),
+            ("Available", stats['available_books'], "#4CAF50"),
+            ("Borrowed", stats['borrowed_books'], "#FF5722"),
+            ("Members", stats['members'], "#2196F3"),
+            ("Clubs", stats['clubs'], "#9C27B0"),
+            ("Overdue", stats['overdue'], "#F44336"),
         ]
 
         for label, value, color in cards:
@@ -507,21 +502,26 @@ class SmartLibraryApp(QMainWindow):
         widget.setLayout(layout)
         return widget
 
-    def get_count(self, query):
+    def get_library_stats(self):
+        keys = ('total_books', 'available_books', 'borrowed_books', 'members', 'clubs', 'overdue')
         try:
-            self.dao.cursor.execute(query)
-            result = self.dao.cursor.fetchone()
-            return result[0] if result else 0
+            self.dao.cursor.execute("""
+                SELECT total_books, available_books, total_books - available_books AS borrowed_books,
+                       members, clubs,
+                       COALESCE((SELECT SUM(active_loans) FROM ActiveLoansByDueDate
+                                 WHERE due_date < CURRENT_DATE), 0) AS overdue
+                FROM LibraryStats
+            """)
+            row = self.dao.cursor.fetchone()
+            return {k: row[k] for k in keys} if row else dict.fromkeys(keys, 0)
         except:
-            return 0
+            return dict.fromkeys(keys, 0)
 
     def get_top_books(self):
         try:
             self.dao.cursor.execute("""
-                SELECT b.title, COUNT(l.id) as count
-                FROM Books b LEFT JOIN Loans l ON b.id = l.book_id
-                GROUP BY b.id, b.title
-                ORDER BY count DESC LIMIT 5
+                SELECT title, times_borrowed as count
+                FROM PopularBooksReport LIMIT 5
             """)
             rows = self.dao.cursor.fetchall()
             if not rows:
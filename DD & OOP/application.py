@@ -5,16 +5,30 @@ Includes Login, Dashboard (styled stats), Book Catalog (Search/CRUD), Loans, and
 """
 import sys
 import datetime
+import html
 from PyQt5.QtGui import QPainter, QFont, QPalette, QColor
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                              QLabel, QLineEdit, QPushButton, QMessageBox, QTableWidget, QTableWidgetItem,
                              QTabWidget, QHeaderView, QGroupBox, QFormLayout, QDialog, QDialogButtonBox,
-                             QListWidget, QListWidgetItem, QTextEdit, QSpinBox, QSpacerItem, QSizePolicy)
+                             QListWidget, QListWidgetItem, QTextEdit, QSpinBox, QSpacerItem, QSizePolicy,
+                             QComboBox, QTableView, QFileDialog)
 
 # Import your custom classes and database manager
 from classes import User, Librarian, Member
-from databasemanager import DatabaseManager
+# Nothing here needs psycopg2 unless the postgres backend is used, so SQLite kiosks run without it
+from backends import open_database, QueryCanceller, CATALOG_PAGE_SIZE
+from workers import DbTaskRunner
+from catalogcache import CatalogCache
+from bulkimport import BulkImporter
+from tablemodels import RowTableModel, PagedTableModel, ButtonDelegate
+from instrumentation import serve_metrics
+import analytics
+import recommender
+import clubmatching
+
+# Set to a port (e.g. 9187) to serve database metrics to Prometheus at /metrics
+METRICS_PORT = None
 
 # Beautiful Blue-White-Black Theme (Custom QSS)
 STYLE = """
@@ -79,7 +93,7 @@ STYLE = """
         color: #0d1b2a;
         font-weight: bold;
     }
-    QTableWidget {
+    QTableView {
         background-color: #1b263b;
         color: #e0e1dd;
         gridline-color: #415a77;
@@ -108,9 +122,10 @@ STYLE = """
 # --- DIALOGS FOR MANAGEMENT ---
 
 class AuthorManagementDialog(QDialog):
-    def __init__(self, db_manager, parent=None):
+    def __init__(self, db_manager, runner, parent=None):
         super().__init__(parent)
         self.db = db_manager
+        self.runner = runner
         self.setWindowTitle("Manage Authors")
         self.setGeometry(300, 300, 450, 400)
 
@@ -147,8 +162,16 @@ class AuthorManagementDialog(QDialog):
 
         self.load_authors()
 
+    def done(self, result):
+        # Results for a closed dialog would land on deleted widgets
+        self.runner.discard('dialog_authors')
+        super().done(result)
+
     def load_authors(self):
-        authors = self.db.get_all_authors()
+        self.runner.submit(self.db.get_all_authors, key='dialog_authors',
+                           on_result=self.show_authors, on_error=self.show_error)
+
+    def show_authors(self, authors):
         self.author_list.setRowCount(0)
         for row_idx, author_data in enumerate(authors):
             self.author_list.insertRow(row_idx)
@@ -162,7 +185,11 @@ class AuthorManagementDialog(QDialog):
             QMessageBox.warning(self, "Input Error", "Author name cannot be empty.")
             return
 
-        success, msg = self.db.add_author(name, bio)
+        self.runner.submit(self.db.add_author, name, bio, key='dialog_authors',
+                           on_result=self.on_author_added, on_error=self.show_error)
+
+    def on_author_added(self, outcome):
+        success, msg = outcome
         if success:
             QMessageBox.information(self, "Success", msg)
             self.name_input.clear()
@@ -184,25 +211,32 @@ class AuthorManagementDialog(QDialog):
                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
 
         if reply == QMessageBox.Yes:
-            success, msg = self.db.delete_author(author_id)
-            if success:
-                QMessageBox.information(self, "Success", msg)
-                self.load_authors()
-            else:
-                QMessageBox.warning(self, "Error", msg)
+            self.runner.submit(self.db.delete_author, author_id, key='dialog_authors',
+                               on_result=self.on_author_deleted, on_error=self.show_error)
+
+    def on_author_deleted(self, outcome):
+        success, msg = outcome
+        if success:
+            QMessageBox.information(self, "Success", msg)
+            self.load_authors()
+        else:
+            QMessageBox.warning(self, "Error", msg)
+
+    def show_error(self, message):
+        QMessageBox.warning(self, "Database Error", message)
 
 
 class BookManagementDialog(QDialog):
-    def __init__(self, db_manager, book_data=None, parent=None):
+    def __init__(self, db_manager, runner, book_data=None, parent=None):
         super().__init__(parent)
         self.db = db_manager
+        self.runner = runner
         self.book_data = book_data
+        self.delta = None  # what the save changed, as reported by add_book/update_book
 
         self.setWindowTitle("Manage Book" if book_data else "Add New Book")
         self.setGeometry(300, 300, 500, 450)
 
-        self.all_authors = self.db.get_all_authors()
-
         layout = QVBoxLayout(self)
 
         # Form Fields
@@ -223,12 +257,8 @@ class BookManagementDialog(QDialog):
         author_layout = QVBoxLayout()
         self.author_list_widget = QListWidget()
         self.author_list_widget.setSelectionMode(QListWidget.MultiSelection)
-
-        for author in self.all_authors:
-            author_id, name, _ = author
-            item = QListWidgetItem(name)
-            item.setData(Qt.UserRole, author_id)
-            self.author_list_widget.addItem(item)
+        self.author_list_widget.addItem("Loading authors...")
+        self.author_list_widget.setEnabled(False)
 
         author_layout.addWidget(self.author_list_widget)
         author_group.setLayout(author_layout)
@@ -239,10 +269,31 @@ class BookManagementDialog(QDialog):
         self.buttons.accepted.connect(self.save_book)
         self.buttons.rejected.connect(self.reject)
         layout.addWidget(self.buttons)
+        self.buttons.button(QDialogButtonBox.Save).setEnabled(False)
 
         if self.book_data:
             self.load_data()
 
+        self.runner.submit(self.db.get_all_authors, key='dialog_book',
+                           on_result=self.show_authors, on_error=self.show_error)
+
+    def done(self, result):
+        self.runner.discard('dialog_book')
+        super().done(result)
+
+    def show_authors(self, authors):
+        self.author_list_widget.clear()
+        for author in authors:
+            author_id, name, _ = author
+            item = QListWidgetItem(name)
+            item.setData(Qt.UserRole, author_id)
+            self.author_list_widget.addItem(item)
+        self.author_list_widget.setEnabled(True)
+        self.buttons.button(QDialogButtonBox.Save).setEnabled(True)
+
+        if self.book_data:
+            self.select_current_authors()
+
     def load_data(self):
         # Data structure: ID, Title, Genre, Year, Available, Authors_Str
         _, title, genre, year, _, authors_str = self.book_data
@@ -251,6 +302,8 @@ class BookManagementDialog(QDialog):
         self.genre_input.setText(genre)
         self.year_input.setValue(year)
 
+    def select_current_authors(self):
+        authors_str = self.book_data[5]
         current_authors = [name.strip() for name in authors_str.split(',')]
         for i in range(self.author_list_widget.count()):
             item = self.author_list_widget.item(i)
@@ -273,17 +326,28 @@ class BookManagementDialog(QDialog):
         if self.book_data:
             # EDIT MODE
             book_id = self.book_data[0]
-            success, msg = self.db.update_book(book_id, title, genre, year, selected_author_ids)
+            call = (self.db.update_book, book_id, title, genre, year, selected_author_ids)
         else:
             # ADD MODE
-            success, msg = self.db.add_book(title, genre, year, selected_author_ids)
+            call = (self.db.add_book, title, genre, year, selected_author_ids)
 
+        self.buttons.setEnabled(False)
+        self.runner.submit(*call, key='dialog_book', on_result=self.on_saved, on_error=self.show_error)
+
+    def on_saved(self, outcome):
+        success, msg = outcome[:2]
+        self.delta = outcome[2] if len(outcome) > 2 else None
+        self.buttons.setEnabled(True)
         if success:
             QMessageBox.information(self, "Success", msg)
             self.accept()
         else:
             QMessageBox.warning(self, "Error", msg)
 
+    def show_error(self, message):
+        self.buttons.setEnabled(True)
+        QMessageBox.warning(self, "Database Error", message)
+
 
 class CreateClubDialog(QDialog):
     def __init__(self, parent=None):
@@ -310,9 +374,10 @@ class CreateClubDialog(QDialog):
 
 # --- LOGIN WINDOW ---
 class LoginWindow(QWidget):
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, runner):
         super().__init__()
         self.db = db_manager
+        self.runner = runner
         self.initUI()
 
     def initUI(self):
@@ -334,9 +399,9 @@ class LoginWindow(QWidget):
         self.pass_input.setEchoMode(QLineEdit.Password)
         layout.addWidget(self.pass_input)
 
-        btn_login = QPushButton('Login')
-        btn_login.clicked.connect(self.handle_login)
-        layout.addWidget(btn_login)
+        self.btn_login = QPushButton('Login')
+        self.btn_login.clicked.connect(self.handle_login)
+        layout.addWidget(self.btn_login)
 
         self.setLayout(layout)
 
@@ -344,21 +409,73 @@ class LoginWindow(QWidget):
         username = self.user_input.text()
         password = self.pass_input.text()
 
-        user_data = self.db.authenticate_user(username, password)
+        self.btn_login.setEnabled(False)
+        self.btn_login.setText('Logging in...')
+        self.runner.submit(self.db.authenticate_user, username, password, key='login',
+                           on_result=self.on_authenticated, on_error=self.on_login_error)
+
+    def on_authenticated(self, user_data):
+        self.btn_login.setEnabled(True)
+        self.btn_login.setText('Login')
 
         if user_data:
-            self.main_window = MainWindow(user_data, self.db)
+            self.main_window = MainWindow(user_data, self.db, self.runner)
             self.main_window.show()
             self.close()
         else:
             QMessageBox.warning(self, 'Error', 'Invalid credentials')
 
+    def on_login_error(self, message):
+        self.btn_login.setEnabled(True)
+        self.btn_login.setText('Login')
+        QMessageBox.warning(self, 'Database Error', message)
+
 
 # --- MAIN DASHBOARD ---
 class MainWindow(QMainWindow):
-    def __init__(self, user_data, db_manager):
+    # Emitted (from the notification thread) when the catalog cache patched these book ids
+    catalog_changed = pyqtSignal(object)
+    # Emitted (from a worker thread) with a progress line while a bulk import runs
+    import_progress = pyqtSignal(str)
+
+    # Status-bar text shown while a background load is running
+    LOADING_MESSAGES = {
+        'dashboard': "Loading dashboard...",
+        'analytics': "Computing circulation analytics...",
+        'recommender': "Updating recommendations...",
+        'books': "Loading catalog...",
+        'clubs': "Loading clubs...",
+        'club_members': "Loading club members...",
+        'club_matches': "Matching clubs to your reading...",
+        'loans': "Loading your loans...",
+    }
+    # Quiet period after the last keystroke before the catalog search runs
+    SEARCH_DEBOUNCE_MS = 250
+    POPULARITY_REFRESH_MINUTES = 15
+    # Incremental recommender merges drift from a full build (see recommender.py)
+    RECOMMENDER_REBUILD_MINUTES = 60
+    # Incremental analytics refreshes miss loans committed late (see analytics.py)
+    ANALYTICS_REBUILD_MINUTES = 60
+    DIAGNOSTICS_REFRESH_MS = 5000
+    RECOMMENDATIONS_SHOWN = 5
+
+    def __init__(self, user_data, db_manager, runner):
         super().__init__()
         self.db = db_manager
+        self.runner = runner
+        self.runner.loading_changed.connect(self.on_loading_changed)
+        self.import_progress.connect(self.statusBar().showMessage)
+        # Loan history held as NumPy arrays, refreshed incrementally with the dashboard
+        self.analytics = analytics.LibraryAnalytics(self.db) if analytics.np is not None else None
+        # "Borrowers also borrowed", kept current as loans arrive (on_catalog_changed, loan changes)
+        self.recommender = recommender.BookRecommender(self.db) if recommender.np is not None else None
+        self.recommender_queued = None  # refresh asked for while one runs: None, or whether it is full
+        # Per-club reading profiles for "Clubs for You", refreshed incrementally before each match
+        self.club_matcher = clubmatching.ClubMatcher(self.db) if clubmatching.np is not None else None
+
+        if isinstance(self.db, CatalogCache):
+            self.catalog_changed.connect(self.on_catalog_changed)
+            self.db.add_change_listener(self.catalog_changed.emit)
 
         if user_data['role_id'] == 1:
             self.user = Librarian(user_data['id'], user_data['username'], user_data['full_name'], user_data['email'])
@@ -387,14 +504,20 @@ class MainWindow(QMainWindow):
         if isinstance(self.user, Member):
             self.tab_loans = QWidget()
             self.tabs.addTab(self.tab_loans, "My Loans")
+        if isinstance(self.user, Librarian):
+            self.tab_diagnostics = QWidget()
+            self.tabs.addTab(self.tab_diagnostics, "Diagnostics")
 
         layout.addWidget(self.tabs)
+        self.statusBar().showMessage("Ready")
 
         self.setup_dashboard_tab()
         self.setup_catalog_tab()
         self.setup_clubs_tab()
         if isinstance(self.user, Member):
             self.setup_loans_tab()
+        if isinstance(self.user, Librarian):
+            self.setup_diagnostics_tab()
 
     # ---------------- TAB 1: DASHBOARD (Styled) ----------------
     def setup_dashboard_tab(self):
@@ -407,6 +530,10 @@ class MainWindow(QMainWindow):
         self.lbl_total_books = QLabel("...")
         self.lbl_active_members = QLabel("...")
         self.lbl_active_loans = QLabel("...")
+        self.lbl_available_books = QLabel("...")
+        self.lbl_borrowed_books = QLabel("...")
+        self.lbl_total_clubs = QLabel("...")
+        self.lbl_overdue_loans = QLabel("...")
 
         def create_stat_card(title, label):
             card = QGroupBox(title)
@@ -422,17 +549,29 @@ class MainWindow(QMainWindow):
         stats_layout.addWidget(create_stat_card("Active Members", self.lbl_active_members))
         stats_layout.addWidget(create_stat_card("Active Loans", self.lbl_active_loans))
 
+        stats_layout2 = QHBoxLayout()
+        stats_layout2.addWidget(create_stat_card("Available", self.lbl_available_books))
+        stats_layout2.addWidget(create_stat_card("Borrowed", self.lbl_borrowed_books))
+        stats_layout2.addWidget(create_stat_card("Book Clubs", self.lbl_total_clubs))
+        stats_layout2.addWidget(create_stat_card("Overdue", self.lbl_overdue_loans))
+
         layout.addLayout(stats_layout)
+        layout.addLayout(stats_layout2)
 
         # 2. Charts / Reports Section (Using two columns for popular books and clubs)
         charts_layout = QHBoxLayout()
 
         # Popular Books (Replaces Top Book Chart)
         popular_books_group = QGroupBox("Popular Books Report")
+        self.popular_window_combo = QComboBox()
+        for label, window in (("All time", 'all'), ("Last 30 days", '30d'), ("Last 7 days", '7d')):
+            self.popular_window_combo.addItem(label, window)
+        self.popular_window_combo.currentIndexChanged.connect(self.load_dashboard_data)
         self.lbl_popular_books = QLabel("Loading...")
         self.lbl_popular_books.setAlignment(Qt.AlignTop)
         self.lbl_popular_books.setWordWrap(True)
         pb_layout = QVBoxLayout(popular_books_group)
+        pb_layout.addWidget(self.popular_window_combo)
         pb_layout.addWidget(self.lbl_popular_books)
         charts_layout.addWidget(popular_books_group)
 
@@ -445,11 +584,26 @@ class MainWindow(QMainWindow):
         cs_layout.addWidget(self.lbl_top_clubs)
         charts_layout.addWidget(club_stats_group)
 
+        # Circulation analytics over the whole loan history (analytics.py)
+        analytics_group = QGroupBox("Circulation Analytics")
+        self.lbl_analytics = QLabel("Loading..." if self.analytics else "<i>Install numpy for circulation analytics.</i>")
+        self.lbl_analytics.setAlignment(Qt.AlignTop)
+        self.lbl_analytics.setWordWrap(True)
+        an_layout = QVBoxLayout(analytics_group)
+        an_layout.addWidget(self.lbl_analytics)
+        charts_layout.addWidget(analytics_group)
+
         layout.addLayout(charts_layout)
 
         # 3. Librarian Report (Overdue/Members: Only shown if Librarian)
         layout.addWidget(QLabel("<h3 style='color: #e0e1dd; margin-top: 10px;'>Detailed Reports</h3>"))
-        self.report_table = QTableWidget()
+        if isinstance(self.user, Librarian):
+            self.report_model = RowTableModel(["Book", "Borrower", "Due Date", "Days Overdue"])
+        else:
+            # Members see the Popular Books List in the table report as well
+            self.report_model = RowTableModel(["Title", "Genre", "Times Borrowed"])
+        self.report_table = QTableView()
+        self.report_table.setModel(self.report_model)
         self.report_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         layout.addWidget(self.report_table)
 
@@ -460,15 +614,63 @@ class MainWindow(QMainWindow):
         self.tab_dashboard.setLayout(layout)
         self.load_dashboard_data()
 
+        # The 7/30-day popularity view is refreshed periodically rather than per loan
+        self.popularity_timer = QTimer(self)
+        self.popularity_timer.setInterval(self.POPULARITY_REFRESH_MINUTES * 60 * 1000)
+        self.popularity_timer.timeout.connect(self.refresh_popularity)
+        self.popularity_timer.start()
+
+        if self.analytics:
+            self.analytics_timer = QTimer(self)
+            self.analytics_timer.setInterval(self.ANALYTICS_REBUILD_MINUTES * 60 * 1000)
+            self.analytics_timer.timeout.connect(lambda: self.load_analytics(full=True))
+            self.analytics_timer.start()
+
+    def refresh_popularity(self):
+        self.runner.submit(self.db.refresh_popular_books, key='popularity_refresh',
+                           on_error=lambda msg: print(f"Popularity refresh failed: {msg}"))
+
+    def on_loading_changed(self, key, loading):
+        busy = [msg for k, msg in self.LOADING_MESSAGES.items() if self.runner.is_loading(k)]
+        self.statusBar().showMessage("  ".join(busy) if busy else "Ready")
+
+    def show_db_error(self, message):
+        QMessageBox.warning(self, "Database Error", message)
+
     def load_dashboard_data(self):
+        window = self.popular_window_combo.currentData()
+        self.runner.submit(self.fetch_dashboard_data, window, key='dashboard',
+                           on_result=self.show_dashboard_data, on_error=self.show_db_error)
+        if self.analytics:
+            self.load_analytics()
+
+    def load_analytics(self, full=False):
+        self.runner.submit(self.fetch_analytics, full, key='analytics', on_result=self.show_analytics,
+                           on_error=lambda msg: self.lbl_analytics.setText(f"<i>Analytics unavailable: {html.escape(msg)}</i>"))
+
+    def fetch_dashboard_data(self, popular_window='all'):
+        """Runs on a worker thread: gathers everything the dashboard shows."""
+        is_librarian = isinstance(self.user, Librarian)
+        return {
+            'stats': self.db.get_library_stats(),
+            'popular_books': self.db.get_popular_books(popular_window),
+            'clubs': self.db.get_all_clubs(),
+            'report': self.db.get_overdue_books() if is_librarian else None,
+        }
+
+    def show_dashboard_data(self, data):
         # Update Stats Cards
-        stats = self.db.get_dashboard_stats()
+        stats = data['stats']
         self.lbl_total_books.setText(str(stats['books']))
         self.lbl_active_members.setText(str(stats['members']))
         self.lbl_active_loans.setText(str(stats['active_loans']))
+        self.lbl_available_books.setText(str(stats['available']))
+        self.lbl_borrowed_books.setText(str(stats['borrowed']))
+        self.lbl_total_clubs.setText(str(stats['clubs']))
+        self.lbl_overdue_loans.setText(str(stats['overdue']))
 
         # Update Popular Books List
-        popular_books = self.db.get_popular_books()
+        popular_books = data['popular_books']
         if popular_books:
             pb_text = "<br>".join([f"• {b[0]} ({b[2]} loans)" for b in popular_books])
         else:
@@ -476,7 +678,7 @@ class MainWindow(QMainWindow):
         self.lbl_popular_books.setText(pb_text)
 
         # Update Top Clubs List (Simple member count by name)
-        clubs = self.db.get_all_clubs()  # Need a method to get club members count, adapting for now
+        clubs = data['clubs']  # Need a method to get club members count, adapting for now
         if clubs:
             # Note: DatabaseManager.get_all_clubs doesn't return member count,
             # so we just list them for now to maintain the look.
@@ -486,24 +688,39 @@ class MainWindow(QMainWindow):
         self.lbl_top_clubs.setText(club_text)
 
         # Load Table Data (Overdue/Popular Books)
-        self.report_table.setRowCount(0)
-
         if isinstance(self.user, Librarian):
-            self.report_table.setColumnCount(4)
-            self.report_table.setHorizontalHeaderLabels(["Book", "Borrower", "Due Date", "Days Overdue"])
-            data = self.db.get_overdue_books()
-            cols = 4
+            self.report_model.set_rows(data['report'])
         else:
-            # Members see the Popular Books List in the table report as well
-            self.report_table.setColumnCount(3)
-            self.report_table.setHorizontalHeaderLabels(["Title", "Genre", "Times Borrowed"])
-            data = self.db.get_popular_books()
-            cols = 3
-
-        for row_idx, row_data in enumerate(data):
-            self.report_table.insertRow(row_idx)
-            for col_idx in range(cols):
-                self.report_table.setItem(row_idx, col_idx, QTableWidgetItem(str(row_data[col_idx])))
+            self.report_model.set_rows(popular_books)
+
+    def fetch_analytics(self, full=False):
+        """Runs on a worker thread: reads new loans and returns into the arrays (or every loan
+        if `full`), then summarises."""
+        self.analytics.refresh(full=full)
+        summary = self.analytics.summary()
+        rows = self.db.get_books_by_ids([book_id for book_id, _, _ in summary['top_titles']])
+        summary['titles'] = {row[0]: row[1] for row in rows}
+        return summary
+
+    def show_analytics(self, summary):
+        if not summary['loans']:
+            self.lbl_analytics.setText("<i>No loan data available.</i>")
+            return
+        lines = [f"<b>{summary['loans']:,}</b> loans, <b>{summary['active']:,}</b> out now"]
+        if summary['average_loan_days'] is not None:
+            lines.append(f"Average loan: <b>{summary['average_loan_days']:.1f}</b> days")
+        lines.append(f"Overdue: <b>{summary['overdue_rate']:.1%}</b> of loans")
+        genres = summary['genres_this_month'] or summary['genres']
+        heading = "This month" if summary['genres_this_month'] else "All time"
+        lines.append(f"<br><b>{heading}:</b> " + ", ".join(f"{html.escape(g)} ({n:,})" for g, n in genres))
+        lines.append("<br><b>Highest turnover:</b>")
+        lines += [f"• {html.escape(summary['titles'].get(book_id, str(book_id)))} "
+                  f"({loans:,} loans, out {utilisation:.0%} of the time)"
+                  for book_id, loans, utilisation in summary['top_titles']]
+        if summary['cohorts']:
+            lines.append("<br><b>Overdue by member cohort:</b>")
+            lines += [f"• First loan {label}: {rate:.1%}" for label, _, rate in summary['cohorts'][-3:]]
+        self.lbl_analytics.setText("<br>".join(lines))
 
     # ---------------- TAB 2: CATALOG (Search & CRUD) ----------------
     def setup_catalog_tab(self):
@@ -512,38 +729,99 @@ class MainWindow(QMainWindow):
         top_layout = QHBoxLayout()
         self.search_input = QLineEdit()
         self.search_input.setPlaceholderText("Search by Title, Genre, or Author...")
+        # Search as you type: each keystroke restarts the timer, so only a pause runs a query
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(self.SEARCH_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(self.load_books)
+        self.search_input.textChanged.connect(self.search_timer.start)
+        self.search_input.returnPressed.connect(self.load_books)
+        self.catalog_canceller = None
         btn_search = QPushButton("Search")
         btn_search.clicked.connect(self.load_books)
+        self.sort_combo = QComboBox()
+        sort_options = (("Sort: Relevance", 'relevance'), ("Sort: Title", 'title'),
+                        ("Sort: Year", 'year'), ("Sort: ID", 'id'))
+        for label, sort in sort_options:
+            self.sort_combo.addItem(label, sort)
+        self.sort_combo.currentIndexChanged.connect(self.load_books)
         top_layout.addWidget(self.search_input)
         top_layout.addWidget(btn_search)
+        top_layout.addWidget(self.sort_combo)
 
         if isinstance(self.user, Librarian):
             btn_manage_authors = QPushButton("Manage Authors")
             btn_manage_authors.clicked.connect(self.manage_authors)
             btn_add_book = QPushButton("Add New Book")
             btn_add_book.clicked.connect(lambda: self.manage_book())
+            self.btn_import_books = QPushButton("Import Books...")
+            self.btn_import_books.clicked.connect(self.import_books)
+            self.btn_import_books.setVisible(self.db.backend_name == 'postgres')  # bulk import uses COPY
             top_layout.addWidget(btn_manage_authors)
             top_layout.addWidget(btn_add_book)
+            top_layout.addWidget(self.btn_import_books)
+        else:
+            # Books are collected in a cart and checked out together in one transaction
+            self.cart = {}  # book id -> title, in the order added
+            self.btn_checkout = QPushButton()
+            self.btn_checkout.clicked.connect(self.checkout_cart)
+            btn_clear_cart = QPushButton("Clear Cart")
+            btn_clear_cart.clicked.connect(self.clear_cart)
+            top_layout.addWidget(self.btn_checkout)
+            top_layout.addWidget(btn_clear_cart)
+            self.update_cart_button()
 
         layout.addLayout(top_layout)
 
-        # Table
-        self.book_table = QTableWidget()
+        # Table: rows are fetched a page at a time as the view scrolls (canFetchMore/fetchMore)
+        headers = ['ID', 'Title', 'Genre', 'Year', 'Available', 'Authors']
+        self.book_table = QTableView()
+        self.book_table.setMouseTracking(True)
 
         if isinstance(self.user, Librarian):
-            self.book_table.setColumnCount(8)
-            self.book_table.setHorizontalHeaderLabels(
-                ['ID', 'Title', 'Genre', 'Year', 'Available', 'Authors', 'Edit', 'Delete'])
+            self.book_model = PagedTableModel(headers, [('Edit', lambda book: ("Edit", True)),
+                                                        ('Delete', lambda book: ("Delete", True))],
+                                              tooltip_fn=self.book_tooltip)
+            self.book_table.setModel(self.book_model)
+            self.attach_action(self.book_table, 6, lambda row: self.manage_book(self.book_model.row_data(row)))
+            self.attach_action(self.book_table, 7, lambda row: self.delete_book(self.book_model.row_data(row)[0]))
         else:
-            self.book_table.setColumnCount(7)
-            self.book_table.setHorizontalHeaderLabels(
-                ['ID', 'Title', 'Genre', 'Year', 'Available', 'Authors', 'Action'])
+            self.book_model = PagedTableModel(headers, [('Action', self.cart_action)], tooltip_fn=self.book_tooltip)
+            self.book_table.setModel(self.book_model)
+            self.attach_action(self.book_table, 6, lambda row: self.toggle_cart(self.book_model.row_data(row)))
 
-        self.book_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.book_model.fetch_requested.connect(self.fetch_books_page)
+        # ResizeToContents would measure every loaded row on each page, so size columns interactively
+        self.book_table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
         self.book_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
         self.book_table.setMinimumHeight(400)
         layout.addWidget(self.book_table)
 
+        if self.recommender:
+            recommendations_layout = QHBoxLayout()
+            similar_group = QGroupBox("Borrowers Also Borrowed")
+            self.lbl_similar_books = QLabel("<i>Select a book to see what its borrowers also read.</i>")
+            self.lbl_similar_books.setWordWrap(True)
+            QVBoxLayout(similar_group).addWidget(self.lbl_similar_books)
+            recommendations_layout.addWidget(similar_group)
+            self.book_table.selectionModel().currentRowChanged.connect(self.load_similar_books)
+            if isinstance(self.user, Member):
+                for_you_group = QGroupBox("Recommended for You")
+                self.lbl_for_you = QLabel("Loading...")
+                self.lbl_for_you.setWordWrap(True)
+                QVBoxLayout(for_you_group).addWidget(self.lbl_for_you)
+                recommendations_layout.addWidget(for_you_group)
+            layout.addLayout(recommendations_layout)
+            self.refresh_recommender()
+
+            self.recommender_timer = QTimer(self)
+            self.recommender_timer.setInterval(self.RECOMMENDER_REBUILD_MINUTES * 60 * 1000)
+            self.recommender_timer.timeout.connect(lambda: self.refresh_recommender(full=True))
+            self.recommender_timer.start()
+
+        self.lbl_catalog_count = QLabel("")
+        layout.addWidget(self.lbl_catalog_count)
+
         btn_refresh_catalog = QPushButton("Refresh Catalog")
         btn_refresh_catalog.clicked.connect(self.load_books)
         layout.addWidget(btn_refresh_catalog)
@@ -551,65 +829,211 @@ class MainWindow(QMainWindow):
         self.tab_catalog.setLayout(layout)
         self.load_books()
 
+    def attach_action(self, view, column, on_click):
+        """Draws `column` of `view` as buttons; on_click(row) runs when one is clicked."""
+        delegate = ButtonDelegate(view)
+        delegate.clicked.connect(on_click)
+        view.setItemDelegateForColumn(column, delegate)
+
     def load_books(self):
-        search_term = self.search_input.text()
-        books = self.db.get_all_books(search_term)
-        self.book_table.setRowCount(0)
+        """Restarts the catalog from its first page with the current search and sort."""
+        self.search_timer.stop()
+        # Whatever the previous search still has running on the server is now stale
+        if self.catalog_canceller:
+            self.catalog_canceller.cancel()
+        self.catalog_canceller = QueryCanceller()
+
+        self.catalog_query = (self.search_input.text(), self.sort_combo.currentData())
+        self.catalog_cursor = None
+        self.book_model.reset()
+        self.fetch_books_page()
+
+        search_term = self.catalog_query[0]
+        self.lbl_catalog_count.setText("")
+        self.runner.submit(self.db.estimate_book_count, search_term, canceller=self.catalog_canceller,
+                           key='book_count', on_result=self.show_book_count, on_error=self.on_count_error)
+
+    def fetch_books_page(self):
+        search_term, sort = self.catalog_query
+        if sort == 'relevance' and search_term.strip():
+            self.runner.submit(self.fetch_ranked_books_page, search_term, self.catalog_cursor or 0,
+                               self.catalog_canceller, key='books',
+                               on_result=self.show_books, on_error=self.on_books_error)
+        else:
+            # Without a search term there is nothing to rank, so browse by title
+            sort = 'title' if sort == 'relevance' else sort
+            self.runner.submit(self.db.get_books_page, search_term, sort, after=self.catalog_cursor,
+                               canceller=self.catalog_canceller, key='books',
+                               on_result=self.show_books, on_error=self.on_books_error)
+
+    def fetch_ranked_books_page(self, search_term, offset, canceller):
+        """Runs on a worker thread: one page of ranked search results, paged by offset."""
+        books = self.db.search_books(search_term, limit=CATALOG_PAGE_SIZE, offset=offset, canceller=canceller)
+        next_offset = offset + len(books) if len(books) == CATALOG_PAGE_SIZE else None
+        return books, next_offset
+
+    @staticmethod
+    def book_tooltip(book, column):
+        # Ranked search rows carry a highlighted snippet after the six catalog columns
+        if column == 1 and len(book) > 7:
+            return book[7]
+        return None
+
+    def on_books_error(self, message):
+        self.book_model.fetch_failed()
+        self.show_db_error(message)
+
+    def on_count_error(self, message):
+        # The count is only a hint; a failure shouldn't interrupt typing with a dialog
+        self.lbl_catalog_count.setText("")
+
+    def show_book_count(self, estimate):
+        self.lbl_catalog_count.setText(f"About {estimate:,} books")
+
+    def show_books(self, page):
+        books, self.catalog_cursor = page
+        self.book_model.append_page(books, has_more=self.catalog_cursor is not None)
+
+    def on_catalog_changed(self, book_ids):
+        """Patches changed books in place so other desks' loans show up without a reload."""
+        if self.recommender:
+            self.refresh_recommender()  # picks up loans made at other desks
+        if book_ids is None:
+            self.load_books()
+            return
+        for row, book in enumerate(self.book_model.rows):
+            if book[0] in book_ids:
+                fresh = self.db.get_book(book[0])
+                if fresh:
+                    # Keep any search extras (rank, snippet) that follow the catalog columns
+                    self.book_model.update_row(row, fresh + tuple(book[6:]))
+
+    # --- Recommendations (recommender.py) ---
+    def refresh_recommender(self, full=False):
+        # One refresh task at a time: loans at other desks during an hourly rebuild fold into a
+        # single follow-up instead of each holding a worker thread until the rebuild ends
+        if self.runner.is_loading('recommender'):
+            self.recommender_queued = full or bool(self.recommender_queued)
+            return
+        self.runner.submit(self.recommender.refresh, full, key='recommender', on_result=self.on_recommender_refreshed,
+                           on_error=self.on_recommender_failed)
 
-        is_librarian = isinstance(self.user, Librarian)
+    def run_queued_recommender_refresh(self):
+        if self.recommender_queued is not None:
+            full, self.recommender_queued = self.recommender_queued, None
+            self.refresh_recommender(full)
+
+    def on_recommender_refreshed(self, _elapsed):
+        self.run_queued_recommender_refresh()
+        if isinstance(self.user, Member):
+            self.load_recommendations()
+
+    def on_recommender_failed(self, message):
+        print(f"Recommender refresh failed: {message}")
+        self.run_queued_recommender_refresh()
+
+    def with_titles(self, results):
+        """(title, score) for recommender results, looked up in one query."""
+        titles = {row[0]: row[1] for row in self.db.get_books_by_ids([book_id for book_id, _ in results])}
+        return [(titles.get(book_id, f"#{book_id}"), score) for book_id, score in results]
+
+    def fetch_similar_books(self, book_id):
+        return self.with_titles(self.recommender.similar_books(book_id, self.RECOMMENDATIONS_SHOWN))
 
-        for row_idx, book_data in enumerate(books):
-            self.book_table.insertRow(row_idx)
-
-            # Insert Data (ID, Title, Genre, Year, Available, Authors)
-            for col_idx, data in enumerate(book_data):
-                self.book_table.setItem(row_idx, col_idx, QTableWidgetItem(str(data)))
-
-            b_id = book_data[0]
-            is_avail = book_data[4]
-
-            if is_librarian:
-                btn_edit = QPushButton("Edit")
-                btn_edit.clicked.connect(lambda _, data=book_data: self.manage_book(data))
-                self.book_table.setCellWidget(row_idx, 6, btn_edit)
-
-                btn_delete = QPushButton("Delete")
-                btn_delete.clicked.connect(lambda _, bid=b_id: self.delete_book(bid))
-                self.book_table.setCellWidget(row_idx, 7, btn_delete)
-            else:
-                if is_avail:
-                    btn_borrow = QPushButton("Borrow")
-                    btn_borrow.clicked.connect(lambda _, bid=b_id: self.borrow_book(bid))
-                    self.book_table.setCellWidget(row_idx, 6, btn_borrow)
-                else:
-                    lbl = QLabel("Unavailable")
-                    lbl.setAlignment(Qt.AlignCenter)
-                    self.book_table.setCellWidget(row_idx, 6, lbl)
+    def fetch_recommendations(self):
+        """Runs on a worker thread; leaves out the member's current loans (get_user_loans)."""
+        return self.with_titles(self.recommender.recommend_for_member(self.user.id, self.RECOMMENDATIONS_SHOWN))
+
+    def load_similar_books(self, current, _previous=None):
+        book = self.book_model.row_data(current.row()) if current.isValid() else None
+        if book is None:
+            return
+        self.runner.submit(self.fetch_similar_books, book[0], key='similar_books',
+                           on_result=lambda titles: self.show_recommendations(self.lbl_similar_books, titles,
+                                                                              f"No other borrowing history for '{book[1]}' yet."),
+                           on_error=self.show_db_error)
+
+    def load_recommendations(self):
+        self.runner.submit(self.fetch_recommendations, key='recommendations',
+                           on_result=lambda titles: self.show_recommendations(self.lbl_for_you, titles,
+                                                                              "Borrow a few books to get recommendations."),
+                           on_error=self.show_db_error)
+
+    def show_recommendations(self, label, titles, empty_text):
+        if not self.recommender.built:
+            label.setText("<i>Building recommendations...</i>")
+        elif titles:
+            label.setText("<br>".join(f"• {html.escape(title)}" for title, _ in titles))
+        else:
+            label.setText(f"<i>{html.escape(empty_text)}</i>")
 
     def manage_authors(self):
-        dlg = AuthorManagementDialog(self.db, self)
+        dlg = AuthorManagementDialog(self.db, self.runner, self)
         dlg.exec_()
         self.load_books()
 
     def manage_book(self, book_data=None):
-        dlg = BookManagementDialog(self.db, book_data, self)
+        dlg = BookManagementDialog(self.db, self.runner, book_data, self)
         if dlg.exec_():
+            delta = dlg.delta
+            if delta and not delta['created']:
+                if not (delta['fields_changed'] or delta['authors_added'] or delta['authors_removed']):
+                    return  # nothing changed, nothing to redraw
+                if isinstance(self.db, CatalogCache):
+                    return  # the change notification patches the row in place
             self.load_books()
             self.load_dashboard_data()
 
+    def import_books(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Import Books", "",
+                                              "Book lists (*.csv *.jsonl *.ndjson);;All files (*)")
+        if not path:
+            return
+
+        def report_progress(report):
+            self.import_progress.emit(f"Importing... {report.rows_read:,} rows read, "
+                                      f"{report.imported:,} imported, {len(report.rejected):,} rejected")
+
+        self.btn_import_books.setEnabled(False)
+        importer = BulkImporter(self.db)
+        self.runner.submit(importer.run, path, progress=report_progress,
+                           on_result=lambda report: self.on_books_imported(path, report),
+                           on_error=self.on_import_error)
+
+    def on_books_imported(self, path, report):
+        self.btn_import_books.setEnabled(True)
+        self.statusBar().showMessage("Ready")
+        message = report.summary()
+        if report.rejected:
+            rejects_path = path + ".rejects.csv"
+            report.write_rejects(rejects_path)
+            message += f"\n\nRejected rows and reasons were saved to:\n{rejects_path}"
+        QMessageBox.information(self, "Import Finished", message)
+        self.load_books()
+        self.load_dashboard_data()
+
+    def on_import_error(self, message):
+        self.btn_import_books.setEnabled(True)
+        self.statusBar().showMessage("Ready")
+        QMessageBox.warning(self, "Import Failed", message)
+
     def delete_book(self, book_id):
         reply = QMessageBox.question(self, 'Confirm Deletion',
                                      "Are you sure you want to delete this book? This cannot be undone.",
                                      QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
 
         if reply == QMessageBox.Yes:
-            success, message = self.db.delete_book(book_id)
-            if success:
-                QMessageBox.information(self, "Success", message)
-                self.load_books()
-                self.load_dashboard_data()
-            else:
-                QMessageBox.warning(self, "Error", message)
+            self.runner.submit(self.db.delete_book, book_id,
+                               on_result=self.on_book_deleted, on_error=self.show_db_error)
+
+    def on_book_deleted(self, outcome):
+        success, message = outcome
+        if success:
+            QMessageBox.information(self, "Success", message)
+            self.load_books()
+            self.load_dashboard_data()
+        else:
+            QMessageBox.warning(self, "Error", message)
 
     # ---------------- TAB 3: BOOK CLUBS ----------------
     def setup_clubs_tab(self):
@@ -624,13 +1048,33 @@ class MainWindow(QMainWindow):
         controls.addWidget(btn_members)
         layout.addLayout(controls)
 
-        self.club_table = QTableWidget()
-        self.club_table.setColumnCount(5)
-        self.club_table.setHorizontalHeaderLabels(['ID', 'Club Name', 'Description', 'Creator', 'Action'])
+        self.club_model = RowTableModel(['ID', 'Club Name', 'Description', 'Creator'],
+                                        [('Action', lambda club: ("Join", True))])
+        self.club_table = QTableView()
+        self.club_table.setModel(self.club_model)
+        self.club_table.setSelectionBehavior(QTableView.SelectRows)
+        self.club_table.setMouseTracking(True)
+        self.attach_action(self.club_table, 4, lambda row: self.join_club(self.club_model.row_data(row)[0]))
         self.club_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         self.club_table.setMinimumHeight(400)
         layout.addWidget(self.club_table)
 
+        if self.club_matcher and isinstance(self.user, Member):
+            matches_group = QGroupBox("Clubs for You")
+            matches_layout = QVBoxLayout(matches_group)
+            self.club_match_model = RowTableModel(['Club', 'Match', 'Why'],
+                                                  [('Action', lambda club: ("Join", True))])
+            club_match_table = QTableView()
+            club_match_table.setModel(self.club_match_model)
+            club_match_table.setMouseTracking(True)
+            self.attach_action(club_match_table, 3,
+                               lambda row: self.join_club(self.club_match_model.row_data(row)[3]))
+            club_match_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+            matches_layout.addWidget(club_match_table)
+            self.lbl_club_matches = QLabel("")
+            matches_layout.addWidget(self.lbl_club_matches)
+            layout.addWidget(matches_group)
+
         btn_refresh = QPushButton("Refresh Clubs")
         btn_refresh.clicked.connect(self.load_clubs)
         layout.addWidget(btn_refresh)
@@ -639,46 +1083,69 @@ class MainWindow(QMainWindow):
         self.load_clubs()
 
     def load_clubs(self):
-        clubs = self.db.get_all_clubs()
-        self.club_table.setRowCount(0)
-
-        for row_idx, club in enumerate(clubs):
-            self.club_table.insertRow(row_idx)
-            for col_idx, data in enumerate(club):
-                self.club_table.setItem(row_idx, col_idx, QTableWidgetItem(str(data)))
-
-            c_id = club[0]
-            btn_join = QPushButton("Join")
-            btn_join.clicked.connect(lambda _, cid=c_id: self.join_club(cid))
-            self.club_table.setCellWidget(row_idx, 4, btn_join)
+        self.runner.submit(self.db.get_all_clubs, key='clubs',
+                           on_result=self.show_clubs, on_error=self.show_db_error)
+        if self.club_matcher and isinstance(self.user, Member):
+            self.load_club_matches()
+
+    def show_clubs(self, clubs):
+        self.club_model.set_rows(clubs)
+
+    # --- Club matching (clubmatching.py) ---
+    def fetch_club_matches(self):
+        """Runs on a worker thread: folds in new loans and memberships, then ranks the clubs."""
+        self.club_matcher.refresh()
+        return [(name, f"{match}%", reason, club_id)
+                for name, match, reason, club_id in self.club_matcher.recommend_clubs(self.user.id)]
+
+    def load_club_matches(self):
+        self.runner.submit(self.fetch_club_matches, key='club_matches',
+                           on_result=self.show_club_matches, on_error=self.show_db_error)
+
+    def show_club_matches(self, matches):
+        self.club_match_model.set_rows(matches)
+        self.lbl_club_matches.setText("" if matches else
+                                      "<i>No clubs match your reading yet; borrow a few books to be matched.</i>")
 
     def create_club(self):
         dlg = CreateClubDialog(self)
         if dlg.exec_():
             name, desc = dlg.get_data()
             if name:
-                success, msg = self.db.create_club(name, desc, self.user.id)
-                if success:
-                    QMessageBox.information(self, "Success", msg)
-                    self.load_clubs()
-                    self.load_dashboard_data()
-                else:
-                    QMessageBox.warning(self, "Error", msg)
+                self.runner.submit(self.db.create_club, name, desc, self.user.id,
+                                   on_result=self.on_club_created, on_error=self.show_db_error)
+
+    def on_club_created(self, outcome):
+        success, msg = outcome
+        if success:
+            QMessageBox.information(self, "Success", msg)
+            self.load_clubs()
+            self.load_dashboard_data()
+        else:
+            QMessageBox.warning(self, "Error", msg)
 
     def join_club(self, club_id):
-        success, msg = self.db.join_club(self.user.id, club_id)
+        self.runner.submit(self.db.join_club, self.user.id, club_id,
+                           on_result=self.on_club_joined, on_error=self.show_db_error)
+
+    def on_club_joined(self, outcome):
+        success, msg = outcome
         QMessageBox.information(self, "Club Membership", msg)
+        if success and self.club_matcher and isinstance(self.user, Member):
+            self.load_club_matches()  # the joined club drops out of the matches
 
     def view_club_members(self):
-        row = self.club_table.currentRow()
+        row = self.club_table.currentIndex().row()
         if row < 0:
             QMessageBox.warning(self, "Select Club", "Please select a club row first.")
             return
 
-        club_id = self.club_table.item(row, 0).text()
-        club_name = self.club_table.item(row, 1).text()
-        members = self.db.get_club_members(club_id)
+        club_id, club_name = self.club_model.row_data(row)[:2]
+        self.runner.submit(self.db.get_club_members, club_id, key='club_members',
+                           on_result=lambda members: self.show_club_members(club_name, members),
+                           on_error=self.show_db_error)
 
+    def show_club_members(self, club_name, members):
         msg_text = f"--- Members of {club_name} ---\n\n" + "\n".join(
             [f"• {m[0]} ({m[1]}) joined on {m[2]}" for m in members])
         if len(members) == 0: msg_text = f"--- Members of {club_name} ---\n\nNo members yet."
@@ -692,60 +1159,214 @@ class MainWindow(QMainWindow):
         btn_refresh.clicked.connect(self.load_loans)
         layout.addWidget(btn_refresh)
 
-        self.loan_table = QTableWidget()
-        self.loan_table.setColumnCount(5)
-        self.loan_table.setHorizontalHeaderLabels(['Loan ID', 'Book', 'Borrow Date', 'Due Date', 'Action'])
+        self.loan_model = RowTableModel(['Loan ID', 'Book', 'Borrow Date', 'Due Date'],
+                                        [('Action', lambda loan: ("Return", True))])
+        self.loan_table = QTableView()
+        self.loan_table.setModel(self.loan_model)
+        self.loan_table.setMouseTracking(True)
+        self.loan_table.setSelectionBehavior(QTableView.SelectRows)
+        self.loan_table.setSelectionMode(QTableView.ExtendedSelection)
+        self.attach_action(self.loan_table, 4, lambda row: self.return_loans([self.loan_model.row_data(row)[0]]))
         self.loan_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         self.loan_table.setMinimumHeight(400)
         layout.addWidget(self.loan_table)
 
+        return_layout = QHBoxLayout()
+        btn_return_selected = QPushButton("Return Selected")
+        btn_return_selected.clicked.connect(lambda: self.return_loans(
+            [self.loan_model.row_data(index.row())[0] for index in self.loan_table.selectionModel().selectedRows()]))
+        btn_return_all = QPushButton("Return All")
+        btn_return_all.clicked.connect(lambda: self.return_loans([loan[0] for loan in self.loan_model.rows]))
+        return_layout.addWidget(btn_return_selected)
+        return_layout.addWidget(btn_return_all)
+        layout.addLayout(return_layout)
+
         self.tab_loans.setLayout(layout)
         self.load_loans()
 
     def load_loans(self):
-        loans = self.db.get_user_loans(self.user.id)
-        self.loan_table.setRowCount(0)
-        for row_idx, loan in enumerate(loans):
-            self.loan_table.insertRow(row_idx)
-            for col_idx in range(4):
-                self.loan_table.setItem(row_idx, col_idx, QTableWidgetItem(str(loan[col_idx])))
-            l_id = loan[0]
-            btn_return = QPushButton("Return")
-            btn_return.clicked.connect(lambda _, lid=l_id: self.return_book(lid))
-            self.loan_table.setCellWidget(row_idx, 4, btn_return)
+        self.runner.submit(self.db.get_user_loans, self.user.id, key='loans',
+                           on_result=self.show_loans, on_error=self.show_db_error)
+
+    def show_loans(self, loans):
+        self.loan_model.set_rows(loans)
+
+    # ---------------- TAB 5: DIAGNOSTICS (Librarians Only) ----------------
+    def setup_diagnostics_tab(self):
+        layout = QVBoxLayout()
+
+        methods_group = QGroupBox("Database Calls")
+        methods_layout = QVBoxLayout()
+        self.metrics_model = RowTableModel(['Method', 'Calls', 'p50 ms', 'p95 ms', 'Max ms',
+                                            'Rows', 'KB Fetched', 'Errors', 'Slow'])
+        metrics_table = QTableView()
+        metrics_table.setModel(self.metrics_model)
+        metrics_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        methods_layout.addWidget(metrics_table)
+        self.lbl_prepared = QLabel()
+        methods_layout.addWidget(self.lbl_prepared)
+        methods_group.setLayout(methods_layout)
+        layout.addWidget(methods_group, 2)
+
+        slow_group = QGroupBox(f"Slow Queries (over {self.db.metrics.slow_query_ms} ms)")
+        slow_layout = QVBoxLayout()
+        self.slow_query_view = QTextEdit()
+        self.slow_query_view.setReadOnly(True)
+        slow_layout.addWidget(self.slow_query_view)
+        slow_group.setLayout(slow_layout)
+        layout.addWidget(slow_group, 1)
+
+        controls = QHBoxLayout()
+        btn_refresh = QPushButton("Refresh")
+        btn_refresh.clicked.connect(self.load_diagnostics)
+        btn_export = QPushButton("Export Prometheus Metrics...")
+        btn_export.clicked.connect(self.export_metrics)
+        btn_reset = QPushButton("Reset")
+        btn_reset.clicked.connect(self.reset_diagnostics)
+        controls.addWidget(btn_refresh)
+        controls.addWidget(btn_export)
+        controls.addWidget(btn_reset)
+        layout.addLayout(controls)
+
+        self.tab_diagnostics.setLayout(layout)
+
+        # Metrics live in memory, so refreshing is cheap; only do it while the tab is visible
+        self.diagnostics_timer = QTimer(self)
+        self.diagnostics_timer.timeout.connect(self.load_diagnostics)
+        self.diagnostics_timer.start(self.DIAGNOSTICS_REFRESH_MS)
+        self.tabs.currentChanged.connect(lambda _: self.load_diagnostics())
+
+    def load_diagnostics(self):
+        if self.tabs.currentWidget() is not self.tab_diagnostics:
+            return
+        self.metrics_model.set_rows([
+            (method, stats.calls, f"{stats.quantile(0.5) * 1000:.1f}", f"{stats.quantile(0.95) * 1000:.1f}",
+             f"{stats.max_seconds * 1000:.1f}", stats.rows, f"{stats.bytes / 1024:.1f}", stats.errors, stats.slow)
+            for method, stats in self.db.metrics.snapshot()
+        ])
+        prepared = self.db.prepared_statement_stats()
+        self.lbl_prepared.setText("Prepared statements: " + ", ".join(f"{v:,} {k}" for k, v in prepared.items()))
+
+        entries = []
+        for entry in self.db.metrics.slow_queries():
+            text = f"<b>{entry['at']} {entry['method']} — {entry['ms']} ms</b><pre>{html.escape(entry['statement'])}</pre>"
+            if entry['plan']:
+                text += f"<pre style='color:#778da9;'>{html.escape(entry['plan'])}</pre>"
+            entries.append(text)
+        self.slow_query_view.setHtml("".join(entries) or "<i>No slow queries recorded.</i>")
+
+    def export_metrics(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export Metrics", "smartlibrary_metrics.prom",
+                                              "Prometheus text (*.prom *.txt)")
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(self.db.metrics.prometheus_text())
+            self.statusBar().showMessage(f"Metrics written to {path}", 5000)
+
+    def reset_diagnostics(self):
+        self.db.metrics.reset()
+        self.load_diagnostics()
 
     # --- SHARED ACTIONS ---
-    def borrow_book(self, book_id):
-        success, message = self.db.borrow_book(self.user.id, book_id)
-        if success:
-            QMessageBox.information(self, "Success", message)
-            self.load_books()
-            self.load_dashboard_data()
-            if isinstance(self.user, Member): self.load_loans()
-        else:
-            QMessageBox.warning(self, "Error", message)
+    def cart_action(self, book):
+        if book[0] in self.cart:
+            return "Remove", True
+        return ("Add to Cart", True) if book[4] else ("Unavailable", False)
+
+    def toggle_cart(self, book):
+        if self.cart.pop(book[0], None) is None:
+            self.cart[book[0]] = book[1]
+        self.on_cart_changed()
+
+    def clear_cart(self):
+        self.cart.clear()
+        self.on_cart_changed()
+
+    def on_cart_changed(self):
+        self.update_cart_button()
+        self.book_model.refresh_actions()
+
+    def update_cart_button(self):
+        self.btn_checkout.setText(f"Borrow Cart ({len(self.cart)})")
+        self.btn_checkout.setEnabled(bool(self.cart))
+
+    def checkout_cart(self):
+        """Borrows every book in the cart in one transaction; the views refresh once afterwards."""
+        self.btn_checkout.setEnabled(False)
+        self.runner.submit(self.db.borrow_books, self.user.id, list(self.cart),
+                           on_result=self.on_borrowed, on_error=self.on_checkout_error)
+
+    def on_checkout_error(self, message):
+        self.update_cart_button()
+        self.show_db_error(message)
+
+    def on_borrowed(self, result):
+        self.show_batch_result(result, self.cart)
+        if result['ok']:
+            self.cart.clear()
+            self.refresh_after_loans_changed()
+        self.update_cart_button()
+
+    def return_loans(self, loan_ids):
+        if not loan_ids:
+            return
+        self.runner.submit(self.db.return_loans, loan_ids,
+                           on_result=self.on_returned, on_error=self.show_db_error)
+
+    def on_returned(self, result):
+        self.show_batch_result(result, {loan[0]: loan[1] for loan in self.loan_model.rows})
+        if result['ok']:
+            self.refresh_after_loans_changed()
+
+    def show_batch_result(self, result, titles):
+        """Summary of a borrow_books/return_loans result; on failure, lists each item's outcome."""
+        if result['ok']:
+            QMessageBox.information(self, "Success", result['message'])
+            return
+        lines = []
+        for item in result['items']:
+            item_id = item.get('book_id', item.get('loan_id'))
+            lines.append(f"• {titles.get(item_id, f'#{item_id}')}: {item['message']}")
+        QMessageBox.warning(self, "Error", result['message'] + "\n\n" + "\n".join(lines))
 
-    def return_book(self, loan_id):
-        success, message = self.db.return_book(loan_id)
-        if success:
-            QMessageBox.information(self, "Success", message)
-            if isinstance(self.user, Member): self.load_loans()
-            self.load_books()
-            self.load_dashboard_data()
-        else:
-            QMessageBox.warning(self, "Error", message)
+    def refresh_after_loans_changed(self):
+        self.load_books()
+        self.load_dashboard_data()
+        if isinstance(self.user, Member): self.load_loans()
+        if self.recommender: self.refresh_recommender()
 
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
     app.setStyleSheet(STYLE)  # Apply the custom style globally
 
-    db = DatabaseManager()
-    if db.conn:
-        login = LoginWindow(db)
+    db = open_database()
+    if db.pool:
+        if METRICS_PORT:
+            serve_metrics(METRICS_PORT)
+
+        # One worker per pooled connection so background calls never queue on the pool
+        runner = DbTaskRunner(max_threads=db.pool.maxconn)
+
+        if db.backend_name == 'postgres':
+            from notifications import NotificationListener
+
+            # Catalog reads are served from memory, kept current by table-change notifications
+            listener = NotificationListener()
+            cache = CatalogCache(db, listener)
+            listener.start()
+            app.aboutToQuit.connect(listener.stop)
+            runner.submit(cache.reload, on_error=lambda msg: print(f"Catalog cache load failed: {msg}"))
+        else:
+            # A single-desk SQLite file has no other writers to hear from; read it directly
+            cache = db
+        app.aboutToQuit.connect(db.close)
+
+        login = LoginWindow(cache, runner)
         login.show()
         sys.exit(app.exec_())
     else:
         QMessageBox.critical(None, "Database Error",
-                             "Failed to connect to the SmartLibrary Database. Please check 'databasemanager.py' credentials and ensure PostgreSQL is running.")
+                             "Failed to connect to the SmartLibrary Database. Please check 'databasemanager.py' credentials and ensure PostgreSQL is running "
+                             "(or set DB_BACKEND in 'backends.py').")
         sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,367 @@
+"""
+asyncdatabasemanager.py
+asyncio-native counterpart of DatabaseManager, backed by asyncpg and its connection pool.
+Also provides SyncDatabaseManager, a blocking shim that runs the async backend on a
+private event loop for synchronous scripts.
+
+Only the core catalog, loan, author, dashboard and club operations are mirrored, not all of
+backends.BACKEND_API: there is no search, paging, batch borrowing, streaming, cursor() or
+query cancellation. So it is not one of backends.BACKENDS, and the GUI does not run on it.
+"""
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+from backends import CHECKOUT_MESSAGES, POPULAR_BOOKS_LIMIT
+from databasemanager import (DB_HOST, DB_NAME, DB_USER, DB_PASS, DB_PORT, POOL_MIN_CONN, POOL_MAX_CONN,
+                             POPULARITY_WINDOWS, DatabaseManager, positional_params)
+
+
+def _rows(records):
+    """asyncpg returns Record objects; callers of DatabaseManager expect plain tuples."""
+    return [tuple(r) for r in records]
+
+
+class AsyncDatabaseManager:
+    """Same operations and return shapes as DatabaseManager, as coroutines.
+
+    Call `await connect()` (or use `async with AsyncDatabaseManager() as db`) before use.
+    """
+
+    def __init__(self, minconn=POOL_MIN_CONN, maxconn=POOL_MAX_CONN):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.pool = None
+
+    async def connect(self):
+        try:
+            self.pool = await asyncpg.create_pool(
+                host=DB_HOST,
+                database=DB_NAME,
+                user=DB_USER,
+                password=DB_PASS,
+                port=int(DB_PORT),
+                min_size=max(self.minconn, 1),
+                max_size=self.maxconn
+            )
+            print("Database connected successfully (asyncpg).")
+        except Exception as e:
+            print(
+                f"Error connecting to database. Please check credentials and ensure the DB 'smart_library' is running: {e}")
+            self.pool = None
+        return self.pool is not None
+
+    async def close(self):
+        if self.pool:
+            await self.pool.close()
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @asynccontextmanager
+    async def transaction(self):
+        """Acquires a pooled connection and runs the block in one transaction."""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                yield conn
+
+    async def authenticate_user(self, username, password):
+        """Checks credentials and returns user details."""
+        if not self.pool: return None
+        query = "SELECT id, username, full_name, email, role_id FROM Users WHERE username=$1 AND password_hash=$2"
+        row = await self.pool.fetchrow(query, username, password)
+        if row:
+            return {"id": row[0], "username": row[1], "full_name": row[2], "email": row[3], "role_id": row[4]}
+        return None
+
+    # --- BOOK CATALOG & LOANS ---
+
+    async def get_all_books(self, search_query=None):
+        """Retrieves all books with their authors, optionally filtering."""
+        base_query = """
+            SELECT b.id, b.title, b.genre, b.publication_year, b.available, 
+                   COALESCE(string_agg(a.name, ', '), 'N/A') as authors
+            FROM Books b 
+            LEFT JOIN BookAuthors ba ON b.id = ba.book_id
+            LEFT JOIN Authors a ON ba.author_id = a.id
+        """
+        params = []
+        # DatabaseManager's filter, so both backends match (and escape) search input alike
+        condition, filter_params = DatabaseManager._catalog_filter(search_query)
+        if condition:
+            base_query += f" WHERE {condition}"
+            params = filter_params
+
+        base_query += " GROUP BY b.id, b.title, b.genre, b.publication_year, b.available ORDER BY b.id"
+        return _rows(await self.pool.fetch(positional_params(base_query), *params))
+
+    async def checkout_book(self, user_id, book_id):
+        """Atomically lends a book to a member, in one round trip (see checkout_book() in migration 0000).
+
+        Returns {'status', 'message', 'loan_id', 'due_date'}, as DatabaseManager.checkout_book.
+        """
+        try:
+            status, loan_id, due_date = await self.pool.fetchrow(
+                "SELECT status, loan_id, loan_due_date FROM checkout_book($1, $2)", int(user_id), int(book_id))
+        except asyncpg.PostgresError as e:
+            return {'status': 'error', 'message': str(e).split('\n')[0], 'loan_id': None, 'due_date': None}
+        return {'status': status, 'message': CHECKOUT_MESSAGES[status], 'loan_id': loan_id, 'due_date': due_date}
+
+    async def borrow_book(self, user_id, book_id):
+        """Attempts to borrow a book. Returns (success, message); see checkout_book for the details."""
+        result = await self.checkout_book(user_id, book_id)
+        return result['status'] == 'ok', result['message']
+
+    async def return_book(self, loan_id):
+        """Returns a book by updating the return_date. Relies on SQL Trigger to update availability."""
+        try:
+            await self.pool.execute("UPDATE Loans SET return_date = CURRENT_DATE WHERE id = $1", loan_id)
+            return True, "Book returned successfully."
+        except Exception as e:
+            return False, str(e)
+
+    async def get_user_loans(self, user_id):
+        query = """
+            SELECT l.id, b.title, l.borrow_date, l.due_date, l.return_date, l.book_id
+            FROM Loans l JOIN Books b ON l.book_id = b.id
+            WHERE l.user_id = $1 AND l.return_date IS NULL
+        """
+        return _rows(await self.pool.fetch(query, user_id))
+
+    # --- LIBRARIAN: BOOK CRUD ---
+    @staticmethod
+    async def _link_authors(conn, book_id, author_ids):
+        """Links a book to several authors with one multi-row insert."""
+        if author_ids:
+            await conn.execute("INSERT INTO BookAuthors (book_id, author_id) SELECT $1, unnest($2::int[])",
+                               book_id, list(author_ids))
+
+    async def add_book(self, title, genre, year, author_ids):
+        """Adds a new book and links it to authors, in one transaction."""
+        author_ids = sorted({int(author_id) for author_id in author_ids})
+        try:
+            async with self.transaction() as conn:
+                book_query = "INSERT INTO Books (title, genre, publication_year) VALUES ($1, $2, $3) RETURNING id"
+                book_id = await conn.fetchval(book_query, title, genre, year)
+                await self._link_authors(conn, book_id, author_ids)
+
+            delta = {'book_id': book_id, 'created': True, 'fields_changed': True,
+                     'authors_added': author_ids, 'authors_removed': []}
+            return True, f"Book '{title}' added successfully with ID {book_id}.", delta
+        except Exception as e:
+            return False, str(e), None
+
+    async def update_book(self, book_id, title, genre, year, author_ids):
+        """Updates book details and author links, touching only what actually changed.
+
+        Runs in one transaction: the current row and links are read under a row lock, and
+        only the differing columns and the added/removed links are written.
+        """
+        desired = {int(author_id) for author_id in author_ids}
+        try:
+            async with self.transaction() as conn:
+                row = await conn.fetchrow("""
+                    SELECT b.title, b.genre, b.publication_year,
+                           ARRAY(SELECT author_id FROM BookAuthors WHERE book_id = b.id)
+                    FROM Books b WHERE b.id = $1 FOR UPDATE OF b
+                """, book_id)
+                if row is None:
+                    return False, f"Book ID {book_id} no longer exists.", None
+
+                current_title, current_genre, current_year, current_authors = row
+                fields_changed = (current_title, current_genre, current_year) != (title, genre, year)
+                if fields_changed:
+                    update_query = "UPDATE Books SET title=$1, genre=$2, publication_year=$3 WHERE id=$4"
+                    await conn.execute(update_query, title, genre, year, book_id)
+
+                current = set(current_authors)
+                removed = sorted(current - desired)
+                added = sorted(desired - current)
+                if removed:
+                    await conn.execute("DELETE FROM BookAuthors WHERE book_id=$1 AND author_id = ANY($2::int[])",
+                                       book_id, removed)
+                await self._link_authors(conn, book_id, added)
+
+            delta = {'book_id': book_id, 'created': False, 'fields_changed': fields_changed,
+                     'authors_added': added, 'authors_removed': removed}
+            if not (fields_changed or added or removed):
+                return True, f"No changes to save for Book ID {book_id}.", delta
+            return True, f"Book ID {book_id} updated successfully.", delta
+        except Exception as e:
+            return False, str(e), None
+
+    async def delete_book(self, book_id):
+        """Deletes a book. Cascades to BookAuthors. Will fail if active loans exist (RESTRICT)."""
+        try:
+            await self.pool.execute("DELETE FROM Books WHERE id=$1", int(book_id))
+            return True, f"Book ID {book_id} deleted successfully."
+        except asyncpg.ForeignKeyViolationError:
+            return False, "Cannot delete book. There are active loans associated with it."
+        except asyncpg.PostgresError as e:
+            return False, str(e)
+
+    # --- LIBRARIAN: AUTHOR CRUD ---
+    async def get_all_authors(self):
+        """Retrieves all authors."""
+        return _rows(await self.pool.fetch("SELECT id, name, bio FROM Authors ORDER BY name"))
+
+    async def add_author(self, name, bio):
+        """Adds a new author."""
+        try:
+            await self.pool.execute("INSERT INTO Authors (name, bio) VALUES ($1, $2)", name, bio)
+            return True, f"Author '{name}' added successfully."
+        except asyncpg.UniqueViolationError:
+            return False, f"Author name '{name}' already exists."
+        except asyncpg.PostgresError as e:
+            return False, str(e)
+
+    async def delete_author(self, author_id):
+        """Deletes an author. Cascades to BookAuthors links."""
+        try:
+            await self.pool.execute("DELETE FROM Authors WHERE id=$1", int(author_id))
+            return True, "Author deleted successfully."
+        except asyncpg.PostgresError as e:
+            return False, str(e)
+
+    # --- DASHBOARD & CLUB METHODS ---
+    async def get_library_stats(self):
+        """All dashboard counters in one round trip, from the trigger-maintained LibraryStats shards."""
+        row = await self.pool.fetchrow("""
+            SELECT s.total_books, s.available_books, s.total_books - s.available_books,
+                   s.members, s.clubs, s.active_loans,
+                   COALESCE((SELECT SUM(d.active_loans) FROM ActiveLoansByDueDate d
+                             WHERE d.due_date < CURRENT_DATE), 0)
+            FROM LibraryStats s
+        """)
+        keys = ('books', 'available', 'borrowed', 'members', 'clubs', 'active_loans', 'overdue')
+        return dict(zip(keys, (int(v) for v in row))) if row else dict.fromkeys(keys, 0)
+
+    async def get_dashboard_stats(self):
+        return await self.get_library_stats()
+
+    async def reconcile_library_stats(self):
+        """Rebuild the LibraryStats counters from the base tables. Returns True if they had drifted."""
+        async with self.transaction() as conn:
+            return await conn.fetchval("SELECT reconcile_library_stats()")
+
+    async def get_popular_books(self, window='all', limit=POPULAR_BOOKS_LIMIT):
+        """Top books as (title, genre, times borrowed) for a window of '7d', '30d' or 'all'."""
+        if window not in POPULARITY_WINDOWS:
+            raise ValueError(f"Unknown window '{window}'. Expected one of {sorted(POPULARITY_WINDOWS)}")
+        column = POPULARITY_WINDOWS[window]
+        if column is None:
+            query = "SELECT title, genre, times_borrowed FROM PopularBooksReport LIMIT $1"
+        else:
+            query = f"""
+                SELECT b.title, b.genre, p.{column}
+                FROM PopularBooksRecent p JOIN Books b ON b.id = p.book_id
+                WHERE p.{column} > 0
+                ORDER BY p.{column} DESC, p.book_id
+                LIMIT $1
+            """
+        try:
+            return _rows(await self.pool.fetch(query, limit))
+        except asyncpg.PostgresError:
+            return []
+
+    async def refresh_popular_books(self):
+        """Prunes expired daily counters and refreshes the 7/30-day popularity view.
+
+        Returns False without waiting if another session is already refreshing.
+        """
+        async with self.pool.acquire() as conn:  # the advisory lock belongs to this session
+            if not await conn.fetchval("SELECT pg_try_advisory_lock(hashtext('refresh_popular_books'))"):
+                return False
+            try:
+                await conn.execute("DELETE FROM BookLoanDaily WHERE loan_date <= CURRENT_DATE - 30")
+                await conn.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY PopularBooksRecent")
+            finally:
+                await conn.execute("SELECT pg_advisory_unlock(hashtext('refresh_popular_books'))")
+        return True
+
+    async def get_overdue_books(self):
+        try:
+            return _rows(await self.pool.fetch("SELECT * FROM OverdueBooksReport"))
+        except asyncpg.PostgresError:
+            return []
+
+    async def get_all_clubs(self):
+        query = """
+            SELECT c.id, c.name, c.description, u.full_name as creator 
+            FROM BookClubs c 
+            JOIN Users u ON c.created_by = u.id
+        """
+        return _rows(await self.pool.fetch(query))
+
+    async def join_club(self, user_id, club_id):
+        try:
+            query = "INSERT INTO ClubMemberships (club_id, user_id) VALUES ($1, $2)"
+            await self.pool.execute(query, int(club_id), int(user_id))
+            return True, "Joined club successfully!"
+        except asyncpg.PostgresError:
+            return False, "You are already a member of this club."
+
+    async def create_club(self, name, description, user_id):
+        try:
+            query = "INSERT INTO BookClubs (name, description, created_by) VALUES ($1, $2, $3)"
+            await self.pool.execute(query, name, description, int(user_id))
+            return True, "Club created successfully!"
+        except asyncpg.PostgresError as e:
+            return False, f"Error: {e}"
+
+    async def get_club_members(self, club_id):
+        query = """
+            SELECT u.full_name, u.email, cm.join_date 
+            FROM ClubMemberships cm 
+            JOIN Users u ON cm.user_id = u.id 
+            WHERE cm.club_id = $1
+        """
+        return _rows(await self.pool.fetch(query, int(club_id)))
+
+
+class SyncDatabaseManager:
+    """Blocking facade over AsyncDatabaseManager.
+
+    Runs an event loop on a daemon thread and forwards every coroutine method to it, with
+    DatabaseManager's arguments and return shapes for the methods AsyncDatabaseManager
+    has (see the module docstring). Safe to call from several threads at once.
+    """
+
+    def __init__(self, minconn=POOL_MIN_CONN, maxconn=POOL_MAX_CONN):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="db-event-loop", daemon=True)
+        self._thread.start()
+        self._async_db = AsyncDatabaseManager(minconn, maxconn)
+        self._run(self._async_db.connect())
+
+    @property
+    def pool(self):
+        return self._async_db.pool
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def __getattr__(self, name):
+        if name == '_async_db':  # not set yet, e.g. after a failed __init__
+            raise AttributeError(name)
+        attr = getattr(self._async_db, name)
+        if not asyncio.iscoroutinefunction(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            return self._run(attr(*args, **kwargs))
+
+        call.__name__ = name
+        call.__doc__ = attr.__doc__
+        return call
+
+    def close(self):
+        self._run(self._async_db.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
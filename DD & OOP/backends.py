@@ -0,0 +1,157 @@
+"""
+backends.py
+Storage backends behind the DatabaseManager interface.
+
+  'postgres'  DatabaseManager (databasemanager.py): PostgreSQL server, connection pool,
+              full-text search, LISTEN/NOTIFY for multi-desk cache invalidation.
+  'sqlite'    SQLiteDatabaseManager (sqlitedatabasemanager.py): embedded database file in
+              WAL mode for kiosks and single-desk branches. No server, opens instantly, and
+              an in-memory database makes a throwaway test fixture.
+
+Both expose BACKEND_API with the same arguments and return shapes, so the GUI and tools
+work against either. Pick one with DB_BACKEND or pass it to open_database().
+"""
+import threading
+
+# CONFIGURATION
+DB_BACKEND = "postgres"          # or "sqlite"
+SQLITE_PATH = "smart_library.db"  # database file for the sqlite backend (":memory:" for a scratch DB)
+
+BACKENDS = ('postgres', 'sqlite')
+
+# SHARED BY ALL BACKENDS
+# CATALOG PAGINATION
+CATALOG_PAGE_SIZE = 50
+# Sort option -> SQL sort key. Each is backed by an index on (key, id) in both schemas.
+CATALOG_SORT_KEYS = {
+    'title': "b.title",
+    'year': "COALESCE(b.publication_year, 0)",
+    'id': "b.id",
+}
+
+POPULAR_BOOKS_LIMIT = 10
+SEARCH_RESULT_LIMIT = 20
+STREAM_ITERSIZE = 2000  # rows fetched per round trip by the iter_* streaming methods
+
+# CHECKOUT
+# checkout_book() status -> message shown to the user
+CHECKOUT_MESSAGES = {
+    'ok': "Book borrowed successfully!",
+    'user_not_found': "Member account not found.",
+    'loan_limit': "Member cannot have more than 3 active loans.",
+    'book_not_found': "Book not found.",
+    'book_unavailable': "This book is already on loan.",
+    'book_busy': "This book is being checked out at another desk.",
+    'rolled_back': "Not borrowed: another book in the same checkout could not be.",
+}
+
+# BATCH RETURNS
+# return_loans() item status -> message shown to the user
+RETURN_MESSAGES = {
+    'ok': "Book returned successfully.",
+    'loan_not_found': "Loan not found.",
+    'already_returned': "This loan has already been returned.",
+    'rolled_back': "Not returned: another loan in the same batch could not be.",
+}
+
+# The methods every backend provides, with DatabaseManager's arguments and return shapes
+BACKEND_API = (
+    'cursor', 'transaction', 'close',
+    'authenticate_user',
+    'get_all_books', 'get_books_by_ids', 'search_books', 'get_books_page', 'estimate_book_count',
+    'checkout_book', 'borrow_book', 'borrow_books', 'return_book', 'return_loans', 'get_user_loans',
+    'add_book', 'update_book', 'delete_book',
+    'get_all_authors', 'add_author', 'delete_author',
+    'get_library_stats', 'get_dashboard_stats', 'reconcile_library_stats',
+    'get_popular_books', 'refresh_popular_books', 'get_overdue_books',
+    'get_all_clubs', 'join_club', 'create_club', 'get_club_members',
+    'stream_query', 'iter_all_books', 'iter_overdue_books', 'iter_club_members', 'iter_loan_history',
+    'prepared_statement_stats',
+)
+
+
+class QueryCancelled(Exception):
+    """Raised instead of running a call whose QueryCanceller was cancelled before it started."""
+
+
+class QueryCanceller:
+    """Cancels, from another thread, the query a backend call is running.
+
+    Pass one to a method that accepts `canceller=`; calling cancel() aborts the statement
+    (PostgreSQL raises psycopg2.extensions.QueryCanceledError, SQLite raises
+    sqlite3.OperationalError 'interrupted'). A canceller that was cancelled before its
+    call started refuses to run it with QueryCancelled. Several calls running at once may
+    share one canceller; cancel() aborts all of them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conns = set()
+        self.cancelled = False
+
+    def attach(self, conn):
+        """`conn` is anything with a cancel() method: a psycopg2 connection or an SQLite interrupter."""
+        with self._lock:
+            if self.cancelled:
+                raise QueryCancelled("canceling statement due to user request")
+            self._conns.add(conn)
+
+    def detach(self, conn):
+        with self._lock:
+            self._conns.discard(conn)
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            conns = list(self._conns)
+        for conn in conns:
+            try:
+                conn.cancel()
+            except Exception:
+                pass  # the query already finished or the connection is gone
+
+
+def like_pattern(text):
+    """Escapes LIKE wildcards in user input and wraps it for a substring match."""
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def batch_result(items, messages, verb, cleared=()):
+    """{'ok', 'message', 'items'} for an all-or-nothing batch of per-item results.
+
+    If any item failed, the batch was rolled back: items that had succeeded are marked
+    'rolled_back' and their `cleared` fields (e.g. the new loan id) reset to None.
+    """
+    failed = sum(item['status'] != 'ok' for item in items)
+    if not items:
+        return {'ok': True, 'message': f"No books {verb}.", 'items': items}
+    if not failed:
+        noun = "book" if len(items) == 1 else "books"
+        return {'ok': True, 'message': f"{len(items)} {noun} {verb} successfully.", 'items': items}
+    for item in items:
+        if item['status'] == 'ok':
+            item.update(dict.fromkeys(cleared), status='rolled_back', message=messages['rolled_back'])
+    return {'ok': False, 'message': f"Nothing was {verb}: {failed} of {len(items)} could not be.", 'items': items}
+
+
+def missing_methods(backend):
+    """Names from BACKEND_API that `backend` does not implement."""
+    return [name for name in BACKEND_API if not callable(getattr(backend, name, None))]
+
+
+def open_database(backend=None, **kwargs):
+    """Opens the configured backend. Check `.pool` afterwards: it is None if opening failed."""
+    backend = backend or DB_BACKEND
+    if backend == 'postgres':
+        from databasemanager import DatabaseManager
+        db = DatabaseManager(**kwargs)
+    elif backend == 'sqlite':
+        from sqlitedatabasemanager import SQLiteDatabaseManager
+        db = SQLiteDatabaseManager(kwargs.pop('path', SQLITE_PATH), **kwargs)
+    else:
+        raise ValueError(f"Unknown backend '{backend}'. Expected one of {BACKENDS}")
+    missing = missing_methods(db)
+    if missing:
+        raise TypeError(f"{type(db).__name__} is missing backend methods: {', '.join(missing)}")
+    return db
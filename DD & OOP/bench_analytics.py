@@ -0,0 +1,89 @@
+"""
+bench_analytics.py
+Times the LibraryAnalytics passes, which should stay under a second for 10M loans.
+
+    python bench_analytics.py --synthetic 10000000   # generated loans (no DB needed)
+    python bench_analytics.py                        # the configured database, load included
+"""
+import argparse
+import datetime
+import statistics
+import time
+
+import numpy as np
+
+from analytics import NO_DATE, LibraryAnalytics, LoanArrays, day_number
+
+GENRES = ["Unknown", "Fiction", "History", "Manga", "Romance", "Finance", "Self-Help", "Classic", "Science"]
+HISTORY_DAYS = 3 * 365
+LOAN_DAYS = 7
+
+
+def synthetic_loans(count, seed, today):
+    """`count` loans over the last HISTORY_DAYS, skewed toward popular books; about 2% still out."""
+    rng = np.random.default_rng(seed)
+    books, members = max(count // 20, 1), max(count // 100, 1)
+    borrow = np.sort(rng.integers(today - HISTORY_DAYS, today + 1, count)).astype(np.int32)
+    returned = borrow + rng.integers(1, 3 * LOAN_DAYS, count)
+    returned[rng.random(count) < 0.02] = NO_DATE
+    loans = LoanArrays(np.arange(1, count + 1, dtype=np.int32),
+                       (books * rng.random(count) ** 2.5).astype(np.int32) + 1,
+                       rng.integers(1, members + 1, count, dtype=np.int32),
+                       borrow, borrow + LOAN_DAYS, np.minimum(returned, today).astype(np.int32))
+    book_genre = rng.integers(1, len(GENRES), books + 1, dtype=np.int32)
+    return loans, book_genre
+
+
+def timed(fn, repeat):
+    """Wall times of `repeat` calls in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, metavar="N", help="benchmark on N generated loans")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    today = day_number(datetime.date.today())
+    db = None
+    if args.synthetic:
+        start = time.perf_counter()
+        loans, book_genre = synthetic_loans(args.synthetic, args.seed, today)
+        analytics = LibraryAnalytics()
+        analytics.load(loans, GENRES, book_genre)
+        print(f"Generated {len(loans):,} loans in {time.perf_counter() - start:.1f} s")
+    else:
+        from databasemanager import DatabaseManager
+        db = DatabaseManager(minconn=1, maxconn=1)
+        if not db.pool:
+            raise SystemExit("Database unavailable; use --synthetic N to benchmark the passes alone.")
+        analytics = LibraryAnalytics(db)
+        print(f"Loaded {analytics.refresh():.1f} s")
+        print(f"Incremental refresh {analytics.refresh() * 1000:.0f} ms")
+        print(f"{len(analytics.loans):,} loans")
+
+    cases = {
+        'circulation_by_genre': analytics.circulation_by_genre,
+        'circulation_by_month': analytics.circulation_by_month,
+        'circulation_by_genre_and_month': analytics.circulation_by_genre_and_month,
+        'average_loan_days': analytics.average_loan_days,
+        'overdue_by_cohort': lambda: analytics.overdue_by_cohort(today),
+        'turnover_by_title': lambda: analytics.turnover_by_title(today),
+        'summary (all of the above)': analytics.summary,
+    }
+    for name, fn in cases.items():
+        samples = timed(fn, args.repeat)
+        print(f"{name:<32} median {statistics.median(samples):9.1f} ms   max {max(samples):9.1f} ms")
+    if db:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+bench_checkout.py
+Contention benchmark for DatabaseManager.checkout_book. Many threads (desks) try to borrow a
+small set of books for a pool of members at the same time, then the results are checked:
+no book may be lent twice and no member may exceed the loan limit.
+
+    python bench_checkout.py --threads 16 --books 50 --members 200 --attempts 200
+
+Creates its own books and members (tagged with the run id) and removes them afterwards
+unless --keep is given.
+"""
+import argparse
+import collections
+import random
+import statistics
+import threading
+import time
+import uuid
+
+from databasemanager import DatabaseManager
+
+MAX_ACTIVE_LOANS = 3
+
+
+def create_fixtures(db, tag, books, members):
+    with db.transaction() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO Books (title, genre, publication_year, available)
+                SELECT %s || ' #' || n, 'Benchmark', 2024, TRUE FROM generate_series(1, %s) n
+                RETURNING id
+            """, (f"bench-checkout {tag}", books))
+            book_ids = [r[0] for r in cur.fetchall()]
+            cur.execute("""
+                INSERT INTO Users (username, password_hash, role_id, full_name)
+                SELECT %s || '_' || n, 'x', 2, 'Benchmark Member ' || n FROM generate_series(1, %s) n
+                RETURNING id
+            """, (f"bench_{tag}", members))
+            member_ids = [r[0] for r in cur.fetchall()]
+    return book_ids, member_ids
+
+
+def remove_fixtures(db, book_ids, member_ids):
+    with db.transaction() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM Loans WHERE book_id = ANY(%s) OR user_id = ANY(%s)", (book_ids, member_ids))
+            cur.execute("DELETE FROM Books WHERE id = ANY(%s)", (book_ids,))
+            cur.execute("DELETE FROM Users WHERE id = ANY(%s)", (member_ids,))
+
+
+def run_desk(db, seed, attempts, book_ids, member_ids, start_gate, results):
+    rng = random.Random(seed)
+    outcomes = []
+    start_gate.wait()
+    for _ in range(attempts):
+        user_id, book_id = rng.choice(member_ids), rng.choice(book_ids)
+        start = time.perf_counter()
+        result = db.checkout_book(user_id, book_id)
+        outcomes.append((result['status'], user_id, book_id, (time.perf_counter() - start) * 1000))
+    results.extend(outcomes)
+
+
+def verify(db, book_ids, member_ids, outcomes):
+    """Returns a list of problems; empty means no double-lends and no limit or counter violations."""
+    problems = []
+    lent = collections.Counter(book_id for status, _, book_id, _ in outcomes if status == 'ok')
+    borrowed = collections.Counter(user_id for status, user_id, _, _ in outcomes if status == 'ok')
+    problems += [f"book {b} reported lent {n} times" for b, n in lent.items() if n > 1]
+    problems += [f"member {u} reported {n} loans" for u, n in borrowed.items() if n > MAX_ACTIVE_LOANS]
+
+    with db.cursor() as cur:
+        cur.execute("""
+            SELECT book_id, COUNT(*) FROM Loans
+            WHERE book_id = ANY(%s) AND return_date IS NULL GROUP BY book_id HAVING COUNT(*) > 1
+        """, (book_ids,))
+        problems += [f"book {b} has {n} active loans" for b, n in cur.fetchall()]
+        cur.execute("""
+            SELECT u.id, u.active_loans, COUNT(l.id) FROM Users u
+            LEFT JOIN Loans l ON l.user_id = u.id AND l.return_date IS NULL
+            WHERE u.id = ANY(%s) GROUP BY u.id HAVING u.active_loans <> COUNT(l.id) OR COUNT(l.id) > %s
+        """, (member_ids, MAX_ACTIVE_LOANS))
+        problems += [f"member {u} counter {c} vs {n} active loans" for u, c, n in cur.fetchall()]
+        cur.execute("SELECT COUNT(*) FROM Books WHERE id = ANY(%s) AND NOT available", (book_ids,))
+        unavailable = cur.fetchone()[0]
+        if unavailable != len(lent):
+            problems.append(f"{unavailable} books unavailable but {len(lent)} were lent")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=16, help="concurrent desks")
+    parser.add_argument("--books", type=int, default=50)
+    parser.add_argument("--members", type=int, default=200)
+    parser.add_argument("--attempts", type=int, default=200, help="checkout attempts per thread")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="leave the benchmark books, members and loans in place")
+    args = parser.parse_args()
+
+    db = DatabaseManager(minconn=args.threads, maxconn=args.threads)
+    if not db.pool:
+        raise SystemExit(1)
+
+    tag = uuid.uuid4().hex[:8]
+    book_ids, member_ids = create_fixtures(db, tag, args.books, args.members)
+    try:
+        outcomes = []
+        gate = threading.Barrier(args.threads + 1)
+        desks = [threading.Thread(target=run_desk,
+                                  args=(db, args.seed + i, args.attempts, book_ids, member_ids, gate, outcomes))
+                 for i in range(args.threads)]
+        for desk in desks:
+            desk.start()
+        gate.wait()
+        start = time.perf_counter()
+        for desk in desks:
+            desk.join()
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(o[3] for o in outcomes)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"{len(outcomes):,} checkout attempts from {args.threads} threads in {elapsed:.2f} s "
+              f"({len(outcomes) / elapsed:,.0f} attempts/s)")
+        print(f"latency median {statistics.median(latencies):.2f} ms   p95 {p95:.2f} ms   max {latencies[-1]:.2f} ms")
+        for status, count in collections.Counter(o[0] for o in outcomes).most_common():
+            print(f"  {status:<18} {count:>8,}")
+
+        problems = verify(db, book_ids, member_ids, outcomes)
+        if problems:
+            print(f"FAILED: {len(problems)} problems")
+            for problem in problems[:20]:
+                print(f"  {problem}")
+        else:
+            print("OK: zero double-lends, loan limit and counters consistent")
+    finally:
+        if not args.keep:
+            remove_fixtures(db, book_ids, member_ids)
+        db.close()
+    if problems:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
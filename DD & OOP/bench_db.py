@@ -0,0 +1,242 @@
+"""
+bench_db.py
+Times every DatabaseManager method against the current database and writes p50/p95/p99
+latencies as JSON, so runs can be diffed between versions and scale tiers:
+
+    python datagen.py --tier medium
+    python bench_db.py --tier medium --output bench-medium.json
+    python bench_db.py --tier medium --baseline bench-medium.json   # compare with an earlier run
+
+Arguments (member, book, club ids and search terms) are sampled from the database with a fixed
+seed. Writes are benchmarked as self-cleaning pairs (add + delete, borrow + return), so the
+data set is left as it was apart from loan history.
+"""
+import argparse
+import datetime
+import json
+import platform
+import random
+import time
+
+from databasemanager import DatabaseManager
+
+BENCH_REPEAT = 30
+BENCH_METHOD_BUDGET = 20.0  # seconds per method before it stops early (after at least 3 calls)
+SAMPLE_SIZE = 200
+
+
+def percentile(sorted_samples, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(sorted_samples) - 1, int(round(pct / 100 * len(sorted_samples))) - 1))
+    return sorted_samples[index]
+
+
+class Fixtures:
+    """Ids and search terms drawn from the loaded data, plus rows the write cases create."""
+
+    def __init__(self, db, seed):
+        rng = random.Random(seed)
+        with db.cursor() as cur:
+            def sample(query):
+                cur.execute(query, (SAMPLE_SIZE,))
+                return [row[0] for row in cur.fetchall()]
+
+            self.members = sample("SELECT id FROM Users WHERE role_id = 2 ORDER BY random() LIMIT %s")
+            self.books = sample("SELECT id FROM Books ORDER BY random() LIMIT %s")
+            self.available_books = sample("SELECT id FROM Books WHERE available ORDER BY random() LIMIT %s")
+            self.clubs = sample("SELECT id FROM BookClubs ORDER BY random() LIMIT %s")
+            self.authors = sample("SELECT id FROM Authors ORDER BY random() LIMIT %s")
+            cur.execute("SELECT username, password_hash FROM Users WHERE role_id = 2 ORDER BY random() LIMIT 20")
+            self.logins = cur.fetchall()
+            titles = sample("SELECT title FROM Books ORDER BY random() LIMIT %s")
+        self.terms = [word[:rng.randint(3, max(3, len(word)))] for word in
+                      (rng.choice(title.split()) for title in titles if title.split())] or ["the"]
+        self.rng = rng
+        self.created_clubs = []
+        self.joined = []  # (user_id, club_id)
+
+    def pick(self, items):
+        return self.rng.choice(items)
+
+
+def cases(db, fx):
+    """name -> zero-argument callable performing one timed call (or a self-cleaning pair)."""
+
+    def borrow_and_return():
+        result = db.checkout_book(fx.pick(fx.members), fx.pick(fx.available_books))
+        if result['loan_id']:
+            db.return_book(result['loan_id'])
+
+    def borrow_and_return_batch():
+        result = db.borrow_books(fx.pick(fx.members), fx.rng.sample(fx.available_books, 3))
+        if result['ok']:
+            db.return_loans([item['loan_id'] for item in result['items']])
+
+    def add_and_delete_book():
+        ok, _, delta = db.add_book("Benchmark Book", "Benchmark", 2024, fx.authors[:2])
+        if ok:
+            db.delete_book(delta['book_id'])
+
+    def update_book():
+        book_id = fx.pick(fx.books)
+        with db.cursor() as cur:
+            cur.execute("SELECT title, genre, publication_year FROM Books WHERE id = %s", (book_id,))
+            title, genre, year = cur.fetchone()
+            cur.execute("SELECT author_id FROM BookAuthors WHERE book_id = %s", (book_id,))
+            author_ids = [row[0] for row in cur.fetchall()]
+        db.update_book(book_id, title, genre, year, author_ids)
+
+    def add_and_delete_author():
+        name = f"Benchmark Author {time.perf_counter_ns()}"
+        db.add_author(name, None)
+        with db.cursor() as cur:
+            cur.execute("SELECT id FROM Authors WHERE name = %s", (name,))
+            row = cur.fetchone()
+        if row:
+            db.delete_author(row[0])
+
+    def create_club():
+        name = f"Benchmark Club {time.perf_counter_ns()}"
+        db.create_club(name, "", fx.pick(fx.members))
+        fx.created_clubs.append(name)
+
+    def join_club():
+        user_id, club_id = fx.pick(fx.members), fx.pick(fx.clubs)
+        if db.join_club(user_id, club_id)[0]:
+            fx.joined.append((user_id, club_id))
+
+    def books_page():
+        rows, cursor = db.get_books_page(sort='title')
+        if cursor:
+            db.get_books_page(sort='title', after=cursor)
+
+    return {
+        'authenticate_user': lambda: db.authenticate_user(*fx.pick(fx.logins)),
+        'get_all_books': lambda: db.get_all_books(),
+        'get_all_books(search)': lambda: db.get_all_books(fx.pick(fx.terms)),
+        'get_books_by_ids': lambda: db.get_books_by_ids(fx.books[:50]),
+        'search_books': lambda: db.search_books(fx.pick(fx.terms)),
+        'get_books_page': books_page,
+        'get_books_page(search)': lambda: db.get_books_page(fx.pick(fx.terms), sort='title'),
+        'estimate_book_count': lambda: db.estimate_book_count(),
+        'estimate_book_count(search)': lambda: db.estimate_book_count(fx.pick(fx.terms)),
+        'checkout_book+return_book': borrow_and_return,
+        'borrow_books+return_loans': borrow_and_return_batch,
+        'get_user_loans': lambda: db.get_user_loans(fx.pick(fx.members)),
+        'add_book+delete_book': add_and_delete_book,
+        'update_book': update_book,
+        'get_all_authors': db.get_all_authors,
+        'add_author+delete_author': add_and_delete_author,
+        'get_library_stats': db.get_library_stats,
+        'get_popular_books(all)': lambda: db.get_popular_books('all'),
+        'get_popular_books(30d)': lambda: db.get_popular_books('30d'),
+        'get_popular_books(7d)': lambda: db.get_popular_books('7d'),
+        'refresh_popular_books': db.refresh_popular_books,
+        'get_overdue_books': db.get_overdue_books,
+        'get_all_clubs': db.get_all_clubs,
+        'join_club': join_club,
+        'create_club': create_club,
+        'get_club_members': lambda: db.get_club_members(fx.pick(fx.clubs)),
+        'reconcile_library_stats': db.reconcile_library_stats,
+    }
+
+
+def time_case(fn, repeat, budget):
+    samples, errors = [], 0
+    deadline = time.perf_counter() + budget
+    for n in range(repeat):
+        start = time.perf_counter()
+        try:
+            fn()
+        except Exception:
+            errors += 1
+        samples.append((time.perf_counter() - start) * 1000)
+        if n >= 2 and time.perf_counter() > deadline:
+            break
+    samples.sort()
+    return {
+        'calls': len(samples),
+        'errors': errors,
+        'mean_ms': round(sum(samples) / len(samples), 3),
+        'p50_ms': round(percentile(samples, 50), 3),
+        'p95_ms': round(percentile(samples, 95), 3),
+        'p99_ms': round(percentile(samples, 99), 3),
+    }
+
+
+def table_sizes(db):
+    with db.cursor() as cur:
+        cur.execute("""
+            SELECT (SELECT COUNT(*) FROM Books), (SELECT COUNT(*) FROM Authors),
+                   (SELECT COUNT(*) FROM Users WHERE role_id = 2), (SELECT COUNT(*) FROM BookClubs),
+                   (SELECT COUNT(*) FROM Loans), (SELECT COUNT(*) FROM Loans WHERE return_date IS NULL)
+        """)
+        return dict(zip(('books', 'authors', 'members', 'clubs', 'loans', 'active_loans'), cur.fetchone()))
+
+
+def print_comparison(results, baseline):
+    print(f"{'method':<30} {'p50 ms':>10} {'was':>10} {'p95 ms':>10} {'was':>10}")
+    for name, current in results['methods'].items():
+        before = baseline.get('methods', {}).get(name)
+        if before:
+            print(f"{name:<30} {current['p50_ms']:>10.2f} {before['p50_ms']:>10.2f} "
+                  f"{current['p95_ms']:>10.2f} {before['p95_ms']:>10.2f}")
+        else:
+            print(f"{name:<30} {current['p50_ms']:>10.2f} {'-':>10} {current['p95_ms']:>10.2f} {'-':>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tier", default="custom", help="label for the data set (see datagen.TIERS)")
+    parser.add_argument("--repeat", type=int, default=BENCH_REPEAT, help="calls per method")
+    parser.add_argument("--budget", type=float, default=BENCH_METHOD_BUDGET, help="seconds per method")
+    parser.add_argument("--only", nargs="+", metavar="METHOD", help="benchmark just these methods")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write JSON here (default: stdout)")
+    parser.add_argument("--baseline", help="earlier JSON output to compare against")
+    args = parser.parse_args()
+
+    db = DatabaseManager(minconn=1, maxconn=2)
+    if not db.pool:
+        raise SystemExit(1)
+    try:
+        fx = Fixtures(db, args.seed)
+        results = {
+            'tier': args.tier,
+            'started_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'repeat': args.repeat,
+            'seed': args.seed,
+            'table_sizes': table_sizes(db),
+            'methods': {},
+        }
+        for name, fn in cases(db, fx).items():
+            if args.only and name.split('(')[0] not in args.only and name not in args.only:
+                continue
+            results['methods'][name] = time_case(fn, args.repeat, args.budget)
+            m = results['methods'][name]
+            print(f"  {name:<30} p50 {m['p50_ms']:9.2f} ms  p95 {m['p95_ms']:9.2f} ms  "
+                  f"p99 {m['p99_ms']:9.2f} ms  ({m['calls']} calls, {m['errors']} errors)", flush=True)
+
+        with db.cursor() as cur:
+            for user_id, club_id in fx.joined:
+                cur.execute("DELETE FROM ClubMemberships WHERE user_id = %s AND club_id = %s", (user_id, club_id))
+            if fx.created_clubs:
+                cur.execute("DELETE FROM BookClubs WHERE name = ANY(%s)", (fx.created_clubs,))
+    finally:
+        db.close()
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+        print(f"Results written to {args.output}")
+    else:
+        print(output)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            print_comparison(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
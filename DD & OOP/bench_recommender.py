@@ -0,0 +1,108 @@
+"""
+bench_recommender.py
+Times BookRecommender: the build, folding in new loans, and query latency.
+
+    python bench_recommender.py --synthetic 5000000   # generated loans (no DB needed)
+    python bench_recommender.py                       # the configured database
+
+Peak memory is measured with tracemalloc, which sees NumPy's allocations.
+"""
+import argparse
+import random
+import statistics
+import time
+import tracemalloc
+
+import numpy as np
+
+from recommender import RECOMMEND_TOP_K, BookRecommender
+
+TASTES = 200  # generated members mostly borrow from one of this many groups of books
+
+
+def synthetic_loans(count, seed):
+    """(loan_ids, book_ids, user_ids): members favour one group of books, popular books more."""
+    rng = np.random.default_rng(seed)
+    books, members = max(count // 10, TASTES), max(count // 50, 1)
+    users = rng.integers(1, members + 1, count, dtype=np.int32)
+    taste = rng.integers(0, TASTES, members + 1)
+    per_group = books // TASTES
+    in_group = (per_group * rng.random(count) ** 2).astype(np.int32)
+    book_ids = (taste[users] * per_group + in_group + 1).astype(np.int32)
+    stray = rng.random(count) < 0.2
+    book_ids[stray] = rng.integers(1, books + 1, int(stray.sum()), dtype=np.int32)
+    return np.arange(1, count + 1, dtype=np.int32), book_ids, users
+
+
+def timed(fn, args_list):
+    """Per-call latencies in milliseconds."""
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(name, samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"{name:<28} median {statistics.median(samples):9.3f} ms   p95 {p95:9.3f} ms   "
+          f"max {samples[-1]:9.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, metavar="N", help="benchmark on N generated loans")
+    parser.add_argument("--new-loans", type=int, default=10_000, help="loans folded in after the build")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    db = None
+    if args.synthetic:
+        loans = synthetic_loans(args.synthetic + args.new_loans, args.seed)
+        built, new = [a[:args.synthetic] for a in loans], [a[args.synthetic:] for a in loans]
+        recommender = BookRecommender()
+        tracemalloc.start()
+        start = time.perf_counter()
+        recommender.build(*built)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"Built from {args.synthetic:,} loans in {elapsed:.2f} s, peak {peak / 2**20:,.0f} MB")
+
+        start = time.perf_counter()
+        for i in range(0, len(new[0]), 100):  # in batches, as notifications arrive
+            recommender.add_loans(*(a[i:i + 100] for a in new))
+        elapsed = time.perf_counter() - start
+        print(f"Folded in {len(new[0]):,} new loans in {elapsed * 1000:.0f} ms "
+              f"({len(new[0]) / elapsed:,.0f} loans/s)")
+        members = np.unique(loans[2]).tolist()
+    else:
+        from databasemanager import DatabaseManager
+        db = DatabaseManager(minconn=1, maxconn=1)
+        if not db.pool:
+            raise SystemExit("Database unavailable; use --synthetic N to benchmark on generated loans.")
+        recommender = BookRecommender(db)
+        print(f"Built from the database in {recommender.refresh():.2f} s")
+        print(f"Refreshed with new loans in {recommender.refresh() * 1000:.1f} ms")
+        members = [m for m in range(len(recommender.recent)) if recommender.recent[m, 0] >= 0]
+
+    matrix_bytes = sum(a.nbytes for a in (recommender.indptr, recommender.indices, recommender.counts))
+    print(f"Matrix: {len(recommender.indices):,} entries, {matrix_bytes / 2**20:,.1f} MB; "
+          f"members remembered: {recommender.recent.nbytes / 2**20:,.1f} MB")
+
+    books = np.flatnonzero(recommender.book_loans).tolist()
+    report("similar_books", timed(recommender.similar_books,
+                                  [(rng.choice(books), RECOMMEND_TOP_K) for _ in range(args.queries)]))
+    report("recommend_for_member", timed(recommender.recommend_for_member,
+                                         [(rng.choice(members), RECOMMEND_TOP_K, [] if db is None else None)
+                                          for _ in range(args.queries)]))
+    if db:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
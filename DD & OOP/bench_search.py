@@ -0,0 +1,104 @@
+"""
+bench_search.py
+Compares the in-memory CatalogSearchIndex against the database catalog search.
+
+    python bench_search.py                 # index vs. legacy ILIKE vs. get_all_books, live DB
+    python bench_search.py --synthetic 200000   # index only, on generated rows (no DB needed)
+"""
+import argparse
+import random
+import statistics
+import time
+
+from searchindex import CatalogSearchIndex, tokenize
+
+# The catalog search as it was before full-text/trigram indexing, kept for comparison
+LEGACY_ILIKE_QUERY = """
+    SELECT b.id, b.title, b.genre, b.publication_year, b.available,
+           COALESCE(string_agg(a.name, ', '), 'N/A') as authors
+    FROM Books b
+    LEFT JOIN BookAuthors ba ON b.id = ba.book_id
+    LEFT JOIN Authors a ON ba.author_id = a.id
+    WHERE b.title ILIKE %s OR b.genre ILIKE %s OR a.name ILIKE %s
+    GROUP BY b.id, b.title, b.genre, b.publication_year, b.available ORDER BY b.id
+"""
+
+WORDS = ("river night house garden shadow empire silent golden winter child storm letter "
+         "journey kingdom island secret memory daughter ocean fire stone city war song").split()
+GENRES = ["Fiction", "History", "Manga", "Romance", "Finance", "Self-Help", "Classic", "Science"]
+
+
+def synthetic_rows(count, seed):
+    rng = random.Random(seed)
+    authors = [f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()}son" for _ in range(max(count // 20, 1))]
+    return [(book_id, " ".join(rng.choice(WORDS).title() for _ in range(rng.randint(1, 5))),
+             rng.choice(GENRES), rng.randint(1900, 2024), rng.random() > 0.3, rng.choice(authors))
+            for book_id in range(1, count + 1)]
+
+
+def sample_queries(rows, count, seed):
+    """Prefixes of real title/author words, as a user would type them."""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        tokens = tokenize(rng.choice(rows)[1]) or ["a"]
+        word = rng.choice(tokens)
+        queries.append(word[:rng.randint(min(3, len(word)), len(word))])
+    return queries
+
+
+def timed(fn, queries):
+    """Per-query latencies in milliseconds."""
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(name, samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"{name:<28} median {statistics.median(samples):9.3f} ms   p95 {p95:9.3f} ms   "
+          f"max {samples[-1]:9.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, metavar="N", help="benchmark the index on N generated books")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    db = None
+    if args.synthetic:
+        rows = synthetic_rows(args.synthetic, args.seed)
+    else:
+        from databasemanager import DatabaseManager
+        db = DatabaseManager()
+        if not db.pool:
+            raise SystemExit("Database unavailable; use --synthetic N to benchmark the index alone.")
+        rows = db.get_all_books()
+
+    start = time.perf_counter()
+    index = CatalogSearchIndex(rows)
+    print(f"Indexed {len(index):,} books in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    queries = sample_queries(rows, args.queries, args.seed)
+    report("CatalogSearchIndex.search", timed(index.search, queries))
+
+    if db:
+        def legacy_ilike(query):
+            term = f"%{query}%"
+            with db.cursor() as cur:
+                cur.execute(LEGACY_ILIKE_QUERY, (term, term, term))
+                cur.fetchall()
+
+        report("legacy ILIKE query", timed(legacy_ilike, queries))
+        report("DatabaseManager.get_all_books", timed(db.get_all_books, queries))
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+"""
+bulkimport.py
+Bulk catalog import from CSV or JSONL.
+Streams the input, resolves (or creates) authors in batches and loads Books and BookAuthors
+with COPY, one transaction per chunk. Usable from the GUI or from the command line:
+
+    python bulkimport.py donated_books.csv --rejects rejected.csv
+
+Each record needs a title and may have genre, publication_year (or year) and authors.
+In CSV, authors are separated by ';'. In JSONL, authors may be a list or a string.
+"""
+import argparse
+import csv
+import datetime
+import io
+import json
+import os
+
+IMPORT_CHUNK_SIZE = 5000
+AUTHOR_SEPARATOR = ';'
+
+# Column limits from smart_library.sql
+MAX_TITLE = 200
+MAX_GENRE = 50
+MAX_AUTHOR_NAME = 100
+
+
+class ImportReport:
+    """Running totals for an import; also what progress callbacks receive."""
+
+    def __init__(self):
+        self.rows_read = 0
+        self.imported = 0
+        self.authors_created = 0
+        self.rejected = []  # (line number, reason, raw record)
+
+    def write_rejects(self, path):
+        """Writes rejected rows as CSV (line, reason, record) for the librarian to fix and retry."""
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['line', 'reason', 'record'])
+            for line_no, reason, record in self.rejected:
+                writer.writerow([line_no, reason, json.dumps(record, ensure_ascii=False, default=str)])
+
+    def summary(self):
+        return (f"{self.imported:,} books imported, {len(self.rejected):,} rejected, "
+                f"{self.authors_created:,} new authors ({self.rows_read:,} rows read).")
+
+
+def detect_format(path):
+    return 'jsonl' if os.path.splitext(path)[1].lower() in ('.jsonl', '.ndjson', '.json') else 'csv'
+
+
+def read_records(path, fmt=None):
+    """Yields (line number, record dict) without loading the file into memory."""
+    fmt = fmt or detect_format(path)
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if fmt == 'csv':
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+        else:
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    yield line_no, {'_error': f"Invalid JSON: {e}", '_raw': line.strip()}
+                    continue
+                yield line_no, record if isinstance(record, dict) else {'_error': "Not a JSON object"}
+
+
+def clean_record(record):
+    """Normalises one input record to (title, genre, year, [author names]); raises ValueError."""
+    if '_error' in record:
+        raise ValueError(record['_error'])
+    record = {str(k).strip().lower(): v for k, v in record.items() if k is not None}
+
+    title = str(record.get('title') or '').strip()
+    if not title:
+        raise ValueError("Missing title")
+    if len(title) > MAX_TITLE:
+        raise ValueError(f"Title longer than {MAX_TITLE} characters")
+
+    genre = str(record.get('genre') or '').strip() or None
+    if genre and len(genre) > MAX_GENRE:
+        raise ValueError(f"Genre longer than {MAX_GENRE} characters")
+
+    year = record.get('publication_year', record.get('year'))
+    if year in (None, ''):
+        year = None
+    else:
+        try:
+            year = int(str(year).strip())
+        except ValueError:
+            raise ValueError(f"Invalid publication year '{year}'")
+        if not 0 < year <= datetime.date.today().year + 1:
+            raise ValueError(f"Publication year {year} out of range")
+
+    authors = record.get('authors') or []
+    if isinstance(authors, str):
+        authors = authors.split(AUTHOR_SEPARATOR)
+    names = []
+    for name in authors:
+        name = str(name).strip()
+        if not name:
+            continue
+        if len(name) > MAX_AUTHOR_NAME:
+            raise ValueError(f"Author name longer than {MAX_AUTHOR_NAME} characters")
+        if name not in names:
+            names.append(name)
+    return title, genre, year, names
+
+
+def copy_rows(cur, table_columns, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {table_columns} FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+class BulkImporter:
+    """Loads books in chunks; each chunk is one transaction, so a failure loses only that chunk."""
+
+    def __init__(self, db, chunk_size=IMPORT_CHUNK_SIZE):
+        self.db = db
+        self.chunk_size = chunk_size
+        self._author_ids = {}  # name -> id, shared across chunks
+
+    def run(self, path, fmt=None, progress=None):
+        """Imports `path` and returns an ImportReport. progress(report) is called after each chunk."""
+        report = ImportReport()
+        chunk = []
+        for line_no, record in read_records(path, fmt):
+            report.rows_read += 1
+            try:
+                chunk.append((line_no, record, clean_record(record)))
+            except ValueError as e:
+                report.rejected.append((line_no, str(e), record))
+            if len(chunk) >= self.chunk_size:
+                self._load_chunk(chunk, report)
+                chunk = []
+                if progress:
+                    progress(report)
+        if chunk:
+            self._load_chunk(chunk, report)
+        if progress:
+            progress(report)
+        return report
+
+    def _resolve_authors(self, cur, names):
+        """Maps author names to ids, creating the missing ones with one multi-row insert."""
+        missing = [name for name in names if name not in self._author_ids]
+        if not missing:
+            return 0
+        cur.execute("SELECT id, name FROM Authors WHERE name = ANY(%s)", (missing,))
+        self._author_ids.update({name: author_id for author_id, name in cur.fetchall()})
+
+        missing = [name for name in missing if name not in self._author_ids]
+        if not missing:
+            return 0
+        cur.execute("""
+            INSERT INTO Authors (name) SELECT unnest(%s::text[])
+            ON CONFLICT (name) DO NOTHING RETURNING id, name
+        """, (missing,))
+        created = cur.fetchall()
+        self._author_ids.update({name: author_id for author_id, name in created})
+
+        # Anything still missing was inserted by another session in the meantime
+        missing = [name for name in missing if name not in self._author_ids]
+        if missing:
+            cur.execute("SELECT id, name FROM Authors WHERE name = ANY(%s)", (missing,))
+            self._author_ids.update({name: author_id for author_id, name in cur.fetchall()})
+        return len(created)
+
+    def _load_chunk(self, chunk, report):
+        names = list(dict.fromkeys(name for _, _, (_, _, _, authors) in chunk for name in authors))
+        known_authors = dict(self._author_ids)
+        try:
+            with self.db.transaction() as conn:
+                with conn.cursor() as cur:
+                    created = self._resolve_authors(cur, names)
+
+                    # Reserve ids up front so BookAuthors can be built without reading Books back
+                    cur.execute("SELECT nextval(pg_get_serial_sequence('books', 'id')) "
+                                "FROM generate_series(1, %s)", (len(chunk),))
+                    book_ids = [row[0] for row in cur.fetchall()]
+
+                    books, links = [], []
+                    for book_id, (_, _, (title, genre, year, authors)) in zip(book_ids, chunk):
+                        books.append((book_id, title, genre, year))
+                        links.extend((book_id, self._author_ids[name]) for name in authors)
+
+                    copy_rows(cur, "Books (id, title, genre, publication_year)", books)
+                    copy_rows(cur, "BookAuthors (book_id, author_id)", links)
+        except Exception as e:
+            # Rolled back: forget author ids learned inside the failed transaction
+            self._author_ids = known_authors
+            reason = f"Chunk failed: {str(e).splitlines()[0]}"
+            report.rejected.extend((line_no, reason, record) for line_no, record, _ in chunk)
+            return
+
+        report.imported += len(chunk)
+        report.authors_created += created
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-import books into SmartLibrary from CSV or JSONL.")
+    parser.add_argument("path", help="input file (.csv, or .jsonl / .ndjson)")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="override detection by file extension")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE, help="rows per transaction")
+    parser.add_argument("--rejects", help="write rejected rows to this CSV file")
+    args = parser.parse_args()
+
+    from databasemanager import DatabaseManager
+    db = DatabaseManager()
+    if not db.pool:
+        raise SystemExit(1)
+
+    def show_progress(report):
+        print(f"  {report.rows_read:,} rows read, {report.imported:,} imported, "
+              f"{len(report.rejected):,} rejected", flush=True)
+
+    report = BulkImporter(db, args.chunk_size).run(args.path, args.format, progress=show_progress)
+    print(report.summary())
+    if report.rejected and args.rejects:
+        report.write_rejects(args.rejects)
+        print(f"Rejected rows written to {args.rejects}")
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
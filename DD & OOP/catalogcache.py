@@ -0,0 +1,184 @@
+"""
+catalogcache.py
+In-process catalog cache in front of DatabaseManager.
+Serves catalog reads from memory and stays current by patching only the books named in
+'catalog_changes' notifications (sent by triggers on Books, BookAuthors, Authors and Loans).
+"""
+import bisect
+import itertools
+import threading
+
+from backends import CATALOG_PAGE_SIZE, CATALOG_SORT_KEYS
+from searchindex import CatalogSearchIndex, tokenize
+
+CATALOG_CHANNEL = 'catalog_changes'
+
+# Python equivalents of backends.CATALOG_SORT_KEYS for rows shaped like get_all_books
+SORT_KEYS = {
+    'title': lambda row: row[1],
+    'year': lambda row: row[3] or 0,
+    'id': lambda row: row[0],
+}
+
+
+class CatalogCache:
+    """Serves get_all_books / get_books_page / get_book from memory.
+
+    Every other attribute is forwarded to the wrapped DatabaseManager, so a CatalogCache
+    can be handed to code that expects a DatabaseManager. Writes go straight to the
+    database; the resulting notifications then patch the cache. Until the first
+    reload() completes, reads are passed through to the database.
+
+    Books named in notifications that arrive before or during a reload are re-read once it
+    has swapped in its copy, which may predate them; a reload that started before another
+    one finished never replaces the newer copy.
+    """
+
+    def __init__(self, db, listener):
+        self.db = db
+        self._lock = threading.RLock()
+        self._books = {}   # id -> row
+        self._index = CatalogSearchIndex()
+        self._orders = {}  # sort name -> sorted [(sort key, id)], rebuilt lazily after changes
+        self._change_listeners = []
+        self._loaded = False
+        self._reload_seq = 0     # reloads started
+        self._loaded_seq = 0     # the reload whose copy is in use
+        self._reloading = 0      # reloads in progress
+        self._stale = set()      # ids changed before or during a reload, re-read after it
+        listener.subscribe(CATALOG_CHANNEL, self._on_notifications)
+        listener.on_reconnect(self.reload)
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+    def add_change_listener(self, callback):
+        """callback(book_ids) runs after entries are patched; book_ids is None after a full reload.
+
+        Called on the notification thread.
+        """
+        self._change_listeners.append(callback)
+
+    def reload(self):
+        """Replaces the whole cache with a fresh copy of the catalog."""
+        with self._lock:
+            self._reload_seq += 1
+            seq = self._reload_seq
+            self._reloading += 1
+        rows = None
+        try:
+            rows = self.db.get_all_books()
+        finally:
+            with self._lock:
+                self._reloading -= 1
+                swapped = rows is not None and seq > self._loaded_seq
+                if swapped:
+                    self._books = {row[0]: row for row in rows}
+                    self._index = CatalogSearchIndex(rows)
+                    self._orders = {}
+                    self._loaded = True
+                    self._loaded_seq = seq
+                stale = set()
+                if rows is not None and self._loaded and not self._reloading:
+                    stale, self._stale = self._stale, set()
+        if swapped:
+            self._notify_changed(None)
+        if stale:
+            self.refresh_books(stale)
+
+    def _on_notifications(self, payloads):
+        book_ids = set()
+        for payload in payloads:
+            ids = payload.get('ids') if isinstance(payload, dict) else None
+            if ids is None:
+                # Too many rows changed to list them in one notification
+                self.reload()
+                return
+            book_ids.update(ids)
+        if book_ids:
+            self.refresh_books(book_ids)
+
+    def refresh_books(self, book_ids):
+        """Re-reads just these books in one query; ids that no longer exist are dropped."""
+        book_ids = set(book_ids)
+        with self._lock:
+            seq = self._reload_seq
+            if not self._loaded or self._reloading:
+                self._stale |= book_ids  # the reload's copy may predate these changes
+            if not self._loaded:
+                return
+        rows = self.db.get_books_by_ids(sorted(book_ids))
+        with self._lock:
+            if self._reloading:
+                self._stale |= book_ids
+            if self._reload_seq != seq:
+                return  # a reload started after these rows were read; its copy is newer
+            for book_id in book_ids:
+                self._books.pop(book_id, None)
+                self._index.remove(book_id)
+            for row in rows:
+                self._books[row[0]] = row
+                self._index.add(row)
+            self._orders = {}
+        self._notify_changed(book_ids)
+
+    def _notify_changed(self, book_ids):
+        for callback in list(self._change_listeners):
+            try:
+                callback(book_ids)
+            except Exception as e:
+                print(f"Catalog change listener failed: {e}")
+
+    # --- CACHED READS (same signatures as DatabaseManager) ---
+
+    def search_ids(self, search_query):
+        """Ids of cached books matching the query as DatabaseManager.search_books filters, ascending."""
+        with self._lock:
+            return self._index.search(search_query)
+
+    def get_book(self, book_id):
+        with self._lock:
+            return self._books.get(book_id)
+
+    def get_all_books(self, search_query=None):
+        if not self._loaded:
+            return self.db.get_all_books(search_query)
+        with self._lock:
+            return [self._books[book_id] for book_id in self._index.search(search_query or "")]
+
+    def _order(self, sort):
+        # Caller holds the lock
+        if sort not in self._orders:
+            key = SORT_KEYS[sort]
+            self._orders[sort] = sorted((key(row), row[0]) for row in self._books.values())
+        return self._orders[sort]
+
+    def get_books_page(self, search_query=None, sort='title', page_size=CATALOG_PAGE_SIZE, after=None,
+                       canceller=None):
+        """In-memory keyset pagination; cursors are (sort key, id) like DatabaseManager's."""
+        if not self._loaded:
+            return self.db.get_books_page(search_query, sort, page_size, after, canceller)
+        if sort not in CATALOG_SORT_KEYS:
+            raise ValueError(f"Unknown sort '{sort}'. Expected one of {sorted(CATALOG_SORT_KEYS)}")
+        has_filter = bool(tokenize(search_query or ""))
+
+        page, last_cursor = [], None
+        with self._lock:
+            order = self._order(sort)
+            matches = set(self._index.search(search_query)) if has_filter else None
+            start = bisect.bisect_right(order, tuple(after)) if after is not None else 0
+            for entry in itertools.islice(order, start, None):
+                if matches is not None and entry[1] not in matches:
+                    continue
+                row = self._books[entry[1]]
+                if len(page) == page_size:
+                    # Another match exists, so hand out a cursor for the next page
+                    return page, last_cursor
+                page.append(row)
+                last_cursor = entry
+        return page, None
+
+    def estimate_book_count(self, search_query=None, canceller=None):
+        if not self._loaded:
+            return self.db.estimate_book_count(search_query, canceller)
+        return len(self.search_ids(search_query or ""))
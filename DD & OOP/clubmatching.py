@@ -0,0 +1,350 @@
+"""
+clubmatching.py
+Ranks book clubs for a member by how much their reading overlaps with what the club's
+members read (ClubMemberships joined to Loans).
+
+Every club has a compact reading profile, precomputed from its members' combined loans:
+
+    genres    one weight per genre (unit length)
+    authors   its CLUB_TOP_AUTHORS most read authors with their weights (unit length)
+
+A member's own loans give the same two vectors, and a club's match is the cosine
+similarity of each, GENRE_WEIGHT and AUTHOR_WEIGHT apart. Scoring every club is one matrix
+product and one lookup over CLUB_TOP_AUTHORS columns, well under a millisecond for
+thousands of clubs; reading the member's profile is two indexed queries
+(idx_loans_user_book, migration 0007).
+
+The profiles are kept as raw counts and refreshed incrementally from two watermarks, the
+highest Loans id and the highest ClubMemberships id already counted: a refresh adds new
+loans of existing members and the whole history of new members, each pair counted once.
+Ids within RESCAN_IDS of a watermark that were not committed yet when it was read (serial
+ids are handed out at INSERT) are remembered and counted once they appear.
+Members leaving, books changing genre and authors being relinked are only picked up by a
+full refresh.
+
+    python clubmatching.py --member 7
+
+Needs numpy (pip install numpy).
+"""
+import argparse
+import contextlib
+import sys
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from analytics import RESCAN_IDS
+from backends import BACKENDS, DB_BACKEND, open_database
+from recommender import merge_pairs, pair_rows, sum_pairs
+
+CLUB_TOP_AUTHORS = 32    # authors kept in each club's profile
+CLUB_MATCHES = 5
+GENRE_WEIGHT = 0.5
+AUTHOR_WEIGHT = 0.5
+UNKNOWN_GENRE = "Unknown"
+
+# Counts of (club, genre) and (club, author) over the loans of the club's members, for
+# the memberships and loans matching the given conditions on cm.id and l.id
+CLUB_GENRE_QUERY = """
+    SELECT cm.club_id, COALESCE(b.genre, '{unknown}'), COUNT(*)
+    FROM ClubMemberships cm
+    JOIN Loans l ON l.user_id = cm.user_id
+    JOIN Books b ON b.id = l.book_id
+    WHERE {memberships} AND {loans}
+    GROUP BY cm.club_id, COALESCE(b.genre, '{unknown}')
+"""
+CLUB_AUTHOR_QUERY = """
+    SELECT cm.club_id, ba.author_id, COUNT(*)
+    FROM ClubMemberships cm
+    JOIN Loans l ON l.user_id = cm.user_id
+    JOIN BookAuthors ba ON ba.book_id = l.book_id
+    WHERE {memberships} AND {loans}
+    GROUP BY cm.club_id, ba.author_id
+"""
+MEMBER_GENRE_QUERY = """
+    SELECT COALESCE(b.genre, '{unknown}'), COUNT(*)
+    FROM Loans l JOIN Books b ON b.id = l.book_id
+    WHERE l.user_id = {user_id}
+    GROUP BY COALESCE(b.genre, '{unknown}')
+"""
+MEMBER_AUTHOR_QUERY = """
+    SELECT ba.author_id, COUNT(*)
+    FROM Loans l JOIN BookAuthors ba ON ba.book_id = l.book_id
+    WHERE l.user_id = {user_id}
+    GROUP BY ba.author_id
+"""
+
+
+def id_list(ids):
+    return ", ".join(str(int(i)) for i in ids)
+
+
+def counted_condition(column, upto, waiting):
+    """SQL for the ids up to `upto` except those `waiting` to be committed."""
+    condition = f"{column} <= {int(upto)}"
+    return f"{condition} AND {column} NOT IN ({id_list(waiting)})" if waiting else condition
+
+
+def new_condition(column, after, upto, missing, waiting):
+    """SQL for the ids in (after, upto] or `missing` (waited for until now), except those
+    still `waiting`."""
+    condition = f"{column} > {int(after)} AND {column} <= {int(upto)}"
+    if missing:
+        condition = f"({condition} OR {column} IN ({id_list(missing)}))"
+    return f"{condition} AND {column} NOT IN ({id_list(waiting)})" if waiting else condition
+
+
+def unit_rows(matrix):
+    """Each row scaled to unit length (all-zero rows stay zero)."""
+    norms = np.sqrt((matrix.astype(np.float64) ** 2).sum(axis=1, keepdims=True))
+    return (matrix / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+class ClubMatcher:
+    """Per-club genre/author profiles and the club ranking for one member.
+
+    refresh() and the queries may run on different threads; queries only wait while a
+    refresh swaps in its results.
+    """
+
+    def __init__(self, db=None, top_authors=CLUB_TOP_AUTHORS):
+        self.db = db
+        self.top_authors = top_authors
+        self.genres = {}                      # genre name -> column
+        self.club_ids = np.empty(0, dtype=np.int32)   # row -> club id
+        self.club_names = []                  # row -> name
+        self.active = np.empty(0, dtype=bool)  # row -> club still exists
+        self.genre_counts = np.zeros((0, 0), dtype=np.int64)
+        self.author_keys = np.empty(0, dtype=np.int64)   # sorted pair_rows(row, author)
+        self.author_counts = np.empty(0, dtype=np.int32)
+        # The compact profiles the queries read
+        self.genre_profile = np.zeros((0, 0), dtype=np.float32)
+        self.author_ids = np.full((0, top_authors), -1, dtype=np.int32)
+        self.author_weights = np.zeros((0, top_authors), dtype=np.float32)
+        self.last_loan_id = 0
+        self.last_membership_id = 0
+        # Ids at or below the watermarks that were not committed yet when they were read
+        self.waiting_loan_ids = []
+        self.waiting_membership_ids = []
+        self.built = False
+        self._rows = {}                       # club id -> row
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    # ---------------- Refreshing ----------------
+    def _scalar(self, query):
+        return next(iter(self.db.stream_query(query)))[0]
+
+    def _waiting(self, table, after, upto, missing):
+        """Ids within RESCAN_IDS of `upto` that are due to be counted (above `after`, or
+        `missing` at an earlier refresh) but not committed yet."""
+        low = max(upto - RESCAN_IDS, 0)
+        present = {row[0] for row in self.db.stream_query(f"SELECT id FROM {table} WHERE id > {low} AND id <= {upto}")}
+        due = set(range(max(after, low) + 1, upto + 1)) | {i for i in missing if i > low}
+        return sorted(due - present)
+
+    def _count(self, memberships, loans, genres, rows, genre_cells, author_cells):
+        """Reads the counts for the memberships and loans matching the `memberships` and
+        `loans` conditions, numbering new genres and clubs in `genres` and `rows`."""
+        conditions = dict(memberships=memberships, loans=loans)
+        for club_id, genre, count in self.db.stream_query(CLUB_GENRE_QUERY.format(unknown=UNKNOWN_GENRE,
+                                                                                  **conditions)):
+            genre_cells.append((rows.setdefault(club_id, len(rows)), genres.setdefault(genre, len(genres)), count))
+        for club_id, author_id, count in self.db.stream_query(CLUB_AUTHOR_QUERY.format(**conditions)):
+            author_cells.append((rows.setdefault(club_id, len(rows)), author_id, count))
+
+    def refresh(self, full=False):
+        """Counts everything the first time (or if `full`), afterwards only new memberships and
+        loans. Returns the seconds taken."""
+        start = time.perf_counter()
+        with self._refresh_lock:
+            loan_upto = self._scalar("SELECT COALESCE(MAX(id), 0) FROM Loans")
+            membership_upto = self._scalar("SELECT COALESCE(MAX(id), 0) FROM ClubMemberships")
+            clubs = list(self.db.stream_query("SELECT id, name FROM BookClubs"))
+            rebuild = full or not self.built
+            if rebuild:
+                genres, club_rows = {}, {}
+                genre_counts = np.zeros((0, 0), dtype=np.int64)
+                author_keys, author_counts = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
+                loans_after = memberships_after = 0
+                loans_missing, memberships_missing = [], []
+            else:
+                genres, club_rows = dict(self.genres), dict(self._rows)
+                genre_counts, author_keys, author_counts = self.genre_counts, self.author_keys, self.author_counts
+                loans_after, memberships_after = self.last_loan_id, self.last_membership_id
+                loans_missing, memberships_missing = self.waiting_loan_ids, self.waiting_membership_ids
+            loans_waiting = self._waiting('Loans', loans_after, loan_upto, loans_missing)
+            memberships_waiting = self._waiting('ClubMemberships', memberships_after, membership_upto,
+                                                memberships_missing)
+
+            genre_cells, author_cells = [], []
+            # New members bring their whole history; existing members add their new loans
+            if membership_upto - memberships_after + len(memberships_missing) > len(memberships_waiting):
+                self._count(new_condition('cm.id', memberships_after, membership_upto, memberships_missing,
+                                          memberships_waiting),
+                            counted_condition('l.id', loan_upto, loans_waiting),
+                            genres, club_rows, genre_cells, author_cells)
+            if memberships_after and loan_upto - loans_after + len(loans_missing) > len(loans_waiting):
+                self._count(counted_condition('cm.id', memberships_after, memberships_missing),
+                            new_condition('l.id', loans_after, loan_upto, loans_missing, loans_waiting),
+                            genres, club_rows, genre_cells, author_cells)
+            for club_id, _ in clubs:
+                club_rows.setdefault(club_id, len(club_rows))
+
+            rows = len(club_rows)
+            grown = np.zeros((rows, len(genres)), dtype=np.int64)
+            grown[:genre_counts.shape[0], :genre_counts.shape[1]] = genre_counts
+            genre_counts = grown
+            if genre_cells:
+                cells = np.array(genre_cells, dtype=np.int64)
+                np.add.at(genre_counts, (cells[:, 0], cells[:, 1]), cells[:, 2])
+            touched = np.empty(0, dtype=np.int64)
+            if author_cells:
+                cells = np.array(author_cells, dtype=np.int64)
+                touched = np.unique(cells[:, 0])
+                # A (club, author) pair can come from both ranges above, so sum before merging
+                new_keys, new_counts = sum_pairs(pair_rows(cells[:, 0], cells[:, 1]), cells[:, 2].astype(np.int32))
+                author_keys, author_counts = merge_pairs(author_keys, author_counts.copy(), new_keys, new_counts)
+
+            club_ids = np.zeros(rows, dtype=np.int32)
+            names = [""] * rows
+            for club_id, row in club_rows.items():
+                club_ids[row] = club_id
+            active = np.zeros(rows, dtype=bool)
+            for club_id, name in clubs:
+                row = club_rows[club_id]
+                names[row] = name
+                active[row] = True
+            if rebuild:
+                author_ids, author_weights = self._top_authors(author_keys, author_counts, rows)
+            else:  # only clubs whose author counts changed
+                author_ids = np.full((rows, self.top_authors), -1, dtype=np.int32)
+                author_weights = np.zeros((rows, self.top_authors), dtype=np.float32)
+                author_ids[:len(self.author_ids)], author_weights[:len(self.author_weights)] = \
+                    self.author_ids, self.author_weights
+                changed = np.isin(author_keys >> 32, touched)
+                ids, weights = self._top_authors(author_keys[changed], author_counts[changed], rows)
+                author_ids[touched], author_weights[touched] = ids[touched], weights[touched]
+
+            with self._lock:
+                self.genres, self._rows = genres, club_rows
+                self.genre_counts, self.author_keys, self.author_counts = genre_counts, author_keys, author_counts
+                self.genre_profile = unit_rows(genre_counts)
+                self.author_ids, self.author_weights = author_ids, author_weights
+                self.club_ids, self.club_names, self.active = club_ids, names, active
+                self.last_loan_id, self.last_membership_id = loan_upto, membership_upto
+                self.waiting_loan_ids, self.waiting_membership_ids = loans_waiting, memberships_waiting
+                self.built = True
+        return time.perf_counter() - start
+
+    def _top_authors(self, keys, counts, rows):
+        """(rows x top_authors) author ids (-1 padded) and unit-length weights."""
+        ids = np.full((rows, self.top_authors), -1, dtype=np.int32)
+        weights = np.zeros((rows, self.top_authors), dtype=np.float32)
+        if len(keys):
+            order = np.argsort((keys & ~np.int64(0xFFFFFFFF)) | (0x7FFFFFFF - counts.astype(np.int64)), kind='stable')
+            club_rows, authors = (keys[order] >> 32).astype(np.int64), (keys[order] & 0xFFFFFFFF).astype(np.int32)
+            starts = np.concatenate(([0], np.cumsum(np.bincount(club_rows, minlength=rows))))
+            rank = np.arange(len(order)) - starts[club_rows]
+            keep = rank < self.top_authors
+            ids[club_rows[keep], rank[keep]] = authors[keep]
+            weights[club_rows[keep], rank[keep]] = counts[order][keep]
+        return ids, unit_rows(weights)
+
+    # ---------------- Queries ----------------
+    def _read_member(self, user_id):
+        """A member's (genre, count) rows, (author_id, count) array and the clubs they joined."""
+        user_id = int(user_id)
+        genres = list(self.db.stream_query(MEMBER_GENRE_QUERY.format(unknown=UNKNOWN_GENRE, user_id=user_id)))
+        authors = np.array(list(self.db.stream_query(MEMBER_AUTHOR_QUERY.format(user_id=user_id))),
+                           dtype=np.int64).reshape(-1, 2)
+        joined = [club_id for club_id, in self.db.stream_query(
+            f"SELECT club_id FROM ClubMemberships WHERE user_id = {user_id}")]
+        return genres, authors, joined
+
+    @staticmethod
+    def score_clubs(genre_profile, club_authors, club_weights, genre_weights, author_ids, author_weights):
+        """Match of every club row with a member profile: (total, genre part, author part)."""
+        genre_score = genre_profile @ genre_weights
+        # The member's weight by author id; padding (-1) reads the zero at the end
+        lookup = np.zeros(max(int(club_authors.max(initial=-1)), int(author_ids.max(initial=-1))) + 2,
+                          dtype=np.float32)
+        lookup[author_ids] = author_weights
+        author_score = (club_weights * lookup[club_authors]).sum(axis=1)
+        return GENRE_WEIGHT * genre_score + AUTHOR_WEIGHT * author_score, genre_score, author_score
+
+    def recommend_clubs(self, user_id, k=CLUB_MATCHES):
+        """Up to k clubs the member has not joined, best match first, as
+        (name, match percent, reason, club_id) rows."""
+        genres, authors, joined = self._read_member(user_id)
+        with self._lock:  # one consistent set of profiles; a full refresh renumbers rows and genres
+            genre_columns, genre_profile = self.genres, self.genre_profile
+            club_authors, club_weights = self.author_ids, self.author_weights
+            club_ids, club_names, active = self.club_ids, self.club_names, self.active
+
+        # Normalised over all of the member's genres, so reading no club shares still counts
+        genre_norm = max(float(np.linalg.norm([count for _, count in genres])), 1e-12)
+        genre_weights = np.zeros(len(genre_columns), dtype=np.float64)
+        for genre, count in genres:
+            column = genre_columns.get(genre)
+            if column is not None:  # a genre no club member has read cannot match
+                genre_weights[column] = count / genre_norm
+        author_ids, author_weights = authors[:, 0].astype(np.int32), authors[:, 1].astype(np.float64)
+        genre_weights = genre_weights.astype(np.float32)
+        author_weights = (author_weights / max(np.linalg.norm(author_weights), 1e-12)).astype(np.float32)
+        total, genre_score, author_score = self.score_clubs(genre_profile, club_authors, club_weights,
+                                                            genre_weights, author_ids, author_weights)
+
+        candidates = active & (total > 0) & ~np.isin(club_ids, np.array(joined, dtype=np.int32))
+        rows = np.flatnonzero(candidates)
+        rows = rows[np.lexsort((club_ids[rows], -total[rows]))][:k]
+        genre_names = list(genre_columns)
+        results = []
+        for row in rows:
+            reasons = []
+            if genre_score[row] > 0:
+                reasons.append(f"reads {genre_names[int((genre_profile[row] * genre_weights).argmax())]}")
+            if author_score[row] > 0:
+                shared = int(np.isin(club_authors[row], author_ids).sum())
+                reasons.append(f"{shared} author{'s' if shared != 1 else ''} in common")
+            results.append((club_names[row], round(float(total[row]) * 100), ", ".join(reasons),
+                            int(club_ids[row])))
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--member", type=int, required=True, help="rank clubs for this member")
+    parser.add_argument("--top", type=int, default=CLUB_MATCHES)
+    parser.add_argument("--backend", choices=BACKENDS, help="default: backends.DB_BACKEND")
+    args = parser.parse_args()
+    if np is None:
+        raise SystemExit("clubmatching.py needs numpy: pip install numpy")
+
+    backend = args.backend or DB_BACKEND
+    with contextlib.redirect_stdout(sys.stderr):
+        db = open_database(backend, **({'minconn': 1, 'maxconn': 1} if backend == 'postgres' else {}))
+    if not db.pool:
+        raise SystemExit(1)
+    try:
+        matcher = ClubMatcher(db)
+        elapsed = matcher.refresh()
+        start = time.perf_counter()
+        results = matcher.recommend_clubs(args.member, args.top)
+        queried = time.perf_counter() - start
+    finally:
+        db.close()
+    for name, match, reason, _ in results:
+        print(f"{match:3d}%  {name}  ({reason})")
+    if not results:
+        print("No matching clubs yet.")
+    print(f"Profiled {int(matcher.active.sum()):,} clubs in {elapsed:.1f} s; query took {queried * 1000:.1f} ms",
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,8 +4,22 @@ Handles PostgreSQL connections and CRUD operations.
 FINAL VERSION: Includes CRUD for Books and Authors.
 """
 import psycopg2
-from psycopg2 import sql
-import datetime
+import psycopg2.extensions
+import psycopg2.pool
+from psycopg2 import errorcodes, sql
+import collections
+import hashlib
+import itertools
+import json
+import re
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+from backends import (CATALOG_PAGE_SIZE, CATALOG_SORT_KEYS, CHECKOUT_MESSAGES, POPULAR_BOOKS_LIMIT,
+                      RETURN_MESSAGES, SEARCH_RESULT_LIMIT, STREAM_ITERSIZE, batch_result, like_pattern)
+from instrumentation import InstrumentedCursor, instrument_methods, registry
 
 # CONFIGURATION
 # !! IMPORTANT: Update these credentials to match your PostgreSQL setup !!
@@ -15,30 +29,361 @@ DB_USER = "postgres"
 DB_PASS = "SHERIFF37"
 DB_PORT = "5432"
 
+# POOL SETTINGS
+POOL_MIN_CONN = 1             # connections opened up front
+POOL_MAX_CONN = 10            # hard cap; callers block when all are checked out
+POOL_CHECKOUT_TIMEOUT = 30    # seconds to wait for a free connection
+POOL_HEALTH_CHECK_INTERVAL = 30  # seconds idle before a connection is pinged on checkout
+
+# PREPARED STATEMENTS
+PREPARED_CACHE_SIZE = 32      # prepared statements kept per pooled connection (LRU)
+
+# POPULARITY
+# Window -> column of the PopularBooksRecent materialized view (None = all-time counters)
+POPULARITY_WINDOWS = {
+    '7d': 'loans_7d',
+    '30d': 'loans_30d',
+    'all': None,
+}
+
+# FULL-TEXT SEARCH
+# 'simple' (no stemming) so author names and titles match as typed, in any language
+SEARCH_CONFIG = 'simple'
+# pg_trgm cannot use its index for patterns shorter than a trigram; below this only
+# word-prefix matching is applied so short keystrokes never fall back to a scan
+TRIGRAM_MIN_LENGTH = 3
+
+
+def prefix_tsquery(search_query):
+    """Turns free text into a tsquery where every word must match as a prefix.
+
+    "gatsby fitz" -> "gatsby:* & fitz:*". Only word characters survive, so the result is
+    always valid to_tsquery input; an empty string means nothing searchable was typed.
+    """
+    words = re.findall(r"\w+", search_query.lower())
+    return " & ".join(f"{word}:*" for word in words)
+
+
+# Names for server-side cursors; unique per process, so per connection too
+_stream_cursor_ids = itertools.count(1)
+
+# Statement caches of the open DatabaseManagers, and the final counts of the closed ones, so
+# the registry exports one process-wide family without keeping closed managers alive
+_open_statement_caches = set()
+_closed_statement_counts = collections.Counter()
+_statement_caches_lock = threading.Lock()
+
+
+def _retire_statement_cache(statements):
+    """Folds a closed (or collected) manager's counts into the process totals."""
+    with _statement_caches_lock:
+        _open_statement_caches.discard(statements)
+        _closed_statement_counts.update(statements.stats())
+
+
+def _prepared_statement_counters():
+    with _statement_caches_lock:
+        totals = collections.Counter(_closed_statement_counts)
+        caches = list(_open_statement_caches)
+    for statements in caches:
+        totals.update(statements.stats())
+    return [('smartlibrary_db_prepared_statements_total', "Prepared-statement cache lookups and upkeep.",
+             {(('result', key),): value for key, value in sorted(totals.items())})]
+
+
+registry.extra_counters.append(_prepared_statement_counters)
+
+
+def positional_params(query):
+    """Rewrites psycopg2 %s placeholders as $1, $2, ... for PREPARE."""
+    counter = itertools.count(1)
+    return re.sub(r"%%|%s", lambda m: '%' if m.group() == '%%' else f"${next(counter)}", query)
+
+
+class PreparedConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that remembers which statements are prepared on its session.
+
+    The map lives and dies with the connection, so after a reconnect statements are
+    simply prepared again. Its cursors report to the instrumentation registry.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursor_factory = InstrumentedCursor
+        self.prepared = collections.OrderedDict()  # SQL text -> statement name, least recently used first
+
+
+class StatementCache:
+    """Runs hot queries as server-side prepared statements, planned once per connection.
+
+    Each PreparedConnection keeps at most `size` statements; the least recently used is
+    deallocated to make room. A statement that disappeared from the session, or whose
+    result type changed with the schema, is prepared again and the call retried once.
+    """
+
+    RETRY_CODES = (errorcodes.INVALID_SQL_STATEMENT_NAME, errorcodes.FEATURE_NOT_SUPPORTED)
+
+    def __init__(self, size=PREPARED_CACHE_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(('hits', 'misses', 'evictions', 'reprepares'), 0)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def _count(self, key):
+        with self._lock:
+            self._counts[key] += 1
+
+    def execute(self, cur, query, params=()):
+        """Like cur.execute(query, params), using a prepared statement for query."""
+        prepared = getattr(cur.connection, 'prepared', None)
+        if prepared is None:  # not a PreparedConnection
+            cur.execute(query, params)
+            return
+        name = prepared.get(query)
+        if name is None:
+            name = self._prepare(cur, prepared, query)
+            self._count('misses')
+        else:
+            prepared.move_to_end(query)
+            self._count('hits')
+        try:
+            self._run(cur, name, params)
+        except psycopg2.Error as e:
+            in_transaction = cur.connection.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+            if e.pgcode not in self.RETRY_CODES or in_transaction:
+                raise
+            self._forget(cur, prepared, query)
+            name = self._prepare(cur, prepared, query)
+            self._count('reprepares')
+            self._run(cur, name, params)
+
+    def _prepare(self, cur, prepared, query):
+        while len(prepared) >= self.size:
+            self._forget(cur, prepared, next(iter(prepared)))
+            self._count('evictions')
+        name = "ps_" + hashlib.md5(query.encode('utf-8')).hexdigest()[:16]
+        cur.execute(f"PREPARE {name} AS {positional_params(query)}")
+        prepared[query] = name
+        return name
+
+    @staticmethod
+    def _forget(cur, prepared, query):
+        name = prepared.pop(query)
+        cur.execute("SELECT 1 FROM pg_prepared_statements WHERE name = %s", (name,))
+        if cur.fetchone():
+            cur.execute(f"DEALLOCATE {name}")
+
+    @staticmethod
+    def _run(cur, name, params):
+        if params:
+            cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        else:
+            cur.execute(f"EXECUTE {name}")
+
+
+class ConnectionPool:
+    """Thread-safe pool of autocommit PostgreSQL connections.
+
+    Unlike psycopg2.pool.ThreadedConnectionPool, checkout blocks (up to a timeout)
+    when the pool is exhausted, and connections that sat idle for a while are
+    pinged before being handed out so a dropped socket never reaches a caller.
+    """
+
+    def __init__(self, minconn=POOL_MIN_CONN, maxconn=POOL_MAX_CONN,
+                 health_check_interval=POOL_HEALTH_CHECK_INTERVAL, **connect_kwargs):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Pool sizes must satisfy 0 <= minconn <= maxconn and maxconn >= 1")
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.health_check_interval = health_check_interval
+        self._connect_kwargs = connect_kwargs
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._idle = []  # (connection, last_used) pairs, most recently used last
+        self._closed = False
+
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        conn = psycopg2.connect(**self._connect_kwargs)
+        conn.autocommit = True
+        return conn
+
+    def _is_healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self, timeout=POOL_CHECKOUT_TIMEOUT):
+        """Checks out a connection, blocking until one is free or `timeout` expires."""
+        if not self._slots.acquire(timeout=timeout):
+            raise psycopg2.pool.PoolError("Timed out waiting for a free database connection")
+        try:
+            while True:
+                with self._lock:
+                    if self._closed:
+                        raise psycopg2.pool.PoolError("Connection pool is closed")
+                    idle = self._idle.pop() if self._idle else None
+                if idle is None:
+                    return self._connect()
+                conn, last_used = idle
+                if self._is_healthy(conn, last_used):
+                    return conn
+                self._discard(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, close=False):
+        """Checks a connection back in. Broken or mid-transaction connections are reset or dropped."""
+        try:
+            if not close and not conn.closed:
+                try:
+                    status = conn.get_transaction_status()
+                    if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                        close = True
+                    elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+                    if not close:
+                        conn.autocommit = True
+                except psycopg2.Error:
+                    close = True
+
+            with self._lock:
+                keep = not (close or conn.closed or self._closed)
+                if keep:
+                    self._idle.append((conn, time.monotonic()))
+            if not keep:
+                self._discard(conn)
+        finally:
+            self._slots.release()
+
+    def closeall(self):
+        """Closes every idle connection and refuses further checkouts."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+
+@instrument_methods(exclude=('cursor', 'transaction', 'close', 'prepared_statement_stats'))
 class DatabaseManager:
-    def __init__(self):
+    backend_name = 'postgres'
+
+    def __init__(self, minconn=POOL_MIN_CONN, maxconn=POOL_MAX_CONN):
         try:
-            self.conn = psycopg2.connect(
+            self.pool = ConnectionPool(
+                minconn=max(minconn, 1),  # open at least one so a bad config fails here, not mid-session
+                maxconn=maxconn,
                 host=DB_HOST,
                 database=DB_NAME,
                 user=DB_USER,
                 password=DB_PASS,
-                port=DB_PORT
+                port=DB_PORT,
+                connection_factory=PreparedConnection
             )
-            self.conn.autocommit = True
             print("Database connected successfully.")
         except Exception as e:
             print(
                 f"Error connecting to database. Please check credentials and ensure the DB 'smart_library' is running: {e}")
-            self.conn = None
+            self.pool = None
+        self.statements = StatementCache()
+        self.metrics = registry
+        with _statement_caches_lock:
+            _open_statement_caches.add(self.statements)
+        self._retire_statements = weakref.finalize(self, _retire_statement_cache, self.statements)
+
+    def prepared_statement_stats(self):
+        """Hit/miss/eviction/re-prepare counts of the prepared-statement cache."""
+        return self.statements.stats()
+
+    @contextmanager
+    def cursor(self, canceller=None):
+        """Checks out a pooled connection for a single autocommit call and yields a cursor on it.
+
+        If a QueryCanceller is given, it can abort whatever runs on the cursor.
+        """
+        conn = self.pool.getconn()
+        try:
+            if canceller:
+                canceller.attach(conn)
+            with conn.cursor() as cur:
+                yield cur
+        finally:
+            if canceller:
+                canceller.detach(conn)
+            self.pool.putconn(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Checks out a pooled connection for multi-statement work.
+
+        Everything executed on the yielded connection commits together when the block
+        exits, or rolls back if it raises.
+        """
+        conn = self.pool.getconn()
+        conn.autocommit = False
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn)
+
+    def stream_query(self, query, params=(), itersize=STREAM_ITERSIZE, canceller=None):
+        """Yields the rows of `query` one at a time through a named server-side cursor.
+
+        Rows cross the network `itersize` at a time, so memory stays flat however large
+        the result. The generator holds a pooled connection (and an open transaction)
+        until it is exhausted or closed, so consume it promptly or close() it.
+        """
+        with self.transaction() as conn:
+            if canceller:
+                canceller.attach(conn)
+            try:
+                with conn.cursor(name=f"stream_{next(_stream_cursor_ids)}") as cur:
+                    cur.itersize = itersize
+                    cur.execute(query, params)
+                    yield from cur
+            finally:
+                if canceller:
+                    canceller.detach(conn)
+
+    def close(self):
+        """Closes all pooled connections."""
+        self._retire_statements()  # runs once, here or when the manager is collected
+        if self.pool:
+            self.pool.closeall()
 
     def authenticate_user(self, username, password):
         """Checks credentials and returns user details."""
-        if not self.conn: return None
+        if not self.pool: return None
         # Note: In a real app, password_hash should be properly checked (e.g., bcrypt)
         query = "SELECT id, username, full_name, email, role_id FROM Users WHERE username=%s AND password_hash=%s"
-        with self.conn.cursor() as cur:
-            cur.execute(query, (username, password))
+        with self.cursor() as cur:
+            self.statements.execute(cur, query, (username, password))
             row = cur.fetchone()
             if row:
                 return {"id": row[0], "username": row[1], "full_name": row[2], "email": row[3], "role_id": row[4]}
@@ -56,93 +401,340 @@ class DatabaseManager:
             LEFT JOIN Authors a ON ba.author_id = a.id
         """
         params = []
-        if search_query:
-            base_query += """
-                WHERE b.title ILIKE %s OR b.genre ILIKE %s OR a.name ILIKE %s
-            """
-            term = f"%{search_query}%"
-            params = [term, term, term]
+        condition, filter_params = self._catalog_filter(search_query)
+        if condition:
+            base_query += f" WHERE {condition}"
+            params = filter_params
 
         base_query += " GROUP BY b.id, b.title, b.genre, b.publication_year, b.available ORDER BY b.id"
 
-        with self.conn.cursor() as cur:
-            cur.execute(base_query, tuple(params))
+        with self.cursor() as cur:
+            self.statements.execute(cur, base_query, tuple(params))
+            return cur.fetchall()
+
+    def get_books_by_ids(self, book_ids):
+        """Catalog rows (same shape as get_all_books) for just these books, in one query."""
+        query = """
+            SELECT b.id, b.title, b.genre, b.publication_year, b.available, 
+                   COALESCE(string_agg(a.name, ', '), 'N/A') as authors
+            FROM Books b 
+            LEFT JOIN BookAuthors ba ON b.id = ba.book_id
+            LEFT JOIN Authors a ON ba.author_id = a.id
+            WHERE b.id = ANY(%s)
+            GROUP BY b.id, b.title, b.genre, b.publication_year, b.available ORDER BY b.id
+        """
+        with self.cursor() as cur:
+            cur.execute(query, (list(book_ids),))
+            return cur.fetchall()
+
+    @staticmethod
+    def _catalog_filter(search_query):
+        """SQL condition (and its params) matching books by title, genre or author name.
+
+        Words match as prefixes through the GIN-indexed search_document; from
+        TRIGRAM_MIN_LENGTH characters on, substrings anywhere in the title, genre or an
+        author's name also match through the pg_trgm indexes. Never scans the table.
+        Returns (None, []) when there is nothing to filter on.
+        """
+        search_query = (search_query or "").strip()
+        tsquery = prefix_tsquery(search_query)
+        if not tsquery:
+            return None, []
+
+        condition = f"b.search_document @@ to_tsquery('{SEARCH_CONFIG}', %s)"
+        params = [tsquery]
+        if len(search_query) >= TRIGRAM_MIN_LENGTH:
+            pattern = like_pattern(search_query)
+            condition = f"""
+                ({condition} OR b.title ILIKE %s OR b.genre ILIKE %s OR b.id IN (
+                    SELECT fba.book_id FROM BookAuthors fba JOIN Authors fa ON fba.author_id = fa.id
+                    WHERE fa.name ILIKE %s))
+            """
+            params += [pattern, pattern, pattern]
+        return condition, params
+
+    def search_books(self, search_query, limit=SEARCH_RESULT_LIMIT, offset=0, canceller=None):
+        """Ranked full-text search over titles, authors and genres.
+
+        Every word matches as a prefix ("orw" finds Orwell), and longer input also as a
+        substring ("tomic" finds Atomic Habits). Returns rows of
+        (id, title, genre, year, available, authors, rank, snippet), best match first;
+        snippet is "title — authors — genre" with matched words wrapped in <b></b>.
+        """
+        condition, filter_params = self._catalog_filter(search_query)
+        if not condition:
+            return []
+        tsquery = prefix_tsquery(search_query)
+
+        # Rank and limit on the index first; only the returned page pays for authors and headlines.
+        # Substring-only hits have no text-search rank, so title similarity breaks those ties.
+        query = f"""
+            WITH q AS (SELECT to_tsquery('{SEARCH_CONFIG}', %s) AS query),
+            hits AS (
+                SELECT b.id, ts_rank_cd(b.search_document, q.query) + similarity(b.title, %s) AS rank
+                FROM Books b, q
+                WHERE {condition}
+                ORDER BY rank DESC, b.id
+                LIMIT %s OFFSET %s
+            )
+            SELECT b.id, b.title, b.genre, b.publication_year, b.available, ba.authors, h.rank,
+                   ts_headline('{SEARCH_CONFIG}', concat_ws(' — ', b.title, ba.authors, b.genre), q.query,
+                               'StartSel=<b>, StopSel=</b>, HighlightAll=true') AS snippet
+            FROM hits h
+            JOIN Books b ON b.id = h.id
+            CROSS JOIN q
+            CROSS JOIN LATERAL (
+                SELECT COALESCE(string_agg(a.name, ', '), 'N/A') AS authors
+                FROM BookAuthors l JOIN Authors a ON l.author_id = a.id
+                WHERE l.book_id = b.id
+            ) ba
+            ORDER BY h.rank DESC, b.id
+        """
+        with self.cursor(canceller) as cur:
+            cur.execute(query, (tsquery, search_query, *filter_params, limit, offset))
             return cur.fetchall()
 
+    def get_books_page(self, search_query=None, sort='title', page_size=CATALOG_PAGE_SIZE, after=None,
+                       canceller=None):
+        """Keyset-paginated catalog: returns (rows, next_cursor).
+
+        Rows have the same shape as get_all_books. Pass the returned cursor as `after`
+        to get the following page; it is None once the last page has been returned.
+        Books are sorted by `sort` ('title', 'year' or 'id'), ties broken by id.
+        """
+        if sort not in CATALOG_SORT_KEYS:
+            raise ValueError(f"Unknown sort '{sort}'. Expected one of {sorted(CATALOG_SORT_KEYS)}")
+        sort_key = CATALOG_SORT_KEYS[sort]
+
+        conditions, params = [], []
+        condition, filter_params = self._catalog_filter(search_query)
+        if condition:
+            conditions.append(condition)
+            params += filter_params
+        if after is not None:
+            conditions.append(f"({sort_key}, b.id) > (%s, %s)")
+            params += list(after)
+        where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+
+        # Page over Books alone, then aggregate authors for just that page
+        query = f"""
+            WITH page AS (
+                SELECT b.id, b.title, b.genre, b.publication_year, b.available, {sort_key} AS sort_key
+                FROM Books b
+                {where}
+                ORDER BY {sort_key}, b.id
+                LIMIT %s
+            )
+            SELECT p.id, p.title, p.genre, p.publication_year, p.available,
+                   COALESCE(string_agg(a.name, ', '), 'N/A') as authors, p.sort_key
+            FROM page p
+            LEFT JOIN BookAuthors ba ON p.id = ba.book_id
+            LEFT JOIN Authors a ON ba.author_id = a.id
+            GROUP BY p.id, p.title, p.genre, p.publication_year, p.available, p.sort_key
+            ORDER BY p.sort_key, p.id
+        """
+        params.append(page_size + 1)  # one extra row tells us whether another page exists
+
+        with self.cursor(canceller) as cur:
+            cur.execute(query, tuple(params))
+            rows = cur.fetchall()
+
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = (rows[-1][6], rows[-1][0])
+        return [row[:6] for row in rows], next_cursor
+
+    def estimate_book_count(self, search_query=None, canceller=None):
+        """Cheap approximate number of matching books, taken from planner statistics.
+
+        Never scans the table, so it can be off by a margin; use it for labels such as
+        "about 12,000 books", not for arithmetic.
+        """
+        condition, params = self._catalog_filter(search_query)
+        with self.cursor(canceller) as cur:
+            if not condition:
+                cur.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = 'books'::regclass")
+                estimate = cur.fetchone()[0]
+                if estimate >= 0:
+                    return estimate
+                # Never analyzed: the table is new, so an exact count is cheap
+                cur.execute("SELECT COUNT(*) FROM Books")
+                return cur.fetchone()[0]
+
+            cur.execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM Books b WHERE {condition}", tuple(params))
+            plan = cur.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows'])
+
+    def checkout_book(self, user_id, book_id):
+        """Atomically lends a book to a member, in one round trip (see checkout_book() in migration 0000).
+
+        Returns {'status', 'message', 'loan_id', 'due_date'}. status is 'ok' or a failure
+        reason from CHECKOUT_MESSAGES, or 'error' if the database call itself failed.
+        A copy held by a concurrent checkout is reported as 'book_busy' without waiting.
+        """
+        try:
+            with self.cursor() as cur:
+                self.statements.execute(cur, "SELECT status, loan_id, loan_due_date FROM checkout_book(%s, %s)",
+                                        (user_id, book_id))
+                status, loan_id, due_date = cur.fetchone()
+        except psycopg2.Error as e:
+            return {'status': 'error', 'message': str(e).split('\n')[0], 'loan_id': None, 'due_date': None}
+        return {'status': status, 'message': CHECKOUT_MESSAGES[status], 'loan_id': loan_id, 'due_date': due_date}
+
     def borrow_book(self, user_id, book_id):
-        """Attempts to borrow a book. Relies on SQL Triggers for logic (max 3 loans, update availability)."""
+        """Attempts to borrow a book. Returns (success, message); see checkout_book for the details."""
+        result = self.checkout_book(user_id, book_id)
+        return result['status'] == 'ok', result['message']
+
+    def borrow_books(self, user_id, book_ids):
+        """Checks out several books to one member in a single transaction: all of them or none.
+
+        Returns {'ok', 'message', 'items'}. items holds one checkout_book-style result (plus
+        'book_id') per distinct book, in the order given. If any book cannot be lent, nothing
+        is committed and the books that would have been lent are reported as 'rolled_back'.
+        """
+        book_ids = list(dict.fromkeys(int(book_id) for book_id in book_ids))
+        items = []
         try:
-            with self.conn.cursor() as cur:
-                due_date = datetime.date.today() + datetime.timedelta(days=7)
-                query = "INSERT INTO Loans (book_id, user_id, borrow_date, due_date) VALUES (%s, %s, CURRENT_DATE, %s)"
-                cur.execute(query, (book_id, user_id, due_date))
-                return True, "Book borrowed successfully!"
+            with self.transaction() as conn, conn.cursor() as cur:
+                for book_id in book_ids:
+                    self.statements.execute(cur, "SELECT status, loan_id, loan_due_date FROM checkout_book(%s, %s)",
+                                            (user_id, book_id))
+                    status, loan_id, due_date = cur.fetchone()
+                    items.append({'book_id': book_id, 'status': status, 'message': CHECKOUT_MESSAGES[status],
+                                  'loan_id': loan_id, 'due_date': due_date})
+                if any(item['status'] != 'ok' for item in items):
+                    conn.rollback()
         except psycopg2.Error as e:
-            return False, str(e).split('\n')[0]
+            message = str(e).split('\n')[0]
+            items = [{'book_id': book_id, 'status': 'error', 'message': message, 'loan_id': None, 'due_date': None}
+                     for book_id in book_ids]
+            return {'ok': False, 'message': message, 'items': items}
+        return batch_result(items, CHECKOUT_MESSAGES, 'borrowed', cleared=('loan_id', 'due_date'))
 
     def return_book(self, loan_id):
         """Returns a book by updating the return_date. Relies on SQL Trigger to update availability."""
         try:
-            with self.conn.cursor() as cur:
+            with self.cursor() as cur:
                 query = "UPDATE Loans SET return_date = CURRENT_DATE WHERE id = %s"
-                cur.execute(query, (loan_id,))
+                self.statements.execute(cur, query, (loan_id,))
                 return True, "Book returned successfully."
         except Exception as e:
             return False, str(e)
 
+    def return_loans(self, loan_ids):
+        """Returns several loans in a single transaction: all of them or none.
+
+        Returns {'ok', 'message', 'items'} with one {'loan_id', 'status', 'message'} per
+        distinct loan, in the order given (statuses from RETURN_MESSAGES). The loans are
+        locked and checked first, then closed with one UPDATE, so the statement-level
+        counter and notification triggers fire once for the whole batch.
+        """
+        loan_ids = list(dict.fromkeys(int(loan_id) for loan_id in loan_ids))
+        try:
+            with self.transaction() as conn, conn.cursor() as cur:
+                cur.execute("SELECT id, return_date IS NOT NULL FROM Loans WHERE id = ANY(%s) ORDER BY id FOR UPDATE",
+                            (loan_ids,))
+                returned = dict(cur.fetchall())
+                statuses = [('loan_not_found' if loan_id not in returned else
+                             'already_returned' if returned[loan_id] else 'ok') for loan_id in loan_ids]
+                if loan_ids and all(status == 'ok' for status in statuses):
+                    cur.execute("UPDATE Loans SET return_date = CURRENT_DATE WHERE id = ANY(%s)", (loan_ids,))
+        except psycopg2.Error as e:
+            message = str(e).split('\n')[0]
+            items = [{'loan_id': loan_id, 'status': 'error', 'message': message} for loan_id in loan_ids]
+            return {'ok': False, 'message': message, 'items': items}
+        items = [{'loan_id': loan_id, 'status': status, 'message': RETURN_MESSAGES[status]}
+                 for loan_id, status in zip(loan_ids, statuses)]
+        return batch_result(items, RETURN_MESSAGES, 'returned')
+
     def get_user_loans(self, user_id):
+        """A member's active loans as (loan_id, title, borrow_date, due_date, return_date, book_id)."""
         query = """
-            SELECT l.id, b.title, l.borrow_date, l.due_date, l.return_date 
+            SELECT l.id, b.title, l.borrow_date, l.due_date, l.return_date, l.book_id
             FROM Loans l JOIN Books b ON l.book_id = b.id
             WHERE l.user_id = %s AND l.return_date IS NULL
         """
-        with self.conn.cursor() as cur:
-            cur.execute(query, (user_id,))
+        with self.cursor() as cur:
+            self.statements.execute(cur, query, (user_id,))
             return cur.fetchall()
 
     # --- LIBRARIAN: BOOK CRUD ---
+    # add_book/update_book return (success, message, delta). delta describes exactly what
+    # changed so callers and caches can update in place:
+    #   {'book_id', 'created', 'fields_changed', 'authors_added', 'authors_removed'}
+    # It is None when the call failed.
+
+    @staticmethod
+    def _link_authors(cur, book_id, author_ids):
+        """Links a book to several authors with one multi-row insert."""
+        if author_ids:
+            cur.execute("INSERT INTO BookAuthors (book_id, author_id) SELECT %s, unnest(%s::int[])",
+                        (book_id, list(author_ids)))
+
     def add_book(self, title, genre, year, author_ids):
-        """Adds a new book and links it to authors."""
+        """Adds a new book and links it to authors, in one transaction."""
+        author_ids = sorted({int(author_id) for author_id in author_ids})
         try:
-            with self.conn.cursor() as cur:
-                # 1. Insert Book
+            with self.transaction() as conn, conn.cursor() as cur:
                 book_query = "INSERT INTO Books (title, genre, publication_year) VALUES (%s, %s, %s) RETURNING id"
                 cur.execute(book_query, (title, genre, year))
                 book_id = cur.fetchone()[0]
+                self._link_authors(cur, book_id, author_ids)
 
-                # 2. Link Authors
-                for author_id in author_ids:
-                    link_query = "INSERT INTO BookAuthors (book_id, author_id) VALUES (%s, %s)"
-                    cur.execute(link_query, (book_id, author_id))
-
-                return True, f"Book '{title}' added successfully with ID {book_id}."
+            delta = {'book_id': book_id, 'created': True, 'fields_changed': True,
+                     'authors_added': author_ids, 'authors_removed': []}
+            return True, f"Book '{title}' added successfully with ID {book_id}.", delta
         except Exception as e:
-            return False, str(e)
+            return False, str(e), None
 
     def update_book(self, book_id, title, genre, year, author_ids):
-        """Updates book details and replaces author links."""
+        """Updates book details and author links, touching only what actually changed.
+
+        Runs in one transaction: the current row and links are read under a row lock, and
+        only the differing columns and the added/removed links are written.
+        """
+        desired = {int(author_id) for author_id in author_ids}
         try:
-            with self.conn.cursor() as cur:
-                # 1. Update Book Details
-                update_query = "UPDATE Books SET title=%s, genre=%s, publication_year=%s WHERE id=%s"
-                cur.execute(update_query, (title, genre, year, book_id))
+            with self.transaction() as conn, conn.cursor() as cur:
+                cur.execute("""
+                    SELECT b.title, b.genre, b.publication_year,
+                           ARRAY(SELECT author_id FROM BookAuthors WHERE book_id = b.id)
+                    FROM Books b WHERE b.id = %s FOR UPDATE OF b
+                """, (book_id,))
+                row = cur.fetchone()
+                if row is None:
+                    return False, f"Book ID {book_id} no longer exists.", None
 
-                # 2. Clear existing Author Links
-                cur.execute("DELETE FROM BookAuthors WHERE book_id=%s", (book_id,))
+                current_title, current_genre, current_year, current_authors = row
+                fields_changed = (current_title, current_genre, current_year) != (title, genre, year)
+                if fields_changed:
+                    update_query = "UPDATE Books SET title=%s, genre=%s, publication_year=%s WHERE id=%s"
+                    cur.execute(update_query, (title, genre, year, book_id))
 
-                # 3. Insert new Author Links
-                for author_id in author_ids:
-                    link_query = "INSERT INTO BookAuthors (book_id, author_id) VALUES (%s, %s)"
-                    cur.execute(link_query, (book_id, author_id))
+                current = set(current_authors)
+                removed = sorted(current - desired)
+                added = sorted(desired - current)
+                if removed:
+                    cur.execute("DELETE FROM BookAuthors WHERE book_id=%s AND author_id = ANY(%s)",
+                                (book_id, removed))
+                self._link_authors(cur, book_id, added)
 
-                return True, f"Book ID {book_id} updated successfully."
+            delta = {'book_id': book_id, 'created': False, 'fields_changed': fields_changed,
+                     'authors_added': added, 'authors_removed': removed}
+            if not (fields_changed or added or removed):
+                return True, f"No changes to save for Book ID {book_id}.", delta
+            return True, f"Book ID {book_id} updated successfully.", delta
         except Exception as e:
-            return False, str(e)
+            return False, str(e), None
 
     def delete_book(self, book_id):
         """Deletes a book. Cascades to BookAuthors. Will fail if active loans exist (RESTRICT)."""
         try:
-            with self.conn.cursor() as cur:
+            with self.cursor() as cur:
                 cur.execute("DELETE FROM Books WHERE id=%s", (book_id,))
                 return True, f"Book ID {book_id} deleted successfully."
         except psycopg2.Error as e:
@@ -155,14 +747,14 @@ class DatabaseManager:
     def get_all_authors(self):
         """Retrieves all authors."""
         query = "SELECT id, name, bio FROM Authors ORDER BY name"
-        with self.conn.cursor() as cur:
+        with self.cursor() as cur:
             cur.execute(query)
             return cur.fetchall()
 
     def add_author(self, name, bio):
         """Adds a new author."""
         try:
-            with self.conn.cursor() as cur:
+            with self.cursor() as cur:
                 query = "INSERT INTO Authors (name, bio) VALUES (%s, %s)"
                 cur.execute(query, (name, bio))
                 return True, f"Author '{name}' added successfully."
@@ -174,7 +766,7 @@ class DatabaseManager:
     def delete_author(self, author_id):
         """Deletes an author. Cascades to BookAuthors links."""
         try:
-            with self.conn.cursor() as cur:
+            with self.cursor() as cur:
                 cur.execute("DELETE FROM Authors WHERE id=%s", (author_id,))
                 return True, "Author deleted successfully."
         except psycopg2.Error as e:
@@ -182,48 +774,165 @@ class DatabaseManager:
             return False, str(e)
 
     # --- DASHBOARD & CLUB METHODS (Existing) ---
+    def get_library_stats(self):
+        """All dashboard counters in one round trip.
+
+        Reads the trigger-maintained LibraryStats view, which sums 16 shard rows; the
+        overdue count is summed over the shards of each past due date.
+        """
+        with self.cursor() as cur:
+            cur.execute("""
+                SELECT s.total_books, s.available_books, s.total_books - s.available_books,
+                       s.members, s.clubs, s.active_loans,
+                       COALESCE((SELECT SUM(d.active_loans) FROM ActiveLoansByDueDate d
+                                 WHERE d.due_date < CURRENT_DATE), 0)
+                FROM LibraryStats s
+            """)
+            row = cur.fetchone()
+        keys = ('books', 'available', 'borrowed', 'members', 'clubs', 'active_loans', 'overdue')
+        return dict(zip(keys, (int(v) for v in row))) if row else dict.fromkeys(keys, 0)
+
     def get_dashboard_stats(self):
-        stats = {}
-        with self.conn.cursor() as cur:
-            cur.execute("SELECT COUNT(*) FROM Books")
-            stats['books'] = cur.fetchone()[0]
-            cur.execute("SELECT COUNT(*) FROM Users WHERE role_id = 2")
-            stats['members'] = cur.fetchone()[0]
-            cur.execute("SELECT COUNT(*) FROM Loans WHERE return_date IS NULL")
-            stats['active_loans'] = cur.fetchone()[0]
-        return stats
-
-    def get_popular_books(self):
-        query = "SELECT * FROM PopularBooksReport LIMIT 10"
-        try:
-            with self.conn.cursor() as cur:
-                cur.execute(query)
+        return self.get_library_stats()
+
+    def reconcile_library_stats(self):
+        """Rebuild the LibraryStats counters from the base tables. Returns True if they had drifted."""
+        with self.transaction() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT reconcile_library_stats()")
+                return cur.fetchone()[0]
+
+    def get_popular_books(self, window='all', limit=POPULAR_BOOKS_LIMIT):
+        """Top books as (title, genre, times borrowed) for a window of '7d', '30d' or 'all'.
+
+        Reads precomputed counters through an index, so the cost does not grow with the
+        loan history. 'all' is exact; the 7/30-day windows are as fresh as the last
+        refresh_popular_books().
+        """
+        if window not in POPULARITY_WINDOWS:
+            raise ValueError(f"Unknown window '{window}'. Expected one of {sorted(POPULARITY_WINDOWS)}")
+        column = POPULARITY_WINDOWS[window]
+        if column is None:
+            query = "SELECT title, genre, times_borrowed FROM PopularBooksReport LIMIT %s"
+        else:
+            query = f"""
+                SELECT b.title, b.genre, p.{column}
+                FROM PopularBooksRecent p JOIN Books b ON b.id = p.book_id
+                WHERE p.{column} > 0
+                ORDER BY p.{column} DESC, p.book_id
+                LIMIT %s
+            """
+        try:
+            with self.cursor() as cur:
+                cur.execute(query, (limit,))
                 return cur.fetchall()
-        except:
+        except psycopg2.Error:
             return []
 
+    def refresh_popular_books(self):
+        """Prunes expired daily counters and refreshes the 7/30-day popularity view.
+
+        Meant to be run on a schedule. Returns False without waiting if another session
+        is already refreshing.
+        """
+        with self.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(hashtext('refresh_popular_books'))")
+            if not cur.fetchone()[0]:
+                return False
+            try:
+                cur.execute("DELETE FROM BookLoanDaily WHERE loan_date <= CURRENT_DATE - 30")
+                cur.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY PopularBooksRecent")
+            finally:
+                cur.execute("SELECT pg_advisory_unlock(hashtext('refresh_popular_books'))")
+        return True
+
+    def prune_deleted_rows(self, before):
+        """Deletes the DeletedRows tombstones recorded before `before`, the oldest snapshot
+        watermark still in use. Returns how many were deleted."""
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM DeletedRows WHERE deleted_at < %s", (before,))
+            return cur.rowcount
+
     def get_overdue_books(self):
         query = "SELECT * FROM OverdueBooksReport"
         try:
-            with self.conn.cursor() as cur:
+            with self.cursor() as cur:
                 cur.execute(query)
                 return cur.fetchall()
-        except:
+        except psycopg2.Error:
             return []
 
+    # --- STREAMING REPORTS ---
+    # Generator counterparts of the list-returning reads, for exports and reports that may
+    # not fit in memory. Each yields plain tuples through stream_query().
+
+    def iter_all_books(self, search_query=None, itersize=STREAM_ITERSIZE):
+        """Streams catalog rows shaped like get_all_books, in id order.
+
+        Authors are aggregated per book as it is read, so rows start arriving at once
+        instead of after a grouping pass over the whole catalog.
+        """
+        query = """
+            SELECT b.id, b.title, b.genre, b.publication_year, b.available,
+                   COALESCE((SELECT string_agg(a.name, ', ') FROM BookAuthors ba JOIN Authors a ON a.id = ba.author_id
+                             WHERE ba.book_id = b.id), 'N/A') AS authors
+            FROM Books b
+        """
+        condition, params = self._catalog_filter(search_query)
+        if condition:
+            query += f" WHERE {condition}"
+        yield from self.stream_query(query + " ORDER BY b.id", tuple(params), itersize)
+
+    def iter_overdue_books(self, itersize=STREAM_ITERSIZE):
+        """Streams OverdueBooksReport rows (title, member, due date, days overdue), most overdue first."""
+        yield from self.stream_query("SELECT * FROM OverdueBooksReport ORDER BY due_date, title", (), itersize)
+
+    def iter_club_members(self, club_id, itersize=STREAM_ITERSIZE):
+        """Streams rows shaped like get_club_members."""
+        query = """
+            SELECT u.full_name, u.email, cm.join_date
+            FROM ClubMemberships cm
+            JOIN Users u ON cm.user_id = u.id
+            WHERE cm.club_id = %s
+            ORDER BY cm.join_date, cm.id
+        """
+        yield from self.stream_query(query, (club_id,), itersize)
+
+    def iter_loan_history(self, since=None, until=None, itersize=STREAM_ITERSIZE):
+        """Streams every loan, returned or not, in loan id order, optionally borrowed within [since, until).
+
+        Rows are (loan_id, book_id, title, user_id, member, borrow_date, due_date, return_date).
+        """
+        conditions, params = [], []
+        if since is not None:
+            conditions.append("l.borrow_date >= %s")
+            params.append(since)
+        if until is not None:
+            conditions.append("l.borrow_date < %s")
+            params.append(until)
+        query = f"""
+            SELECT l.id, l.book_id, b.title, l.user_id, u.full_name, l.borrow_date, l.due_date, l.return_date
+            FROM Loans l
+            JOIN Books b ON b.id = l.book_id
+            JOIN Users u ON u.id = l.user_id
+            {"WHERE " + " AND ".join(conditions) if conditions else ""}
+            ORDER BY l.id
+        """
+        yield from self.stream_query(query, tuple(params), itersize)
+
     def get_all_clubs(self):
         query = """
             SELECT c.id, c.name, c.description, u.full_name as creator 
             FROM BookClubs c 
             JOIN Users u ON c.created_by = u.id
         """
-        with self.conn.cursor() as cur:
+        with self.cursor() as cur:
             cur.execute(query)
             return cur.fetchall()
 
     def join_club(self, user_id, club_id):
         try:
-            with self.conn.cursor() as cur:
+            with self.cursor() as cur:
                 query = "INSERT INTO ClubMemberships (club_id, user_id) VALUES (%s, %s)"
                 cur.execute(query, (club_id, user_id))
                 return True, "Joined club successfully!"
@@ -232,7 +941,7 @@ class DatabaseManager:
 
     def create_club(self, name, description, user_id):
         try:
-            with self.conn.cursor() as cur:
+            with self.cursor() as cur:
                 query = "INSERT INTO BookClubs (name, description, created_by) VALUES (%s, %s, %s)"
                 cur.execute(query, (name, description, user_id))
                 return True, "Club created successfully!"
@@ -246,6 +955,6 @@ class DatabaseManager:
             JOIN Users u ON cm.user_id = u.id 
             WHERE cm.club_id = %s
         """
-        with self.conn.cursor() as cur:
+        with self.cursor() as cur:
             cur.execute(query, (club_id,))
             return cur.fetchall()
\ No newline at end of file
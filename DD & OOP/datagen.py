@@ -0,0 +1,194 @@
+"""
+datagen.py
+Seeded synthetic data for SmartLibrary at benchmark scale. Streams Authors, Books, BookAuthors,
+members (Users), BookClubs, ClubMemberships and Loans into the database with COPY, one
+transaction per chunk, so memory stays flat whatever the scale:
+
+    python datagen.py --tier small              # 10k books, 100k loans
+    python datagen.py --tier large --seed 7     # 1M books, 20M loans
+    python datagen.py --books 50000 --loans 500000
+
+Load into a freshly created database (smart_library.sql + migrate.py): the same seed always
+produces the same rows, and generated names are unique only within one run. All triggers stay
+active, so availability, loan counters, popularity and LibraryStats come out consistent.
+"""
+import argparse
+import datetime
+import itertools
+import random
+import time
+
+from bulkimport import copy_rows
+
+# Row counts per scale tier (loans include returned history; about 2% are still active)
+TIERS = {
+    'small': {'authors': 2_000, 'books': 10_000, 'members': 2_000, 'clubs': 50, 'loans': 100_000},
+    'medium': {'authors': 20_000, 'books': 100_000, 'members': 20_000, 'clubs': 500, 'loans': 2_000_000},
+    'large': {'authors': 100_000, 'books': 1_000_000, 'members': 200_000, 'clubs': 5_000, 'loans': 20_000_000},
+}
+GENERATE_CHUNK_SIZE = 50_000
+ACTIVE_LOAN_FRACTION = 0.02
+HISTORY_DAYS = 3 * 365
+MAX_ACTIVE_LOANS = 3
+LOAN_DAYS = 7
+
+FIRST_NAMES = ("Amara Kofi Fatmata Ibrahim Mariama Sahr Isatu Abu Hawa Alimamy Kadiatu Momodu Aminata "
+               "Tamba Yeabu Foday Adama Musa Zainab Osman Nancy Daniel Grace Samuel Ruth Joseph Esther "
+               "David Mary John Sarah Peter Hannah Paul Miriam Thomas Leah Martin Naomi Simon").split()
+LAST_NAMES = ("Conteh Sesay Kamara Koroma Bangura Turay Kargbo Mansaray Jalloh Bah Fofanah Kanu Cole "
+              "Johnson Williams Thomas Macauley Taylor Davies Roberts Hughes Wright Walker Green Hall "
+              "Allen Young King Scott Adams Baker Nelson Carter Mitchell Perez Turner Parker Evans").split()
+TITLE_WORDS = ("river night house garden shadow empire silent golden winter child storm letter journey "
+               "kingdom island secret memory daughter ocean fire stone city war song harvest bridge "
+               "mountain lantern voice road promise salt thunder forest market dream harbour").split()
+GENRES = ("African Literature", "Historical Fiction", "Contemporary Fiction", "Self-Help", "Finance",
+          "Non-Fiction", "Dystopian", "Classic", "Romance", "Manga", "Science", "Poetry", "Mystery",
+          "Fantasy", "Biography", "Children")
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def skewed_choice(rng, items, skew=2.5):
+    """Picks from items with a long-tailed bias toward the front, like real circulation."""
+    return items[int(len(items) * rng.random() ** skew)]
+
+
+class DataGenerator:
+    """Generates and loads one data set. The same seed and counts always yield the same rows."""
+
+    def __init__(self, db, seed=42, chunk_size=GENERATE_CHUNK_SIZE, progress=print):
+        self.db = db
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.today = datetime.date.today()
+
+    def run(self, authors, books, members, clubs, loans):
+        author_ids = self._load("Authors", "name, bio", self.author_rows(authors), authors)
+        book_ids = self._load("Books", "title, genre, publication_year", self.book_rows(books), books)
+        self._load("BookAuthors", "book_id, author_id", self.book_author_rows(book_ids, author_ids), None)
+        member_ids = self._load("Users", "username, password_hash, role_id, email, full_name",
+                                self.member_rows(members), members)
+        club_ids = self._load("BookClubs", "name, description, created_by", self.club_rows(clubs, member_ids), clubs)
+        self._load("ClubMemberships", "club_id, user_id", self.membership_rows(club_ids, member_ids), None)
+        self._load("Loans", "book_id, user_id, borrow_date, due_date, return_date",
+                   self.loan_rows(loans, book_ids, member_ids), loans)
+        with self.db.cursor() as cur:
+            cur.execute("ANALYZE")
+        self.db.refresh_popular_books()
+
+    def _load(self, table, columns, rows, total):
+        """COPYs rows into table chunk by chunk; returns the new ids for tables that have one."""
+        with_ids = table not in ("BookAuthors", "ClubMemberships", "Loans")
+        ids, loaded, start = [], 0, time.perf_counter()
+        for chunk in chunked(rows, self.chunk_size):
+            with self.db.transaction() as conn:
+                with conn.cursor() as cur:
+                    if with_ids:
+                        cur.execute(f"SELECT nextval(pg_get_serial_sequence('{table.lower()}', 'id')) "
+                                    "FROM generate_series(1, %s)", (len(chunk),))
+                        chunk_ids = [row[0] for row in cur.fetchall()]
+                        chunk = [(row_id,) + row for row_id, row in zip(chunk_ids, chunk)]
+                        ids.extend(chunk_ids)
+                    copy_rows(cur, f"{table} ({'id, ' if with_ids else ''}{columns})", chunk)
+            loaded += len(chunk)
+            if self.progress:
+                of_total = f"/{total:,}" if total else ""
+                self.progress(f"  {table}: {loaded:,}{of_total} rows ({time.perf_counter() - start:.1f} s)")
+        return ids
+
+    def _name(self, n):
+        first = FIRST_NAMES[n % len(FIRST_NAMES)]
+        n //= len(FIRST_NAMES)
+        initial = chr(ord('A') + n % 26)
+        n //= 26
+        last = LAST_NAMES[n % len(LAST_NAMES)]
+        suffix = f" {n // len(LAST_NAMES) + 1}" if n >= len(LAST_NAMES) else ""
+        return f"{first} {initial}. {last}{suffix}"
+
+    def author_rows(self, count):
+        for n in range(count):
+            yield self._name(n), f"Author of {self.rng.randint(1, 40)} books."
+
+    def book_rows(self, count):
+        rng = self.rng
+        for _ in range(count):
+            title = " ".join(rng.choice(TITLE_WORDS) for _ in range(rng.randint(1, 5))).title()
+            yield title, rng.choice(GENRES), rng.randint(1900, self.today.year)
+
+    def book_author_rows(self, book_ids, author_ids):
+        rng = self.rng
+        for book_id in book_ids:
+            authors = {skewed_choice(rng, author_ids, 1.5) for _ in range(rng.choice((1, 1, 1, 2, 3)))}
+            for author_id in authors:
+                yield book_id, author_id
+
+    def member_rows(self, count):
+        for n in range(count):
+            username = f"reader{self.seed}_{n}"
+            yield username, "secret", 2, f"{username}@example.org", self._name(n * 7919)
+
+    def club_rows(self, count, member_ids):
+        rng = self.rng
+        for n in range(count):
+            name = f"{rng.choice(TITLE_WORDS).title()} {rng.choice(GENRES)} Club {self.seed}-{n}"
+            yield name, f"Readers of {rng.choice(GENRES).lower()} and more.", rng.choice(member_ids)
+
+    def membership_rows(self, club_ids, member_ids):
+        rng = self.rng
+        for club_id in club_ids:
+            for user_id in rng.sample(member_ids, min(len(member_ids), rng.randint(5, 60))):
+                yield club_id, user_id
+
+    def loan_rows(self, count, book_ids, member_ids):
+        """Returned history first, then active loans: one per book, at most 3 per member, some overdue."""
+        rng, today = self.rng, self.today
+        active = min(int(count * ACTIVE_LOAN_FRACTION), len(book_ids) // 2, len(member_ids) * MAX_ACTIVE_LOANS)
+        for _ in range(count - active):
+            borrowed = today - datetime.timedelta(days=rng.randint(LOAN_DAYS + 1, HISTORY_DAYS))
+            returned = min(borrowed + datetime.timedelta(days=rng.randint(1, 21)), today)
+            yield (skewed_choice(rng, book_ids), rng.choice(member_ids), borrowed,
+                   borrowed + datetime.timedelta(days=LOAN_DAYS), returned)
+
+        borrowers = rng.sample(member_ids, len(member_ids))
+        for n, book_id in enumerate(rng.sample(book_ids, active)):
+            borrowed = today - datetime.timedelta(days=rng.randint(0, 12))
+            yield (book_id, borrowers[n % len(borrowers)], borrowed,
+                   borrowed + datetime.timedelta(days=LOAN_DAYS), None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tier", choices=sorted(TIERS), default='small')
+    for name in TIERS['small']:
+        parser.add_argument(f"--{name}", type=int, help=f"override the tier's {name} count")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=GENERATE_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    counts = dict(TIERS[args.tier])
+    counts.update({name: getattr(args, name) for name in counts if getattr(args, name) is not None})
+
+    from databasemanager import DatabaseManager
+    db = DatabaseManager(minconn=1, maxconn=2)
+    if not db.pool:
+        raise SystemExit(1)
+    start = time.perf_counter()
+    try:
+        print("Generating " + ", ".join(f"{n:,} {name}" for name, n in counts.items()) + f" (seed {args.seed})")
+        DataGenerator(db, args.seed, args.chunk_size).run(**counts)
+    finally:
+        db.close()
+    print(f"Done in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,377 @@
+"""
+instrumentation.py
+Query instrumentation for DatabaseManager: per-method latency histograms, row and byte counts,
+errors, a slow-query log, optional EXPLAIN (ANALYZE, BUFFERS) capture for slow queries, and
+Prometheus text export.
+
+Slow statements are logged as their SQL text with the bound parameters replaced by their
+types, since parameters can hold passwords and member details; SLOW_QUERY_PARAMS shows the
+values, except for the CREDENTIAL_METHODS, which are never shown or EXPLAINed with them.
+
+Every public DatabaseManager method is wrapped by instrument_methods(), which times the call
+and makes it the "current method" on its thread. Pooled connections hand out
+InstrumentedCursor, which attributes each statement, its rows and an estimate of the bytes
+fetched to that method. All of it lands in the process-wide `registry`, which the app shows
+in its Diagnostics tab and can serve to Prometheus:
+
+    instrumentation.serve_metrics(9187)   # GET http://localhost:9187/metrics
+"""
+import bisect
+import collections
+import functools
+import http.server
+import inspect
+import logging
+import threading
+import time
+
+try:
+    import psycopg2
+    import psycopg2.extensions
+except ImportError:  # SQLite-only installs: method timings still work, statement hooks do not
+    psycopg2 = None
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implied
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_QUERY_MS = 200           # statements slower than this are logged
+SLOW_QUERY_PARAMS = False     # log slow statements with their parameter values, not just their types
+CREDENTIAL_METHODS = frozenset({'authenticate_user'})  # parameters never logged, statements never EXPLAINed
+EXPLAIN_SLOW_QUERIES = False  # also capture EXPLAIN (ANALYZE, BUFFERS); re-runs the statement, rolled back
+SLOW_QUERY_LOG_SIZE = 50      # most recent slow queries kept for the diagnostics panel
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'EXECUTE', 'VALUES', 'TABLE')
+
+log = logging.getLogger('smartlibrary.db')
+_context = threading.local()
+
+
+def current_method():
+    stack = getattr(_context, 'stack', None)
+    return stack[-1] if stack else 'unattributed'
+
+
+def _estimate_bytes(rows):
+    """Rough size of fetched rows: text and binary by length, everything else as 8 bytes."""
+    total = 0
+    for row in rows:
+        for value in row:
+            total += len(value) if isinstance(value, (str, bytes, memoryview)) else 8
+    return total
+
+
+class MethodStats:
+    def __init__(self):
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.errors = 0
+        self.statements = 0
+        self.rows = 0
+        self.bytes = 0
+        self.slow = 0
+
+    def observe(self, seconds):
+        self.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.calls += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (max for the overflow bucket)."""
+        if not self.calls:
+            return 0.0
+        rank, seen = q * self.calls, 0
+        for bound, count in zip(LATENCY_BUCKETS, self.bucket_counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max_seconds)
+        return self.max_seconds
+
+
+class QueryMetrics:
+    """Thread-safe registry of per-method statistics and recent slow queries."""
+
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS, explain=EXPLAIN_SLOW_QUERIES, params=SLOW_QUERY_PARAMS):
+        self.slow_query_ms = slow_query_ms
+        self.explain = explain
+        self.params = params
+        self.extra_counters = []  # callables returning [(metric name, help, {labels tuple: value})]
+        self._lock = threading.Lock()
+        self._methods = collections.defaultdict(MethodStats)
+        self._slow = collections.deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+    def record_call(self, method, seconds, failed):
+        with self._lock:
+            stats = self._methods[method]
+            stats.observe(seconds)
+            stats.errors += failed
+
+    def record_statement(self, method, failed, rows=0):
+        with self._lock:
+            stats = self._methods[method]
+            stats.statements += 1
+            stats.errors += failed
+            stats.rows += rows
+
+    def record_fetch(self, method, rows):
+        with self._lock:
+            stats = self._methods[method]
+            stats.bytes += _estimate_bytes(rows)
+
+    def record_slow(self, method, seconds, statement, plan):
+        entry = {'method': method, 'ms': round(seconds * 1000, 1), 'statement': statement,
+                 'plan': plan, 'at': time.strftime('%H:%M:%S')}
+        with self._lock:
+            self._methods[method].slow += 1
+            self._slow.append(entry)
+        log.warning("Slow query in %s (%.1f ms): %s%s", method, seconds * 1000, statement,
+                    f"\n{plan}" if plan else "")
+
+    def snapshot(self):
+        """[(method, MethodStats copy)] sorted by total time spent, most first."""
+        with self._lock:
+            items = [(name, self._copy(stats)) for name, stats in self._methods.items()]
+        return sorted(items, key=lambda item: item[1].seconds, reverse=True)
+
+    def slow_queries(self):
+        with self._lock:
+            return list(reversed(self._slow))
+
+    def reset(self):
+        with self._lock:
+            self._methods.clear()
+            self._slow.clear()
+
+    @staticmethod
+    def _copy(stats):
+        copy = MethodStats()
+        copy.__dict__.update(stats.__dict__, bucket_counts=list(stats.bucket_counts))
+        return copy
+
+    def prometheus_text(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        snapshot = self.snapshot()
+        name = 'smartlibrary_db_method_duration_seconds'
+        header(name, 'histogram', "DatabaseManager method latency.")
+        for method, stats in snapshot:
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + (float('inf'),), stats.bucket_counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{name}_bucket{{method="{method}",le="{le}"}} {cumulative}')
+            lines.append(f'{name}_sum{{method="{method}"}} {stats.seconds:.6f}')
+            lines.append(f'{name}_count{{method="{method}"}} {stats.calls}')
+
+        for field, metric, help_text in (
+                ('statements', 'statements_total', "SQL statements executed."),
+                ('rows', 'rows_total', "Rows returned or affected."),
+                ('bytes', 'fetched_bytes_total', "Estimated bytes fetched."),
+                ('errors', 'errors_total', "Failed statements and calls."),
+                ('slow', 'slow_queries_total', "Statements over the slow-query threshold.")):
+            header(f'smartlibrary_db_{metric}', 'counter', help_text)
+            for method, stats in snapshot:
+                lines.append(f'smartlibrary_db_{metric}{{method="{method}"}} {getattr(stats, field)}')
+
+        for collect in self.extra_counters:
+            for metric, help_text, values in collect():
+                header(metric, 'counter', help_text)
+                for labels, value in values.items():
+                    label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+                    lines.append(f"{metric}{{{label_text}}} {value}" if label_text else f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = QueryMetrics()
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor if psycopg2 else object):
+    """Cursor that reports every statement to the registry under the current method."""
+
+    def execute(self, query, vars=None):
+        method, start, failed = current_method(), time.perf_counter(), True
+        try:
+            result = super().execute(query, vars)
+            failed = False
+            return result
+        except psycopg2.Error as e:
+            log.warning("Query failed in %s: %s", method, str(e).splitlines()[0] if str(e) else type(e).__name__)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            registry.record_statement(method, failed, 0 if failed else max(self.rowcount, 0))
+            if elapsed * 1000 >= registry.slow_query_ms:
+                self._report_slow(method, elapsed, query, vars, failed)
+
+    def copy_expert(self, sql, file, size=8192):
+        method, failed = current_method(), True
+        try:
+            result = super().copy_expert(sql, file, size)
+            failed = False
+            return result
+        finally:
+            registry.record_statement(method, failed, 0 if failed else max(self.rowcount, 0))
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            registry.record_fetch(current_method(), (row,))
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(size) if size is not None else super().fetchmany()
+        registry.record_fetch(current_method(), rows)
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        registry.record_fetch(current_method(), rows)
+        return rows
+
+    def __iter__(self):
+        # Iterating a cursor fetches in batches; account per batch, not per row
+        while True:
+            rows = self.fetchmany(self.itersize)
+            if not rows:
+                return
+            yield from rows
+
+    def _report_slow(self, method, elapsed, query, vars, failed):
+        statement = query.decode('utf-8', 'replace') if isinstance(query, bytes) else str(query)
+        if vars:
+            if registry.params and method not in CREDENTIAL_METHODS:
+                statement += f"\n-- params: {vars!r}"
+            else:
+                values = vars.values() if isinstance(vars, dict) else vars
+                statement += f"\n-- params: {', '.join(type(value).__name__ for value in values)}"
+        plan = None
+        if registry.explain and not failed and self.name is None and method not in CREDENTIAL_METHODS:
+            plan = self._explain(query, vars)
+        # Show the SQL behind a prepared statement (see databasemanager.StatementCache)
+        prepared = getattr(self.connection, 'prepared', None)
+        if prepared and statement.startswith("EXECUTE "):
+            name = statement.split()[1]
+            source = next((sql for sql, ps_name in prepared.items() if ps_name == name), None)
+            if source:
+                statement += f"\n-- {name}: {' '.join(source.split())}"
+        registry.record_slow(method, elapsed, statement, plan)
+
+    def _explain(self, query, vars):
+        """EXPLAIN (ANALYZE, BUFFERS) of the statement, run and then rolled back."""
+        if isinstance(query, bytes):
+            query = query.decode('utf-8', 'replace')
+        if not str(query).lstrip().upper().startswith(EXPLAINABLE):
+            return None
+        conn = self.connection
+        status = conn.get_transaction_status()
+        if status == psycopg2.extensions.TRANSACTION_STATUS_IDLE and conn.autocommit:
+            begin, end = "BEGIN", "ROLLBACK"
+        elif status == psycopg2.extensions.TRANSACTION_STATUS_INTRANS:
+            begin, end = "SAVEPOINT explain_slow_query", "ROLLBACK TO SAVEPOINT explain_slow_query"
+        else:
+            return None
+        try:
+            with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+                cur.execute(begin)
+                try:
+                    cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + str(query), vars)
+                    return "\n".join(row[0] for row in cur.fetchall())
+                finally:
+                    cur.execute(end)
+        except psycopg2.Error as e:
+            return f"(EXPLAIN failed: {str(e).splitlines()[0]})"
+
+
+def _method_stack():
+    stack = getattr(_context, 'stack', None)
+    if stack is None:
+        stack = _context.stack = []
+    return stack
+
+
+def instrument_methods(exclude=()):
+    """Class decorator: times every public method and attributes its statements to it.
+
+    Generator methods (streaming queries) are timed over the whole iteration, counting
+    only the time spent producing rows, not the caller's time between them.
+    """
+
+    def wrap(fn, name):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            stack = _method_stack()
+            stack.append(name)
+            start, failed = time.perf_counter(), True
+            try:
+                result = fn(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                stack.pop()
+                registry.record_call(name, time.perf_counter() - start, failed)
+        return timed
+
+    def wrap_generator(fn, name):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            gen = fn(*args, **kwargs)
+            seconds, failed = 0.0, True
+            try:
+                while True:
+                    # The method is "current" only while the generator runs, not while the caller does
+                    stack = _method_stack()
+                    stack.append(name)
+                    start = time.perf_counter()
+                    try:
+                        item = next(gen)
+                    except StopIteration:
+                        failed = False
+                        return
+                    finally:
+                        seconds += time.perf_counter() - start
+                        stack.pop()
+                    yield item
+            except GeneratorExit:
+                failed = False  # the caller stopped early
+                raise
+            finally:
+                gen.close()
+                registry.record_call(name, seconds, failed)
+        return timed
+
+    def decorate(cls):
+        for name, attr in list(vars(cls).items()):
+            if not name.startswith('_') and name not in exclude and callable(attr):
+                wrapper = wrap_generator if inspect.isgeneratorfunction(attr) else wrap
+                setattr(cls, name, wrapper(attr, name))
+        return cls
+
+    return decorate
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = registry.prometheus_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port, host='127.0.0.1'):
+    """Serves /metrics for Prometheus on a daemon thread. Returns the server (call shutdown() to stop)."""
+    server = http.server.ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
@@ -0,0 +1,67 @@
+"""
+maintenance.py
+Scheduled database jobs for SmartLibrary. Meant to be run from cron or a task scheduler:
+
+    python maintenance.py reconcile-stats      # nightly
+    python maintenance.py refresh-popularity   # every few minutes
+    python maintenance.py prune-tombstones --snapshot /data/smartlibrary   # daily, after the export
+
+prune-tombstones deletes the DeletedRows entries that every snapshot has already exported;
+pass --snapshot once for each snapshot.py --output in use.
+"""
+import argparse
+
+import snapshot
+
+
+def reconcile_stats(db, args):
+    if db.reconcile_library_stats():
+        print("LibraryStats had drifted and was rebuilt.")
+    else:
+        print("LibraryStats is consistent.")
+
+
+def refresh_popularity(db, args):
+    if db.refresh_popular_books():
+        print("Popularity counters refreshed.")
+    else:
+        print("Another session is already refreshing popularity counters.")
+
+
+def prune_tombstones(db, args):
+    watermarks = [snapshot.read_watermark(path) for path in args.snapshot]
+    if None in watermarks:
+        print("A snapshot has not finished its first export yet; no tombstones pruned.")
+        return
+    oldest = min(watermarks)
+    print(f"Pruned {db.prune_deleted_rows(oldest)} tombstones recorded before {oldest.isoformat()}.")
+
+
+JOBS = {
+    'reconcile-stats': reconcile_stats,
+    'refresh-popularity': refresh_popularity,
+    'prune-tombstones': prune_tombstones,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a SmartLibrary maintenance job.")
+    parser.add_argument("job", choices=sorted(JOBS))
+    parser.add_argument("--snapshot", action="append", default=[], metavar="DIR",
+                        help="snapshot directory whose watermark bounds prune-tombstones (repeatable)")
+    args = parser.parse_args()
+    if args.job == 'prune-tombstones' and not args.snapshot:
+        parser.error("prune-tombstones needs --snapshot for every snapshot directory in use")
+
+    from databasemanager import DatabaseManager
+    db = DatabaseManager(minconn=1, maxconn=1)
+    if not db.pool:
+        raise SystemExit(1)
+    try:
+        JOBS[args.job](db, args)
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+migrate.py
+Versioned schema migrations for a live SmartLibrary database.
+
+smart_library.sql is the baseline schema. Later changes live in migrations/ as numbered files
+(0001_name.sql, 0002_name.sql, ...) and are applied in order, each recorded in schema_version.
+0000 adds what was once written into smart_library.sql directly (search, dashboard counters,
+atomic checkout); it is re-runnable, so databases that already have those objects take it too:
+
+    python migrate.py             # apply pending migrations
+    python migrate.py status      # list applied and pending migrations
+    python migrate.py up --target 3
+
+A migration runs in a single transaction, together with its schema_version row. Files whose
+first line is '-- migrate: no-transaction' run statement by statement instead, which
+CREATE INDEX CONCURRENTLY requires; such files should be safe to re-run (DROP ... IF EXISTS
+first), since a failure part-way leaves earlier statements applied. Statements in those files
+are split on ';' at the end of a line, so they must not contain dollar-quoted bodies.
+"""
+import argparse
+import hashlib
+import os
+import re
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_FILE = re.compile(r"^(\d+)_(\w+)\.sql$")
+NO_TRANSACTION_MARKER = "-- migrate: no-transaction"
+
+SCHEMA_VERSION_DDL = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INT PRIMARY KEY,
+        name TEXT NOT NULL,
+        checksum TEXT NOT NULL,
+        applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+
+class MigrationError(Exception):
+    pass
+
+
+class Migration:
+    def __init__(self, version, name, path):
+        self.version = version
+        self.name = name
+        self.path = path
+        with open(path, encoding="utf-8") as f:
+            self.sql = f.read()
+        self.checksum = hashlib.sha256(self.sql.encode("utf-8")).hexdigest()
+        self.transactional = not self.sql.lstrip().startswith(NO_TRANSACTION_MARKER)
+
+    def statements(self):
+        """The file split into single statements (for no-transaction migrations)."""
+        body = "\n".join(line for line in self.sql.splitlines() if not line.lstrip().startswith("--"))
+        return [s.strip() for s in re.split(r";\s*$", body, flags=re.MULTILINE) if s.strip()]
+
+    def __str__(self):
+        return f"{self.version:04d}_{self.name}"
+
+
+def discover(directory=MIGRATIONS_DIR):
+    """All migrations in the directory, ordered by version."""
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = MIGRATION_FILE.match(filename)
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise MigrationError("Two migration files share a version number.")
+    return sorted(migrations, key=lambda m: m.version)
+
+
+class MigrationRunner:
+    """Applies pending migrations over one pooled connection.
+
+    Holds a session advisory lock while running, so two runners against the same
+    database cannot interleave.
+    """
+
+    def __init__(self, db, directory=MIGRATIONS_DIR):
+        self.db = db
+        self.migrations = discover(directory)
+
+    def applied(self, cur):
+        cur.execute(SCHEMA_VERSION_DDL)
+        cur.execute("SELECT version, checksum FROM schema_version")
+        return dict(cur.fetchall())
+
+    def status(self):
+        """[(migration, applied?)] in version order. Raises if an applied file was edited."""
+        with self.db.cursor() as cur:
+            applied = self.applied(cur)
+        self._check_unchanged(applied)
+        return [(m, m.version in applied) for m in self.migrations]
+
+    def run(self, target=None, progress=print):
+        """Applies pending migrations up to target (default: all). Returns the ones applied."""
+        done = []
+        with self.db.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(hashtext('smart_library_migrate'))")
+            try:
+                applied = self.applied(cur)
+                self._check_unchanged(applied)
+                for migration in self.migrations:
+                    if migration.version in applied or (target is not None and migration.version > target):
+                        continue
+                    progress(f"Applying {migration} ...")
+                    self._apply(cur, migration)
+                    done.append(migration)
+            finally:
+                cur.execute("SELECT pg_advisory_unlock(hashtext('smart_library_migrate'))")
+        return done
+
+    def _apply(self, cur, migration):
+        record = ("INSERT INTO schema_version (version, name, checksum) VALUES (%s, %s, %s)",
+                  (migration.version, migration.name, migration.checksum))
+        if migration.transactional:
+            cur.execute("BEGIN")
+            try:
+                cur.execute(migration.sql)
+                cur.execute(*record)
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+        else:
+            for statement in migration.statements():
+                cur.execute(statement)
+            cur.execute(*record)
+
+    def _check_unchanged(self, applied):
+        for migration in self.migrations:
+            checksum = applied.get(migration.version)
+            if checksum is not None and checksum != migration.checksum:
+                raise MigrationError(f"{migration} was edited after it was applied; add a new migration instead.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply SmartLibrary schema migrations.")
+    parser.add_argument("command", nargs="?", choices=["up", "status"], default="up")
+    parser.add_argument("--target", type=int, help="stop after this version")
+    args = parser.parse_args()
+
+    from databasemanager import DatabaseManager
+    db = DatabaseManager(minconn=1, maxconn=1)
+    if not db.pool:
+        raise SystemExit(1)
+    try:
+        runner = MigrationRunner(db)
+        if args.command == "status":
+            for migration, is_applied in runner.status():
+                print(f"  [{'x' if is_applied else ' '}] {migration}")
+        else:
+            done = runner.run(args.target)
+            print(f"{len(done)} migration(s) applied." if done else "Database is up to date.")
+    except MigrationError as e:
+        raise SystemExit(str(e))
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
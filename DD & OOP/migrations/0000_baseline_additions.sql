@@ -0,0 +1,475 @@
+-- Schema objects added to smart_library.sql before migrations/ existed: catalog search
+-- (search_document, trigram indexes), the LibraryStats / ActiveLoansByDueDate dashboard
+-- counters, popularity counters, per-member active_loans with the atomic checkout_book(),
+-- one active loan per copy, and the statement-level triggers that keep them current.
+-- Brings a database created from the baseline smart_library.sql up to date. Everything
+-- is re-runnable: on a database that already has these objects it only re-asserts them
+-- and rebuilds the derived data (search documents, counters, popularity).
+
+-- Trigram matching for substring catalog search (search-as-you-type)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Per-member count of active loans, maintained by the Loans triggers below
+ALTER TABLE Users ADD COLUMN IF NOT EXISTS active_loans INT NOT NULL DEFAULT 0;
+-- Title, author names and genre; maintained by triggers below
+ALTER TABLE Books ADD COLUMN IF NOT EXISTS search_document tsvector;
+
+-- Dashboard counters in a single row, maintained by the stats_track_* triggers below.
+-- Borrowed books = total_books - available_books.
+CREATE TABLE IF NOT EXISTS LibraryStats (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id), -- enforces a single row
+    total_books INT NOT NULL DEFAULT 0,
+    available_books INT NOT NULL DEFAULT 0,
+    members INT NOT NULL DEFAULT 0,
+    clubs INT NOT NULL DEFAULT 0,
+    active_loans INT NOT NULL DEFAULT 0
+);
+INSERT INTO LibraryStats DEFAULT VALUES ON CONFLICT DO NOTHING;
+
+-- Active loans per due date. Loans become overdue as days pass without any write, so the
+-- overdue count is summed from this small table (one row per due date) at read time.
+CREATE TABLE IF NOT EXISTS ActiveLoansByDueDate (
+    due_date DATE PRIMARY KEY,
+    active_loans INT NOT NULL DEFAULT 0
+);
+
+-- Popularity counters, maintained by the Loans trigger below (see DatabaseManager.get_popular_books)
+CREATE TABLE IF NOT EXISTS BookLoanStats (
+    book_id INT PRIMARY KEY REFERENCES Books(id) ON DELETE CASCADE,
+    total_loans INT NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_bookloanstats_top ON BookLoanStats (total_loans DESC, book_id);
+
+-- Loans per book per day, kept for the last 30 days only (pruned by refresh_popular_books)
+CREATE TABLE IF NOT EXISTS BookLoanDaily (
+    book_id INT NOT NULL REFERENCES Books(id) ON DELETE CASCADE,
+    loan_date DATE NOT NULL,
+    loans INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (book_id, loan_date)
+);
+
+-- A copy can only be out on one active loan, however the loan was inserted
+CREATE UNIQUE INDEX IF NOT EXISTS idx_loans_one_active_per_book ON Loans (book_id) WHERE return_date IS NULL;
+
+-- Catalog keyset pagination: one (sort key, id) index per sort option in DatabaseManager.get_books_page
+CREATE INDEX IF NOT EXISTS idx_books_title_id ON Books (title, id);
+CREATE INDEX IF NOT EXISTS idx_books_year_id ON Books ((COALESCE(publication_year, 0)), id);
+
+-- Full-text catalog search (DatabaseManager.search_books)
+CREATE INDEX IF NOT EXISTS idx_books_search_document ON Books USING GIN (search_document);
+
+-- Substring (ILIKE '%...%') catalog search via pg_trgm
+CREATE INDEX IF NOT EXISTS idx_books_title_trgm ON Books USING GIN (title gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_books_genre_trgm ON Books USING GIN (genre gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_authors_name_trgm ON Authors USING GIN (name gin_trgm_ops);
+
+-- Function: Enforce Max 3 Loans Rule [cite: 146]
+-- Takes a slot on the member's active_loans counter. The conditional UPDATE locks the
+-- member row, so concurrent borrows by the same member are checked one at a time.
+CREATE OR REPLACE FUNCTION prevent_excess_loans()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.return_date IS NULL THEN
+        UPDATE Users SET active_loans = active_loans + 1 WHERE id = NEW.user_id AND active_loans < 3;
+        IF NOT FOUND AND EXISTS (SELECT 1 FROM Users WHERE id = NEW.user_id) THEN
+            RAISE EXCEPTION 'Member cannot have more than 3 active loans';
+        END IF;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function: Give the member's loan slot back when a loan is returned (or an active loan deleted)
+CREATE OR REPLACE FUNCTION release_loan_slot()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        IF OLD.return_date IS NULL THEN
+            UPDATE Users SET active_loans = active_loans - 1 WHERE id = OLD.user_id;
+        END IF;
+        RETURN OLD;
+    END IF;
+    IF OLD.return_date IS NULL AND NEW.return_date IS NOT NULL THEN
+        UPDATE Users SET active_loans = active_loans - 1 WHERE id = NEW.user_id;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function: Atomic checkout (DatabaseManager.checkout_book). Locks the member row first,
+-- then the book row with SKIP LOCKED, so two desks racing for the same copy never queue
+-- behind each other: one gets it, the other gets 'book_busy' straight away.
+-- status is one of: ok, user_not_found, loan_limit, book_not_found, book_unavailable, book_busy.
+CREATE OR REPLACE FUNCTION checkout_book(p_user_id INT, p_book_id INT,
+                                         OUT status TEXT, OUT loan_id INT, OUT loan_due_date DATE)
+AS $$
+DECLARE
+    loans_held INT;
+    book_available BOOLEAN;
+BEGIN
+    SELECT active_loans INTO loans_held FROM Users WHERE id = p_user_id FOR NO KEY UPDATE;
+    IF NOT FOUND THEN
+        status := 'user_not_found';
+        RETURN;
+    END IF;
+    IF loans_held >= 3 THEN
+        status := 'loan_limit';
+        RETURN;
+    END IF;
+
+    PERFORM 1 FROM Books WHERE id = p_book_id AND available FOR NO KEY UPDATE SKIP LOCKED;
+    IF NOT FOUND THEN
+        SELECT available INTO book_available FROM Books WHERE id = p_book_id;
+        status := CASE WHEN NOT FOUND THEN 'book_not_found'
+                       WHEN book_available THEN 'book_busy'
+                       ELSE 'book_unavailable' END;
+        RETURN;
+    END IF;
+
+    INSERT INTO Loans (book_id, user_id, borrow_date, due_date)
+    VALUES (p_book_id, p_user_id, CURRENT_DATE, CURRENT_DATE + 7)
+    RETURNING id, due_date INTO loan_id, loan_due_date;
+    status := 'ok';
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function: Build a book's search document (title weighted A, authors B, genre C)
+CREATE OR REPLACE FUNCTION book_search_document(p_title TEXT, p_genre TEXT, p_book_id INT)
+RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('simple', coalesce(p_title, '')), 'A') ||
+           setweight(to_tsvector('simple', coalesce(
+               (SELECT string_agg(a.name, ' ')
+                FROM BookAuthors ba JOIN Authors a ON a.id = ba.author_id
+                WHERE ba.book_id = p_book_id), '')), 'B') ||
+           setweight(to_tsvector('simple', coalesce(p_genre, '')), 'C');
+$$ LANGUAGE sql STABLE;
+
+-- Function: Keep search_document current when a book's title or genre changes
+CREATE OR REPLACE FUNCTION update_book_search_document()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.search_document := book_search_document(NEW.title, NEW.genre, NEW.id);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function: Rebuild search documents for books whose author links changed (statement-level)
+CREATE OR REPLACE FUNCTION refresh_search_on_relink()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE Books b SET search_document = book_search_document(b.title, b.genre, b.id)
+    WHERE b.id IN (SELECT DISTINCT book_id FROM changed_links);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function: Rebuild search documents for an author's books when the author is renamed
+CREATE OR REPLACE FUNCTION refresh_search_on_author_rename()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.name IS DISTINCT FROM OLD.name THEN
+        UPDATE Books b SET search_document = book_search_document(b.title, b.genre, b.id)
+        FROM BookAuthors ba
+        WHERE ba.book_id = b.id AND ba.author_id = NEW.id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function: Tell catalog caches (catalogcache.py) which books changed. Statement-level, so a
+-- multi-row change sends one notification. Payload: {"table": ..., "ids": [book ids]}
+CREATE OR REPLACE FUNCTION notify_catalog_change()
+RETURNS TRIGGER AS $$
+DECLARE
+    changed_ids INT[];
+BEGIN
+    IF TG_TABLE_NAME = 'books' THEN
+        SELECT array_agg(DISTINCT id) INTO changed_ids FROM changed_rows;
+    ELSIF TG_TABLE_NAME = 'authors' THEN
+        SELECT array_agg(DISTINCT ba.book_id) INTO changed_ids
+        FROM BookAuthors ba WHERE ba.author_id IN (SELECT id FROM changed_rows);
+    ELSE
+        SELECT array_agg(DISTINCT book_id) INTO changed_ids FROM changed_rows;
+    END IF;
+
+    IF changed_ids IS NULL THEN
+        RETURN NULL;
+    END IF;
+    -- NOTIFY payloads are capped at 8000 bytes; past that, listeners reload everything
+    IF array_length(changed_ids, 1) > 500 THEN
+        changed_ids := NULL;
+    END IF;
+    PERFORM pg_notify('catalog_changes', json_build_object('table', TG_TABLE_NAME, 'ids', changed_ids)::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function: Count new loans per book, all-time and per day (statement-level, batched)
+CREATE OR REPLACE FUNCTION count_book_loans()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO BookLoanStats (book_id, total_loans)
+    SELECT book_id, COUNT(*) FROM new_loans GROUP BY book_id
+    ON CONFLICT (book_id) DO UPDATE SET total_loans = BookLoanStats.total_loans + EXCLUDED.total_loans;
+
+    INSERT INTO BookLoanDaily (book_id, loan_date, loans)
+    SELECT book_id, borrow_date, COUNT(*) FROM new_loans
+    WHERE borrow_date > CURRENT_DATE - 30
+    GROUP BY book_id, borrow_date
+    ON CONFLICT (book_id, loan_date) DO UPDATE SET loans = BookLoanDaily.loans + EXCLUDED.loans;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function: Rebuild the popularity counters from Loans (after bulk loads or if they drift)
+CREATE OR REPLACE FUNCTION rebuild_popularity()
+RETURNS void AS $$
+BEGIN
+    TRUNCATE BookLoanStats, BookLoanDaily;
+    INSERT INTO BookLoanStats (book_id, total_loans)
+    SELECT book_id, COUNT(*) FROM Loans GROUP BY book_id;
+    INSERT INTO BookLoanDaily (book_id, loan_date, loans)
+    SELECT book_id, borrow_date, COUNT(*) FROM Loans
+    WHERE borrow_date > CURRENT_DATE - 30
+    GROUP BY book_id, borrow_date;
+    REFRESH MATERIALIZED VIEW PopularBooksRecent;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Functions: Keep LibraryStats current. Statement-level so multi-row changes cost one
+-- counter update, and the counter row is only written when a count actually changes.
+CREATE OR REPLACE FUNCTION stats_track_books()
+RETURNS TRIGGER AS $$
+DECLARE
+    d_total INT := 0;
+    d_available INT := 0;
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT d_total + COUNT(*), d_available + COUNT(*) FILTER (WHERE available)
+        INTO d_total, d_available FROM new_rows;
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        SELECT d_total - COUNT(*), d_available - COUNT(*) FILTER (WHERE available)
+        INTO d_total, d_available FROM old_rows;
+    END IF;
+    IF d_total <> 0 OR d_available <> 0 THEN
+        UPDATE LibraryStats SET total_books = total_books + d_total,
+                                available_books = available_books + d_available;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION stats_track_users()
+RETURNS TRIGGER AS $$
+DECLARE
+    d_members INT := 0;
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT d_members + COUNT(*) INTO d_members FROM new_rows WHERE role_id = 2;
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        SELECT d_members - COUNT(*) INTO d_members FROM old_rows WHERE role_id = 2;
+    END IF;
+    IF d_members <> 0 THEN
+        UPDATE LibraryStats SET members = members + d_members;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION stats_track_clubs()
+RETURNS TRIGGER AS $$
+DECLARE
+    d_clubs INT := 0;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT COUNT(*) INTO d_clubs FROM new_rows;
+    ELSE
+        SELECT -COUNT(*) INTO d_clubs FROM old_rows;
+    END IF;
+    IF d_clubs <> 0 THEN
+        UPDATE LibraryStats SET clubs = clubs + d_clubs;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION stats_track_loans()
+RETURNS TRIGGER AS $$
+DECLARE
+    due_dates DATE[];
+    deltas INT[];
+    net INT;
+BEGIN
+    -- Per-due-date change in active loans: +1 for each loan that became active, -1 for each that stopped
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(due_date), array_agg(d) INTO due_dates, deltas
+        FROM (SELECT due_date, COUNT(*)::INT AS d FROM new_rows
+              WHERE return_date IS NULL GROUP BY due_date) c;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(due_date), array_agg(d) INTO due_dates, deltas
+        FROM (SELECT due_date, -COUNT(*)::INT AS d FROM old_rows
+              WHERE return_date IS NULL GROUP BY due_date) c;
+    ELSE
+        SELECT array_agg(due_date), array_agg(d) INTO due_dates, deltas
+        FROM (SELECT due_date, SUM(d)::INT AS d FROM (
+                  SELECT n.due_date, 1 AS d FROM new_rows n JOIN old_rows o ON o.id = n.id
+                  WHERE n.return_date IS NULL AND (o.return_date IS NOT NULL OR o.due_date <> n.due_date)
+                  UNION ALL
+                  SELECT o.due_date, -1 FROM new_rows n JOIN old_rows o ON o.id = n.id
+                  WHERE o.return_date IS NULL AND (n.return_date IS NOT NULL OR o.due_date <> n.due_date)
+              ) x GROUP BY due_date HAVING SUM(d) <> 0) c;
+    END IF;
+
+    IF due_dates IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO ActiveLoansByDueDate (due_date, active_loans)
+    SELECT * FROM unnest(due_dates, deltas)
+    ON CONFLICT (due_date) DO UPDATE SET active_loans = ActiveLoansByDueDate.active_loans + EXCLUDED.active_loans;
+
+    SELECT SUM(d) INTO net FROM unnest(deltas) AS d;
+    IF net <> 0 THEN
+        UPDATE LibraryStats SET active_loans = active_loans + net;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function: Rebuild LibraryStats, ActiveLoansByDueDate and the members' active_loans
+-- counters from the base tables. Returns TRUE if any had drifted. Blocks counter updates
+-- while it runs.
+CREATE OR REPLACE FUNCTION reconcile_library_stats()
+RETURNS BOOLEAN AS $$
+DECLARE
+    stored LibraryStats%ROWTYPE;
+    actual LibraryStats%ROWTYPE;
+    buckets_drifted BOOLEAN;
+    members_fixed INT;
+BEGIN
+    LOCK TABLE Loans IN SHARE MODE;
+    LOCK TABLE LibraryStats, ActiveLoansByDueDate IN EXCLUSIVE MODE;
+
+    UPDATE Users u SET active_loans = COALESCE(l.active, 0)
+    FROM Users u2
+    LEFT JOIN (SELECT user_id, COUNT(*)::INT AS active FROM Loans
+               WHERE return_date IS NULL GROUP BY user_id) l ON l.user_id = u2.id
+    WHERE u.id = u2.id AND u.active_loans <> COALESCE(l.active, 0);
+    GET DIAGNOSTICS members_fixed = ROW_COUNT;
+
+    SELECT * INTO stored FROM LibraryStats;
+    SELECT TRUE,
+           (SELECT COUNT(*) FROM Books),
+           (SELECT COUNT(*) FROM Books WHERE available),
+           (SELECT COUNT(*) FROM Users WHERE role_id = 2),
+           (SELECT COUNT(*) FROM BookClubs),
+           (SELECT COUNT(*) FROM Loans WHERE return_date IS NULL)
+    INTO actual;
+
+    SELECT EXISTS (
+        SELECT due_date, COUNT(*)::INT FROM Loans WHERE return_date IS NULL GROUP BY due_date
+        EXCEPT
+        SELECT due_date, active_loans FROM ActiveLoansByDueDate WHERE active_loans <> 0
+    ) OR EXISTS (
+        SELECT due_date, active_loans FROM ActiveLoansByDueDate WHERE active_loans <> 0
+        EXCEPT
+        SELECT due_date, COUNT(*)::INT FROM Loans WHERE return_date IS NULL GROUP BY due_date
+    ) INTO buckets_drifted;
+
+    UPDATE LibraryStats SET total_books = actual.total_books, available_books = actual.available_books,
+                            members = actual.members, clubs = actual.clubs, active_loans = actual.active_loans;
+
+    -- Also drops the zero rows left behind by past due dates
+    DELETE FROM ActiveLoansByDueDate;
+    INSERT INTO ActiveLoansByDueDate (due_date, active_loans)
+    SELECT due_date, COUNT(*) FROM Loans WHERE return_date IS NULL GROUP BY due_date;
+
+    RETURN stored IS DISTINCT FROM actual OR buckets_drifted OR members_fixed > 0;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Popularity over the last 7 / 30 days. Built from BookLoanDaily, so a refresh reads at most
+-- 30 days of per-book buckets no matter how long the loan history is. Refreshed
+-- concurrently by DatabaseManager.refresh_popular_books (run on a schedule by the app;
+-- pg_cron works too).
+CREATE MATERIALIZED VIEW IF NOT EXISTS PopularBooksRecent AS
+SELECT book_id,
+       COALESCE(SUM(loans) FILTER (WHERE loan_date > CURRENT_DATE - 7), 0)::INT AS loans_7d,
+       SUM(loans)::INT AS loans_30d
+FROM BookLoanDaily
+WHERE loan_date > CURRENT_DATE - 30
+GROUP BY book_id;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_popular_recent_book ON PopularBooksRecent (book_id);
+CREATE INDEX IF NOT EXISTS idx_popular_recent_7d ON PopularBooksRecent (loans_7d DESC, book_id);
+CREATE INDEX IF NOT EXISTS idx_popular_recent_30d ON PopularBooksRecent (loans_30d DESC, book_id);
+
+-- All-time popularity; top-N is an index scan on idx_bookloanstats_top
+CREATE OR REPLACE VIEW PopularBooksReport AS
+SELECT b.title, b.genre, s.total_loans AS times_borrowed, b.id AS book_id
+FROM BookLoanStats s
+JOIN Books b ON b.id = s.book_id
+WHERE s.total_loans > 0
+ORDER BY s.total_loans DESC, s.book_id;
+
+-- Triggers are replaced, not stacked, when this runs again
+DROP TRIGGER IF EXISTS tr_books_stats_insert ON Books;
+DROP TRIGGER IF EXISTS tr_books_stats_update ON Books;
+DROP TRIGGER IF EXISTS tr_books_stats_delete ON Books;
+DROP TRIGGER IF EXISTS tr_users_stats_insert ON Users;
+DROP TRIGGER IF EXISTS tr_users_stats_update ON Users;
+DROP TRIGGER IF EXISTS tr_users_stats_delete ON Users;
+DROP TRIGGER IF EXISTS tr_clubs_stats_insert ON BookClubs;
+DROP TRIGGER IF EXISTS tr_clubs_stats_delete ON BookClubs;
+DROP TRIGGER IF EXISTS tr_loans_stats_insert ON Loans;
+DROP TRIGGER IF EXISTS tr_loans_stats_update ON Loans;
+DROP TRIGGER IF EXISTS tr_loans_stats_delete ON Loans;
+DROP TRIGGER IF EXISTS tr_loans_count_popularity ON Loans;
+DROP TRIGGER IF EXISTS tr_books_notify_insert ON Books;
+DROP TRIGGER IF EXISTS tr_books_notify_update ON Books;
+DROP TRIGGER IF EXISTS tr_books_notify_delete ON Books;
+DROP TRIGGER IF EXISTS tr_bookauthors_notify_insert ON BookAuthors;
+DROP TRIGGER IF EXISTS tr_bookauthors_notify_delete ON BookAuthors;
+DROP TRIGGER IF EXISTS tr_authors_notify_update ON Authors;
+DROP TRIGGER IF EXISTS tr_loans_notify_insert ON Loans;
+DROP TRIGGER IF EXISTS tr_loans_notify_update ON Loans;
+DROP TRIGGER IF EXISTS tr_book_search_document ON Books;
+DROP TRIGGER IF EXISTS tr_bookauthors_search_insert ON BookAuthors;
+DROP TRIGGER IF EXISTS tr_bookauthors_search_delete ON BookAuthors;
+DROP TRIGGER IF EXISTS tr_author_search_rename ON Authors;
+DROP TRIGGER IF EXISTS tr_loan_release_slot ON Loans;
+
+-- Derived data for the rows that already exist (before the triggers, which would only
+-- add to the counters being rebuilt here)
+UPDATE Books SET search_document = book_search_document(title, genre, id);
+SELECT reconcile_library_stats();
+SELECT rebuild_popularity();
+ALTER TABLE Users DROP CONSTRAINT IF EXISTS check_loan_limit;
+ALTER TABLE Users ADD CONSTRAINT check_loan_limit CHECK (active_loans BETWEEN 0 AND 3);
+
+CREATE TRIGGER tr_books_stats_insert AFTER INSERT ON Books REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_track_books();
+CREATE TRIGGER tr_books_stats_update AFTER UPDATE ON Books REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_track_books();
+CREATE TRIGGER tr_books_stats_delete AFTER DELETE ON Books REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_track_books();
+CREATE TRIGGER tr_users_stats_insert AFTER INSERT ON Users REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_track_users();
+CREATE TRIGGER tr_users_stats_update AFTER UPDATE ON Users REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_track_users();
+CREATE TRIGGER tr_users_stats_delete AFTER DELETE ON Users REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_track_users();
+CREATE TRIGGER tr_clubs_stats_insert AFTER INSERT ON BookClubs REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_track_clubs();
+CREATE TRIGGER tr_clubs_stats_delete AFTER DELETE ON BookClubs REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_track_clubs();
+CREATE TRIGGER tr_loans_stats_insert AFTER INSERT ON Loans REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_track_loans();
+CREATE TRIGGER tr_loans_stats_update AFTER UPDATE ON Loans REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_track_loans();
+CREATE TRIGGER tr_loans_stats_delete AFTER DELETE ON Loans REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION stats_track_loans();
+CREATE TRIGGER tr_loans_count_popularity AFTER INSERT ON Loans REFERENCING NEW TABLE AS new_loans FOR EACH STATEMENT EXECUTE FUNCTION count_book_loans();
+CREATE TRIGGER tr_books_notify_insert AFTER INSERT ON Books REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION notify_catalog_change();
+CREATE TRIGGER tr_books_notify_update AFTER UPDATE ON Books REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION notify_catalog_change();
+CREATE TRIGGER tr_books_notify_delete AFTER DELETE ON Books REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION notify_catalog_change();
+CREATE TRIGGER tr_bookauthors_notify_insert AFTER INSERT ON BookAuthors REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION notify_catalog_change();
+CREATE TRIGGER tr_bookauthors_notify_delete AFTER DELETE ON BookAuthors REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION notify_catalog_change();
+CREATE TRIGGER tr_authors_notify_update AFTER UPDATE ON Authors REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION notify_catalog_change();
+CREATE TRIGGER tr_loans_notify_insert AFTER INSERT ON Loans REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION notify_catalog_change();
+CREATE TRIGGER tr_loans_notify_update AFTER UPDATE ON Loans REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION notify_catalog_change();
+CREATE TRIGGER tr_book_search_document BEFORE INSERT OR UPDATE OF title, genre ON Books FOR EACH ROW EXECUTE FUNCTION update_book_search_document();
+CREATE TRIGGER tr_bookauthors_search_insert AFTER INSERT ON BookAuthors REFERENCING NEW TABLE AS changed_links FOR EACH STATEMENT EXECUTE FUNCTION refresh_search_on_relink();
+CREATE TRIGGER tr_bookauthors_search_delete AFTER DELETE ON BookAuthors REFERENCING OLD TABLE AS changed_links FOR EACH STATEMENT EXECUTE FUNCTION refresh_search_on_relink();
+CREATE TRIGGER tr_author_search_rename AFTER UPDATE OF name ON Authors FOR EACH ROW EXECUTE FUNCTION refresh_search_on_author_rename();
+CREATE TRIGGER tr_loan_release_slot AFTER UPDATE OF return_date OR DELETE ON Loans FOR EACH ROW EXECUTE FUNCTION release_loan_slot();
@@ -0,0 +1,4 @@
+-- migrate: no-transaction
+-- Active loans per member: get_user_loans and the loans tab.
+DROP INDEX CONCURRENTLY IF EXISTS idx_loans_active_user;
+CREATE INDEX CONCURRENTLY idx_loans_active_user ON Loans (user_id) WHERE return_date IS NULL;
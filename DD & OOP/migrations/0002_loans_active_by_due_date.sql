@@ -0,0 +1,4 @@
+-- migrate: no-transaction
+-- Active loans by due date: OverdueBooksReport reads only the overdue range.
+DROP INDEX CONCURRENTLY IF EXISTS idx_loans_active_due_date;
+CREATE INDEX CONCURRENTLY idx_loans_active_due_date ON Loans (due_date) WHERE return_date IS NULL;
@@ -0,0 +1,4 @@
+-- migrate: no-transaction
+-- Loan history per book, and the ON DELETE RESTRICT check when a book is deleted.
+DROP INDEX CONCURRENTLY IF EXISTS idx_loans_book_borrow_date;
+CREATE INDEX CONCURRENTLY idx_loans_book_borrow_date ON Loans (book_id, borrow_date);
@@ -0,0 +1,5 @@
+-- migrate: no-transaction
+-- A member's clubs, and the ON DELETE CASCADE from Users. (club_id, user_id) is already
+-- covered by the UNIQUE constraint.
+DROP INDEX CONCURRENTLY IF EXISTS idx_club_memberships_user;
+CREATE INDEX CONCURRENTLY idx_club_memberships_user ON ClubMemberships (user_id);
@@ -0,0 +1,29 @@
+-- Change tracking for incremental snapshot exports (snapshot.py).
+-- now() is not volatile, so adding the columns does not rewrite the tables: existing rows
+-- all read as changed at migration time and are picked up by the first export.
+ALTER TABLE Loans ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+ALTER TABLE Books ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+ALTER TABLE Users ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+ALTER TABLE ClubMemberships ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+CREATE OR REPLACE FUNCTION touch_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at := now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Only real changes count: no-op updates leave updated_at (and the next export) alone
+DROP TRIGGER IF EXISTS tr_loans_touch ON Loans;
+CREATE TRIGGER tr_loans_touch BEFORE UPDATE ON Loans
+FOR EACH ROW WHEN (OLD IS DISTINCT FROM NEW) EXECUTE FUNCTION touch_updated_at();
+DROP TRIGGER IF EXISTS tr_books_touch ON Books;
+CREATE TRIGGER tr_books_touch BEFORE UPDATE ON Books
+FOR EACH ROW WHEN (OLD IS DISTINCT FROM NEW) EXECUTE FUNCTION touch_updated_at();
+DROP TRIGGER IF EXISTS tr_users_touch ON Users;
+CREATE TRIGGER tr_users_touch BEFORE UPDATE ON Users
+FOR EACH ROW WHEN (OLD IS DISTINCT FROM NEW) EXECUTE FUNCTION touch_updated_at();
+DROP TRIGGER IF EXISTS tr_club_memberships_touch ON ClubMemberships;
+CREATE TRIGGER tr_club_memberships_touch BEFORE UPDATE ON ClubMemberships
+FOR EACH ROW WHEN (OLD IS DISTINCT FROM NEW) EXECUTE FUNCTION touch_updated_at();
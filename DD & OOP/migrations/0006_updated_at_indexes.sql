@@ -0,0 +1,10 @@
+-- migrate: no-transaction
+-- Incremental exports read rows changed since the last watermark through these.
+DROP INDEX CONCURRENTLY IF EXISTS idx_loans_updated_at;
+CREATE INDEX CONCURRENTLY idx_loans_updated_at ON Loans (updated_at);
+DROP INDEX CONCURRENTLY IF EXISTS idx_books_updated_at;
+CREATE INDEX CONCURRENTLY idx_books_updated_at ON Books (updated_at);
+DROP INDEX CONCURRENTLY IF EXISTS idx_users_updated_at;
+CREATE INDEX CONCURRENTLY idx_users_updated_at ON Users (updated_at);
+DROP INDEX CONCURRENTLY IF EXISTS idx_club_memberships_updated_at;
+CREATE INDEX CONCURRENTLY idx_club_memberships_updated_at ON ClubMemberships (updated_at);
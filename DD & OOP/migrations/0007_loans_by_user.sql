@@ -0,0 +1,5 @@
+-- migrate: no-transaction
+-- A member's whole loan history (returned loans too): club matching reads it per member.
+-- Covers book_id so the genre/author joins need no heap visit for the loan itself.
+DROP INDEX CONCURRENTLY IF EXISTS idx_loans_user_book;
+CREATE INDEX CONCURRENTLY idx_loans_user_book ON Loans (user_id, book_id);
@@ -0,0 +1,11 @@
+-- Loans inserted already returned (imported history, datagen.py) leave the book available;
+-- only a loan without a return date takes the copy off the shelf.
+CREATE OR REPLACE FUNCTION update_book_on_borrow()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.return_date IS NULL THEN
+        UPDATE Books SET available = FALSE WHERE id = NEW.book_id;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,29 @@
+-- Tombstones for incremental snapshot exports (snapshot.py): a deleted row leaves no
+-- updated_at behind, so deletes from the exported tables are recorded here instead.
+CREATE TABLE IF NOT EXISTS DeletedRows (
+    table_name VARCHAR(32) NOT NULL,  -- snapshot table name, e.g. 'club_memberships'
+    row_id INT NOT NULL,
+    deleted_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_deleted_rows_deleted_at ON DeletedRows (deleted_at);
+
+CREATE OR REPLACE FUNCTION record_deleted_row()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO DeletedRows (table_name, row_id) VALUES (TG_ARGV[0], OLD.id);
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tr_loans_deleted ON Loans;
+CREATE TRIGGER tr_loans_deleted AFTER DELETE ON Loans
+FOR EACH ROW EXECUTE FUNCTION record_deleted_row('loans');
+DROP TRIGGER IF EXISTS tr_books_deleted ON Books;
+CREATE TRIGGER tr_books_deleted AFTER DELETE ON Books
+FOR EACH ROW EXECUTE FUNCTION record_deleted_row('books');
+DROP TRIGGER IF EXISTS tr_users_deleted ON Users;
+CREATE TRIGGER tr_users_deleted AFTER DELETE ON Users
+FOR EACH ROW EXECUTE FUNCTION record_deleted_row('users');
+DROP TRIGGER IF EXISTS tr_club_memberships_deleted ON ClubMemberships;
+CREATE TRIGGER tr_club_memberships_deleted AFTER DELETE ON ClubMemberships
+FOR EACH ROW EXECUTE FUNCTION record_deleted_row('club_memberships');
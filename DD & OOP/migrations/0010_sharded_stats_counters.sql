@@ -0,0 +1,210 @@
+-- Dashboard counters spread over 16 rows. With a single LibraryStats row (and one
+-- ActiveLoansByDueDate row per due date, the same one for every checkout of the day),
+-- concurrent checkouts and returns queued on its row lock until each transaction committed.
+-- Each session now adds its deltas to the shard picked by its backend pid; LibraryStats and
+-- ActiveLoansByDueDate become views summing the shards, so readers are unchanged.
+-- reconcile_library_stats() folds the shards back into shard 0.
+LOCK TABLE LibraryStats, ActiveLoansByDueDate IN EXCLUSIVE MODE;
+
+CREATE OR REPLACE FUNCTION stats_shard()
+RETURNS SMALLINT AS $$
+    SELECT (pg_backend_pid() % 16)::SMALLINT;
+$$ LANGUAGE sql STABLE;
+
+CREATE TABLE LibraryStatsShards (
+    shard SMALLINT PRIMARY KEY CHECK (shard BETWEEN 0 AND 15),
+    total_books INT NOT NULL DEFAULT 0,
+    available_books INT NOT NULL DEFAULT 0,
+    members INT NOT NULL DEFAULT 0,
+    clubs INT NOT NULL DEFAULT 0,
+    active_loans INT NOT NULL DEFAULT 0
+);
+INSERT INTO LibraryStatsShards (shard) SELECT generate_series(0, 15);
+UPDATE LibraryStatsShards sh
+SET total_books = s.total_books, available_books = s.available_books,
+    members = s.members, clubs = s.clubs, active_loans = s.active_loans
+FROM LibraryStats s WHERE sh.shard = 0;
+
+CREATE TABLE ActiveLoansByDueDateShards (
+    due_date DATE NOT NULL,
+    shard SMALLINT NOT NULL,
+    active_loans INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (due_date, shard)
+);
+INSERT INTO ActiveLoansByDueDateShards (due_date, shard, active_loans)
+SELECT due_date, 0, active_loans FROM ActiveLoansByDueDate WHERE active_loans <> 0;
+
+DROP TABLE LibraryStats;
+DROP TABLE ActiveLoansByDueDate;
+
+CREATE VIEW LibraryStats AS
+SELECT COALESCE(SUM(total_books), 0)::INT AS total_books,
+       COALESCE(SUM(available_books), 0)::INT AS available_books,
+       COALESCE(SUM(members), 0)::INT AS members,
+       COALESCE(SUM(clubs), 0)::INT AS clubs,
+       COALESCE(SUM(active_loans), 0)::INT AS active_loans
+FROM LibraryStatsShards;
+
+CREATE VIEW ActiveLoansByDueDate AS
+SELECT due_date, SUM(active_loans)::INT AS active_loans
+FROM ActiveLoansByDueDateShards
+GROUP BY due_date;
+
+-- Functions: Keep the LibraryStats shards current. Statement-level so multi-row changes cost
+-- one counter update, and the shard is only written when a count actually changes.
+CREATE OR REPLACE FUNCTION stats_track_books()
+RETURNS TRIGGER AS $$
+DECLARE
+    d_total INT := 0;
+    d_available INT := 0;
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT d_total + COUNT(*), d_available + COUNT(*) FILTER (WHERE available)
+        INTO d_total, d_available FROM new_rows;
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        SELECT d_total - COUNT(*), d_available - COUNT(*) FILTER (WHERE available)
+        INTO d_total, d_available FROM old_rows;
+    END IF;
+    IF d_total <> 0 OR d_available <> 0 THEN
+        UPDATE LibraryStatsShards SET total_books = total_books + d_total,
+                                      available_books = available_books + d_available
+        WHERE shard = stats_shard();
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION stats_track_users()
+RETURNS TRIGGER AS $$
+DECLARE
+    d_members INT := 0;
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT d_members + COUNT(*) INTO d_members FROM new_rows WHERE role_id = 2;
+    END IF;
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        SELECT d_members - COUNT(*) INTO d_members FROM old_rows WHERE role_id = 2;
+    END IF;
+    IF d_members <> 0 THEN
+        UPDATE LibraryStatsShards SET members = members + d_members WHERE shard = stats_shard();
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION stats_track_clubs()
+RETURNS TRIGGER AS $$
+DECLARE
+    d_clubs INT := 0;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT COUNT(*) INTO d_clubs FROM new_rows;
+    ELSE
+        SELECT -COUNT(*) INTO d_clubs FROM old_rows;
+    END IF;
+    IF d_clubs <> 0 THEN
+        UPDATE LibraryStatsShards SET clubs = clubs + d_clubs WHERE shard = stats_shard();
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION stats_track_loans()
+RETURNS TRIGGER AS $$
+DECLARE
+    due_dates DATE[];
+    deltas INT[];
+    net INT;
+BEGIN
+    -- Per-due-date change in active loans: +1 for each loan that became active, -1 for each that stopped
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(due_date), array_agg(d) INTO due_dates, deltas
+        FROM (SELECT due_date, COUNT(*)::INT AS d FROM new_rows
+              WHERE return_date IS NULL GROUP BY due_date) c;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(due_date), array_agg(d) INTO due_dates, deltas
+        FROM (SELECT due_date, -COUNT(*)::INT AS d FROM old_rows
+              WHERE return_date IS NULL GROUP BY due_date) c;
+    ELSE
+        SELECT array_agg(due_date), array_agg(d) INTO due_dates, deltas
+        FROM (SELECT due_date, SUM(d)::INT AS d FROM (
+                  SELECT n.due_date, 1 AS d FROM new_rows n JOIN old_rows o ON o.id = n.id
+                  WHERE n.return_date IS NULL AND (o.return_date IS NOT NULL OR o.due_date <> n.due_date)
+                  UNION ALL
+                  SELECT o.due_date, -1 FROM new_rows n JOIN old_rows o ON o.id = n.id
+                  WHERE o.return_date IS NULL AND (n.return_date IS NOT NULL OR o.due_date <> n.due_date)
+              ) x GROUP BY due_date HAVING SUM(d) <> 0) c;
+    END IF;
+
+    IF due_dates IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO ActiveLoansByDueDateShards (due_date, shard, active_loans)
+    SELECT due_date, stats_shard(), d FROM unnest(due_dates, deltas) AS u (due_date, d)
+    ON CONFLICT (due_date, shard) DO UPDATE
+    SET active_loans = ActiveLoansByDueDateShards.active_loans + EXCLUDED.active_loans;
+
+    SELECT SUM(d) INTO net FROM unnest(deltas) AS d;
+    IF net <> 0 THEN
+        UPDATE LibraryStatsShards SET active_loans = active_loans + net WHERE shard = stats_shard();
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Function: Rebuild LibraryStats, ActiveLoansByDueDate and the members' active_loans
+-- counters from the base tables, folding every shard into shard 0. Returns TRUE if any had
+-- drifted. Blocks counter updates while it runs.
+CREATE OR REPLACE FUNCTION reconcile_library_stats()
+RETURNS BOOLEAN AS $$
+DECLARE
+    stored LibraryStats%ROWTYPE;
+    actual LibraryStats%ROWTYPE;
+    buckets_drifted BOOLEAN;
+    members_fixed INT;
+BEGIN
+    LOCK TABLE Loans IN SHARE MODE;
+    LOCK TABLE LibraryStatsShards, ActiveLoansByDueDateShards IN EXCLUSIVE MODE;
+
+    UPDATE Users u SET active_loans = COALESCE(l.active, 0)
+    FROM Users u2
+    LEFT JOIN (SELECT user_id, COUNT(*)::INT AS active FROM Loans
+               WHERE return_date IS NULL GROUP BY user_id) l ON l.user_id = u2.id
+    WHERE u.id = u2.id AND u.active_loans <> COALESCE(l.active, 0);
+    GET DIAGNOSTICS members_fixed = ROW_COUNT;
+
+    SELECT * INTO stored FROM LibraryStats;
+    SELECT (SELECT COUNT(*) FROM Books),
+           (SELECT COUNT(*) FROM Books WHERE available),
+           (SELECT COUNT(*) FROM Users WHERE role_id = 2),
+           (SELECT COUNT(*) FROM BookClubs),
+           (SELECT COUNT(*) FROM Loans WHERE return_date IS NULL)
+    INTO actual;
+
+    SELECT EXISTS (
+        SELECT due_date, COUNT(*)::INT FROM Loans WHERE return_date IS NULL GROUP BY due_date
+        EXCEPT
+        SELECT due_date, active_loans FROM ActiveLoansByDueDate WHERE active_loans <> 0
+    ) OR EXISTS (
+        SELECT due_date, active_loans FROM ActiveLoansByDueDate WHERE active_loans <> 0
+        EXCEPT
+        SELECT due_date, COUNT(*)::INT FROM Loans WHERE return_date IS NULL GROUP BY due_date
+    ) INTO buckets_drifted;
+
+    UPDATE LibraryStatsShards
+    SET total_books = 0, available_books = 0, members = 0, clubs = 0, active_loans = 0
+    WHERE shard <> 0;
+    UPDATE LibraryStatsShards SET total_books = actual.total_books, available_books = actual.available_books,
+                                  members = actual.members, clubs = actual.clubs, active_loans = actual.active_loans
+    WHERE shard = 0;
+
+    -- Also drops the zero rows left behind by past due dates
+    DELETE FROM ActiveLoansByDueDateShards;
+    INSERT INTO ActiveLoansByDueDateShards (due_date, shard, active_loans)
+    SELECT due_date, 0, COUNT(*) FROM Loans WHERE return_date IS NULL GROUP BY due_date;
+
+    RETURN stored IS DISTINCT FROM actual OR buckets_drifted OR members_fixed > 0;
+END;
+$$ LANGUAGE plpgsql;
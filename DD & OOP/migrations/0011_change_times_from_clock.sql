@@ -0,0 +1,17 @@
+-- Stamp updated_at and deleted_at with clock_timestamp() instead of now(). now() is the start
+-- of the transaction, so a row changed late in a transaction that ran longer than the
+-- snapshot lag (snapshot.py) was stamped behind a watermark that had already passed it, and
+-- incremental exports never saw it. Setting a default does not rewrite the tables.
+CREATE OR REPLACE FUNCTION touch_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at := clock_timestamp();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE Loans ALTER COLUMN updated_at SET DEFAULT clock_timestamp();
+ALTER TABLE Books ALTER COLUMN updated_at SET DEFAULT clock_timestamp();
+ALTER TABLE Users ALTER COLUMN updated_at SET DEFAULT clock_timestamp();
+ALTER TABLE ClubMemberships ALTER COLUMN updated_at SET DEFAULT clock_timestamp();
+ALTER TABLE DeletedRows ALTER COLUMN deleted_at SET DEFAULT clock_timestamp();
@@ -0,0 +1,122 @@
+"""
+notifications.py
+Background LISTEN/NOTIFY client. Holds one dedicated (non-pooled) PostgreSQL connection,
+listens on the requested channels and hands each JSON payload to the registered callbacks.
+"""
+import json
+import select
+import threading
+
+import psycopg2
+import psycopg2.extensions
+
+from databasemanager import DB_HOST, DB_NAME, DB_USER, DB_PASS, DB_PORT
+
+POLL_TIMEOUT = 1.0       # seconds between checks for stop()
+RECONNECT_DELAY = 2.0    # initial back-off after the connection drops
+RECONNECT_DELAY_MAX = 30.0
+
+
+class NotificationListener:
+    """Dispatches NOTIFY payloads to subscribers on a daemon thread.
+
+    Callbacks run on the listener thread with a list of decoded payloads, all those that
+    arrived together for that channel, so subscribers can batch their work. Because
+    notifications sent while disconnected are lost, `on_reconnect` callbacks fire after
+    every reconnection so subscribers can resynchronise.
+    """
+
+    def __init__(self):
+        self._subscribers = {}  # channel -> [callback]
+        self._reconnect_callbacks = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, channel, callback):
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(callback)
+
+    def on_reconnect(self, callback):
+        with self._lock:
+            self._reconnect_callbacks.append(callback)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="db-notifications", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _connect(self):
+        conn = psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS, port=DB_PORT)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            with self._lock:
+                channels = list(self._subscribers)
+            for channel in channels:
+                cur.execute(f'LISTEN "{channel}"')
+        return conn
+
+    def _run(self):
+        delay = RECONNECT_DELAY
+        first = True
+        while not self._stop.is_set():
+            try:
+                conn = self._connect()
+            except psycopg2.Error as e:
+                print(f"Notification listener could not connect, retrying in {delay:.0f}s: {e}")
+                self._stop.wait(delay)
+                delay = min(delay * 2, RECONNECT_DELAY_MAX)
+                continue
+
+            delay = RECONNECT_DELAY
+            if not first:
+                self._dispatch_reconnect()
+            first = False
+
+            try:
+                self._listen(conn)
+            except (psycopg2.Error, OSError) as e:
+                print(f"Notification listener lost its connection: {e}")
+            finally:
+                try:
+                    conn.close()
+                except psycopg2.Error:
+                    pass
+
+    def _listen(self, conn):
+        while not self._stop.is_set():
+            if select.select([conn], [], [], POLL_TIMEOUT) == ([], [], []):
+                continue
+            conn.poll()
+            batches = {}
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                try:
+                    payload = json.loads(notify.payload) if notify.payload else None
+                except ValueError:
+                    payload = notify.payload
+                batches.setdefault(notify.channel, []).append(payload)
+            for channel, payloads in batches.items():
+                self._dispatch(channel, payloads)
+
+    def _dispatch(self, channel, payloads):
+        with self._lock:
+            callbacks = list(self._subscribers.get(channel, ()))
+        for callback in callbacks:
+            try:
+                callback(payloads)
+            except Exception as e:
+                print(f"Notification callback for '{channel}' failed: {e}")
+
+    def _dispatch_reconnect(self):
+        with self._lock:
+            callbacks = list(self._reconnect_callbacks)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Notification reconnect callback failed: {e}")
@@ -0,0 +1,414 @@
+"""
+recommender.py
+"Borrowers also borrowed": item-item book recommendations from the loan history.
+
+Two books co-occur when one member borrowed both within RECOMMEND_WINDOW loans of each
+other. The counts form a sparse book x book matrix held as CSR arrays (NumPy), each row
+cut to its RECOMMEND_NEIGHBOURS most frequent partners, and are scored relative to how
+often each book is borrowed at all
+
+    score(a, b) = together(a, b) / sqrt(loans(a) * loans(b))
+
+so that the most borrowed titles do not top every list.
+
+New loans are folded in without a rebuild: refresh() reads the loans past the last id it
+has seen, less RESCAN_IDS to catch loans committed out of id order (those already counted
+are skipped), and adds their pairs to a small delta table, which is merged into the CSR
+arrays once it holds RECOMMEND_DELTA_PAIRS pairs. With PostgreSQL, attach() makes the Loans
+'catalog_changes' notifications trigger that refresh; otherwise call refresh() after loans.
+
+Memory is bounded whatever the length of the history: the build counts pairs a chunk of
+loans at a time and, past RECOMMEND_PAIR_BUDGET distinct pairs, drops the rarest; the
+matrix keeps at most RECOMMEND_NEIGHBOURS partners per book; and only each member's last
+RECOMMEND_WINDOW books are remembered. Pairs pruned that way restart from zero if they
+come back. A full build ranks every row from complete counts, but a merge only re-ranks a
+row from the partners it kept plus the delta, so a partner that was cut from the row and
+later catches up is counted from the delta alone, and the lists drift from what a rebuild
+would give. Call refresh(full=True) every so often to start over from the whole history;
+the GUI rebuilds every RECOMMENDER_REBUILD_MINUTES.
+
+    python recommender.py --book 42        # books borrowed together with book 42
+    python recommender.py --member 7       # recommendations for member 7
+
+bench_recommender.py times the build and the queries. Needs numpy (pip install numpy).
+"""
+import argparse
+import contextlib
+import sys
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from analytics import RESCAN_IDS, int32_columns
+from backends import BACKENDS, DB_BACKEND, open_database
+
+CATALOG_CHANNEL = 'catalog_changes'
+
+RECOMMEND_WINDOW = 20              # a loan pairs with the member's previous this-many loans
+RECOMMEND_NEIGHBOURS = 50          # partners kept per book
+RECOMMEND_TOP_K = 10
+RECOMMEND_PAIR_BUDGET = 10_000_000  # distinct pairs held while building (12 bytes each)
+RECOMMEND_DELTA_PAIRS = 1_000_000  # delta entries held before they are merged into the matrix
+BUILD_CHUNK_LOANS = 250_000        # loans whose pairs are counted at a time
+MATRIX_BLOCK_ENTRIES = 2_000_000   # matrix entries ranked at a time
+
+
+def pair_keys(a, b):
+    """One int64 per unordered book pair: smaller id in the high half."""
+    low, high = np.minimum(a, b).astype(np.int64), np.maximum(a, b).astype(np.int64)
+    return (low << 32) | high
+
+
+def pair_rows(rows, cols):
+    """One int64 per directed (row, col) entry, row in the high half, so keys sort by row."""
+    return (rows.astype(np.int64) << 32) | cols.astype(np.int64)
+
+
+def sum_pairs(keys, counts):
+    """Distinct keys (sorted) and their summed counts."""
+    order = np.argsort(keys, kind='stable')
+    keys, counts = keys[order], counts[order]
+    if not len(keys):
+        return keys, counts
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    return keys[starts], np.add.reduceat(counts, starts).astype(np.int32)
+
+
+def count_sorted(keys):
+    """Distinct keys of a sorted array and how often each occurs."""
+    if not len(keys):
+        return keys, np.empty(0, dtype=np.int32)
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    return keys[starts], np.diff(np.append(starts, len(keys))).astype(np.int32)
+
+
+def merge_pairs(keys, counts, new_keys, new_counts):
+    """Adds distinct sorted (new_keys, new_counts) into the distinct sorted table (keys, counts).
+
+    Counts of keys already present are added in place; the rest are inserted in one copy,
+    so the table is never re-sorted.
+    """
+    at = np.searchsorted(keys, new_keys)
+    found = at < len(keys)
+    found[found] = keys[at[found]] == new_keys[found]
+    counts[at[found]] += new_counts[found]
+    return np.insert(keys, at[~found], new_keys[~found]), np.insert(counts, at[~found], new_counts[~found])
+
+
+def prune_pairs(keys, counts, budget):
+    """Drops the rarest pairs until at most `budget` remain."""
+    floor = 1
+    while len(keys) > budget:
+        keep = counts > floor
+        keys, counts = keys[keep], counts[keep]
+        floor += 1
+    return keys, counts
+
+
+class BookRecommender:
+    """Item-item co-occurrence recommender over Loans, kept current incrementally.
+
+    Queries and refresh() may run on different threads. Queries only wait while new loans
+    are being merged in, never during the database read or a full rebuild.
+    """
+
+    def __init__(self, db=None, window=RECOMMEND_WINDOW, neighbours=RECOMMEND_NEIGHBOURS):
+        self.db = db
+        self.window = window
+        self.neighbours = neighbours
+        self.indptr = np.zeros(1, dtype=np.int64)       # CSR over book ids
+        self.indices = np.empty(0, dtype=np.int32)      # partner book ids
+        self.counts = np.empty(0, dtype=np.int32)       # times borrowed together
+        self.book_loans = np.empty(0, dtype=np.int32)   # book id -> loans
+        self.recent = np.full((0, window), -1, dtype=np.int32)  # user id -> last books, newest first
+        # (book, partner) counts since the last merge, as sorted pair_rows keys
+        self.delta_keys = np.empty(0, dtype=np.int64)
+        self.delta_counts = np.empty(0, dtype=np.int32)
+        self.last_loan_id = 0
+        self.counted_ids = np.empty(0, dtype=np.int32)  # loan ids within RESCAN_IDS of last_loan_id
+        self.built = False
+        self._lock = threading.Lock()
+        self._queue_lock = threading.Lock()  # guards the three fields below
+        self._refreshing = False
+        self._queued = False
+        self._queued_full = False
+
+    # ---------------- Building ----------------
+    def _read_loans(self, after):
+        query = f"SELECT id, book_id, user_id FROM Loans WHERE id > {int(after)} ORDER BY id"
+        return int32_columns(self.db.stream_query(query), 3)
+
+    def _strongest(self, keys, counts, size):
+        """(rows, cols, counts) of sorted pair_rows entries, strongest first within each row
+        (ties by partner id), each row cut to `neighbours` partners."""
+        order = np.argsort((keys & ~np.int64(0xFFFFFFFF)) | (0x7FFFFFFF - counts.astype(np.int64)), kind='stable')
+        keys, counts = keys[order], counts[order]
+        rows, cols = (keys >> 32).astype(np.int32), (keys & 0xFFFFFFFF).astype(np.int32)
+        starts = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=size))))
+        keep = np.arange(len(rows)) - starts[rows] < self.neighbours
+        return rows[keep], cols[keep], counts[keep]
+
+    @staticmethod
+    def _indptr(rows, size):
+        return np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=size)))).astype(np.int64)
+
+    def _matrix(self, keys, counts, size):
+        """CSR arrays for the pairs in both directions, built a block of rows at a time."""
+        low, high = (keys >> 32).astype(np.int32), (keys & 0xFFFFFFFF).astype(np.int32)
+        degree = np.cumsum(np.bincount(low, minlength=size) + np.bincount(high, minlength=size))
+        bounds = np.searchsorted(degree, np.arange(MATRIX_BLOCK_ENTRIES, int(degree[-1]) if size else 0,
+                                                   MATRIX_BLOCK_ENTRIES), side='right')
+        parts = []
+        for first, last in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [size]))):
+            out = (low >= first) & (low < last)
+            back = (high >= first) & (high < last)
+            entries = pair_rows(np.concatenate((low[out], high[back])), np.concatenate((high[out], low[back])))
+            order = np.argsort(entries)
+            parts.append(self._strongest(entries[order], np.concatenate((counts[out], counts[back]))[order], size))
+        rows, cols, counts = (np.concatenate([part[i] for part in parts]) if parts else np.empty(0, dtype=np.int32)
+                              for i in range(3))
+        return self._indptr(rows, size), cols, counts
+
+    def _window_pairs(self, books, users, start=0, stop=None, new=None):
+        """Unordered pair keys of each loan in [start, stop) and the member's previous `window`
+        loans. books/users are sorted by member, in loan order within each; if `new` is given,
+        only loans flagged in it start pairs (the others are history)."""
+        stop = len(books) if stop is None else stop
+        keys = []
+        for k in range(1, self.window + 1):
+            i = np.arange(max(start, k), stop)
+            j = i - k
+            same = (users[i] == users[j]) & (books[i] != books[j])
+            if new is not None:
+                same &= new[i]
+            keys.append(pair_keys(books[i[same]], books[j[same]]))
+        return np.concatenate(keys)
+
+    def _recent(self, books, users, recent):
+        """Writes each member's last `window` books, newest first, into `recent` (rows indexed by
+        member id). books/users are sorted by member, in loan order within each."""
+        ends = np.searchsorted(users, users, side='right')
+        rank = ends - 1 - np.arange(len(users))
+        keep = rank < self.window
+        recent[users[keep], rank[keep]] = books[keep]
+
+    def build(self, loan_ids, book_ids, user_ids):
+        """Replaces the model with one built from these loans (arrays in loan id order)."""
+        size = int(book_ids.max()) + 1 if len(book_ids) else 0
+        members = int(user_ids.max()) + 1 if len(user_ids) else 0
+        order = np.argsort(user_ids, kind='stable')  # by member, in loan order within each
+        books, users = book_ids[order], user_ids[order]
+
+        keys, counts = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
+        for start in range(0, len(books), BUILD_CHUNK_LOANS):
+            chunk = self._window_pairs(books, users, start, min(start + BUILD_CHUNK_LOANS, len(books)))
+            keys, counts = merge_pairs(keys, counts, *count_sorted(np.sort(chunk)))
+            keys, counts = prune_pairs(keys, counts, RECOMMEND_PAIR_BUDGET)
+        indptr, indices, pair_counts = self._matrix(keys, counts, size)
+        recent = np.full((members, self.window), -1, dtype=np.int32)
+        self._recent(books, users, recent)
+
+        with self._lock:
+            self.indptr, self.indices, self.counts = indptr, indices, pair_counts
+            self.book_loans = np.bincount(book_ids, minlength=size).astype(np.int32)
+            self.recent = recent
+            self.delta_keys, self.delta_counts = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
+            self.last_loan_id = int(loan_ids[-1]) if len(loan_ids) else 0
+            self.counted_ids = loan_ids[loan_ids > self.last_loan_id - RESCAN_IDS]
+            self.built = True
+
+    def add_loans(self, loan_ids, book_ids, user_ids):
+        """Folds in loans that arrived after the build (arrays in loan id order), skipping
+        those already counted."""
+        with self._lock:
+            fresh = (loan_ids > self.last_loan_id - RESCAN_IDS) & ~np.isin(loan_ids, self.counted_ids)
+            loan_ids, book_ids, user_ids = loan_ids[fresh], book_ids[fresh], user_ids[fresh]
+            if not len(loan_ids):
+                return
+            if book_ids.max() >= len(self.book_loans):
+                grow = np.zeros(int(book_ids.max()) + 1 - len(self.book_loans), dtype=np.int32)
+                self.book_loans = np.concatenate((self.book_loans, grow))
+            if user_ids.max() >= len(self.recent):
+                grow = np.full((int(user_ids.max()) + 1 - len(self.recent), self.window), -1, dtype=np.int32)
+                self.recent = np.concatenate((self.recent, grow))
+
+            # The members' remembered books (oldest first) followed by their new loans
+            members = np.unique(user_ids)
+            history = self.recent[members][:, ::-1].ravel()
+            known = history >= 0
+            books = np.concatenate((history[known], book_ids))
+            users = np.concatenate((np.repeat(members, self.window)[known], user_ids))
+            new = np.concatenate((np.zeros(int(known.sum()), dtype=bool), np.ones(len(book_ids), dtype=bool)))
+            order = np.argsort(users, kind='stable')
+            books, users, new = books[order], users[order], new[order]
+
+            keys = self._window_pairs(books, users, new=new)
+            low, high = (keys >> 32).astype(np.int32), (keys & 0xFFFFFFFF).astype(np.int32)
+            entries = np.sort(pair_rows(np.concatenate((low, high)), np.concatenate((high, low))))
+            self.delta_keys, self.delta_counts = merge_pairs(self.delta_keys, self.delta_counts,
+                                                             *count_sorted(entries))
+            self.recent[members] = -1
+            self._recent(books, users, self.recent)
+            np.add.at(self.book_loans, book_ids, 1)
+            self.last_loan_id = max(self.last_loan_id, int(loan_ids[-1]))
+            counted = np.union1d(self.counted_ids, loan_ids)
+            self.counted_ids = counted[counted > self.last_loan_id - RESCAN_IDS].astype(np.int32)
+            if len(self.delta_keys) >= RECOMMEND_DELTA_PAIRS:
+                self._merge_delta()
+
+    def _merge_delta(self):
+        """Adds the delta entries into the CSR arrays and clears them. Call with the lock held.
+
+        Only the rows of books in the delta are re-ranked; the others are carried over.
+        Partners already cut from a row are not recovered, so this approximates a rebuild.
+        """
+        size = len(self.book_loans)
+        rows = np.repeat(np.arange(len(self.indptr) - 1, dtype=np.int32), np.diff(self.indptr))
+        in_touched = np.isin(rows, np.unique(self.delta_keys >> 32))
+        keys, counts = sum_pairs(np.concatenate((pair_rows(rows[in_touched], self.indices[in_touched]),
+                                                 self.delta_keys)),
+                                 np.concatenate((self.counts[in_touched], self.delta_counts)))
+        new_rows, new_cols, new_counts = self._strongest(keys, counts, size)
+        rows = np.concatenate((rows[~in_touched], new_rows))
+        order = np.argsort(rows, kind='stable')  # two sorted runs
+        self.indices = np.concatenate((self.indices[~in_touched], new_cols))[order]
+        self.counts = np.concatenate((self.counts[~in_touched], new_counts))[order]
+        self.indptr = self._indptr(rows[order], size)
+        self.delta_keys, self.delta_counts = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
+
+    def refresh(self, full=False):
+        """Builds from every loan the first time (or if `full`), then reads only new loans
+        and the last RESCAN_IDS ids again.
+
+        Returns the seconds taken, or None if a refresh was already running on another
+        thread: that one then goes round once more (rebuilding if `full`) instead of this
+        call waiting for it, so a burst of notifications costs at most one extra refresh.
+        """
+        start = time.perf_counter()
+        with self._queue_lock:
+            self._queued = True
+            self._queued_full |= full
+            if self._refreshing:
+                return None
+            self._refreshing = True
+        try:
+            while True:
+                with self._queue_lock:
+                    if not self._queued:
+                        self._refreshing = False
+                        break
+                    full, self._queued, self._queued_full = self._queued_full, False, False
+                if full or not self.built:
+                    self.build(*self._read_loans(0))
+                else:
+                    self.add_loans(*self._read_loans(max(self.last_loan_id - RESCAN_IDS, 0)))
+        except BaseException:
+            with self._queue_lock:
+                self._refreshing = False
+            raise
+        return time.perf_counter() - start
+
+    def attach(self, listener):
+        """Refreshes whenever a NotificationListener reports new or changed loans."""
+        listener.subscribe(CATALOG_CHANNEL, self._on_notifications)
+        listener.on_reconnect(self.refresh)
+
+    def _on_notifications(self, payloads):
+        if self.built and any(isinstance(p, dict) and p.get('table') == 'loans' for p in payloads):
+            self.refresh()
+
+    # ---------------- Queries ----------------
+    def _partners(self, book_id):
+        """(partner ids, scores) of one book. Call with the lock held."""
+        if book_id >= len(self.book_loans) or not self.book_loans[book_id]:
+            return np.empty(0, dtype=np.int32), np.empty(0)
+        if book_id < len(self.indptr) - 1:
+            lo, hi = self.indptr[book_id], self.indptr[book_id + 1]
+            partners, together = self.indices[lo:hi], self.counts[lo:hi]
+        else:
+            partners, together = np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+        lo, hi = np.searchsorted(self.delta_keys, (book_id << 32, (book_id + 1) << 32))
+        if hi > lo:
+            partners = np.concatenate((partners, (self.delta_keys[lo:hi] & 0xFFFFFFFF).astype(np.int32)))
+            together = np.concatenate((together, self.delta_counts[lo:hi]))
+            partners, inverse = np.unique(partners, return_inverse=True)
+            together = np.bincount(inverse, weights=together)
+        norm = np.sqrt(float(self.book_loans[book_id]) * self.book_loans[partners])
+        return partners, together / np.maximum(norm, 1.0)
+
+    @staticmethod
+    def _top(partners, scores, k, exclude=()):
+        if exclude:
+            keep = ~np.isin(partners, np.fromiter(exclude, dtype=np.int32, count=len(exclude)))
+            partners, scores = partners[keep], scores[keep]
+        order = np.lexsort((partners, -scores))[:k]
+        return [(int(partners[i]), float(scores[i])) for i in order]
+
+    def similar_books(self, book_id, k=RECOMMEND_TOP_K):
+        """Up to k (book_id, score) pairs most often borrowed by the same members, best first."""
+        with self._lock:
+            partners, scores = self._partners(book_id)
+        return self._top(partners, scores, k, {book_id})
+
+    def recommend_for_member(self, user_id, k=RECOMMEND_TOP_K, on_loan=None):
+        """Up to k (book_id, score) pairs for a member, from the books they borrowed last.
+
+        Leaves out books the member has borrowed recently and those they have on loan now;
+        `on_loan` (book ids) is read with get_user_loans when not given.
+        """
+        if on_loan is None:
+            on_loan = [loan[5] for loan in self.db.get_user_loans(user_id)]
+        with self._lock:
+            history = self.recent[user_id] if user_id < len(self.recent) else np.empty(0, dtype=np.int32)
+            seeds = set(history[history >= 0].tolist()) | set(on_loan)
+            parts = [self._partners(book_id) for book_id in seeds]
+        if not parts:
+            return []
+        partners = np.concatenate([p for p, _ in parts])
+        scores = np.concatenate([s for _, s in parts])
+        partners, inverse = np.unique(partners, return_inverse=True)
+        return self._top(partners, np.bincount(inverse, weights=scores, minlength=len(partners)), k, seeds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--book", type=int, help="books borrowed together with this book")
+    target.add_argument("--member", type=int, help="recommendations for this member")
+    parser.add_argument("--top", type=int, default=RECOMMEND_TOP_K)
+    parser.add_argument("--backend", choices=BACKENDS, help="default: backends.DB_BACKEND")
+    args = parser.parse_args()
+    if np is None:
+        raise SystemExit("recommender.py needs numpy: pip install numpy")
+
+    backend = args.backend or DB_BACKEND
+    with contextlib.redirect_stdout(sys.stderr):
+        db = open_database(backend, **({'minconn': 1, 'maxconn': 1} if backend == 'postgres' else {}))
+    if not db.pool:
+        raise SystemExit(1)
+    try:
+        recommender = BookRecommender(db)
+        elapsed = recommender.refresh()
+        start = time.perf_counter()
+        if args.book is not None:
+            results = recommender.similar_books(args.book, args.top)
+        else:
+            results = recommender.recommend_for_member(args.member, args.top)
+        queried = time.perf_counter() - start
+        titles = {row[0]: row[1] for row in db.get_books_by_ids([book_id for book_id, _ in results])}
+    finally:
+        db.close()
+    for book_id, score in results:
+        print(f"{score:6.3f}  {titles.get(book_id, book_id)}")
+    if not results:
+        print("No recommendations yet.")
+    print(f"Built in {elapsed:.1f} s from loans up to #{recommender.last_loan_id}; "
+          f"query took {queried * 1000:.1f} ms", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
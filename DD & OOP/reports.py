@@ -0,0 +1,125 @@
+"""
+reports.py
+Exports SmartLibrary reports to CSV or JSON Lines in constant memory. Rows are streamed from
+the database (DatabaseManager.iter_* methods, server-side cursors) straight to the file, so
+a loan history of tens of millions of rows needs no more memory than one batch:
+
+    python reports.py overdue --output overdue.csv
+    python reports.py loans --since 2024-01-01 --until 2025-01-01 --output loans-2024.jsonl
+    python reports.py catalog --search manga --format jsonl > manga.jsonl
+
+The format follows the output file's extension unless --format is given (CSV on stdout).
+Progress goes to stderr.
+"""
+import argparse
+import contextlib
+import csv
+import datetime
+import json
+import os
+import sys
+import time
+
+from backends import BACKENDS, DB_BACKEND, STREAM_ITERSIZE, open_database
+
+PROGRESS_EVERY = 100_000  # rows between progress lines
+
+# Report name -> (column names, function(db, args) returning a row iterator)
+REPORTS = {
+    'overdue': (('title', 'member', 'due_date', 'days_overdue'),
+                lambda db, args: db.iter_overdue_books(itersize=args.itersize)),
+    'loans': (('loan_id', 'book_id', 'title', 'user_id', 'member', 'borrow_date', 'due_date', 'return_date'),
+              lambda db, args: db.iter_loan_history(args.since, args.until, itersize=args.itersize)),
+    'catalog': (('book_id', 'title', 'genre', 'publication_year', 'available', 'authors'),
+                lambda db, args: db.iter_all_books(args.search, itersize=args.itersize)),
+}
+FORMATS = ('csv', 'jsonl')
+
+
+def _json_value(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"Cannot write {type(value).__name__} to JSON")
+
+
+def write_csv(rows, columns, out):
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(row)
+        yield
+
+
+def write_jsonl(rows, columns, out):
+    for row in rows:
+        out.write(json.dumps(dict(zip(columns, row)), default=_json_value, ensure_ascii=False))
+        out.write("\n")
+        yield
+
+
+WRITERS = {'csv': write_csv, 'jsonl': write_jsonl}
+
+
+def export(db, report, args, out, fmt='csv', progress=None):
+    """Streams one report (filtered by the parsed command-line `args`) to the open text file `out`.
+
+    Returns the number of rows written.
+    """
+    columns, fetch = REPORTS[report]
+    rows = fetch(db, args)
+    written, start = 0, time.perf_counter()
+    try:
+        for _ in WRITERS[fmt](rows, columns, out):
+            written += 1
+            if progress and written % PROGRESS_EVERY == 0:
+                elapsed = time.perf_counter() - start
+                progress(f"  {written:,} rows ({written / elapsed:,.0f} rows/s)")
+    finally:
+        rows.close()  # hands the connection back if the export stopped early
+    return written
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def _date(text):
+    return datetime.date.fromisoformat(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("report", choices=sorted(REPORTS))
+    parser.add_argument("--output", help="file to write (default: stdout)")
+    parser.add_argument("--format", choices=FORMATS, help="default: from the output file's extension, else csv")
+    parser.add_argument("--since", type=_date, help="loans: borrowed on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--until", type=_date, help="loans: borrowed before this date (YYYY-MM-DD)")
+    parser.add_argument("--search", help="catalog: only books matching this search")
+    parser.add_argument("--itersize", type=int, default=STREAM_ITERSIZE, help="rows fetched per round trip")
+    parser.add_argument("--backend", choices=BACKENDS, help="default: backends.DB_BACKEND")
+    args = parser.parse_args()
+
+    fmt = args.format
+    if fmt is None:
+        extension = os.path.splitext(args.output or "")[1].lower().lstrip('.')
+        fmt = 'jsonl' if extension in ('jsonl', 'ndjson') else 'csv'
+
+    backend = args.backend or DB_BACKEND
+    with contextlib.redirect_stdout(sys.stderr):  # keep connection messages out of a report on stdout
+        db = open_database(backend, **({'minconn': 1, 'maxconn': 1} if backend == 'postgres' else {}))
+    if not db.pool:
+        raise SystemExit(1)
+    start = time.perf_counter()
+    try:
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8', newline='') as out:
+                written = export(db, args.report, args, out, fmt, progress=log)
+        else:
+            written = export(db, args.report, args, sys.stdout, fmt, progress=log)
+    finally:
+        db.close()
+    log(f"Exported {written:,} {args.report} rows as {fmt} in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
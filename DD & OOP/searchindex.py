@@ -0,0 +1,217 @@
+"""
+searchindex.py
+In-memory search engine over catalog rows (id, title, genre, year, available, authors).
+A token inverted index with compact sorted integer posting lists, plus a prefix trie so
+every query word matches as a prefix and a trigram index over the tokens so longer queries
+also match as a substring of the title, genre or an author's name: the same filter as
+DatabaseManager.search_books (search_document prefixes OR pg_trgm ILIKE).
+"""
+import bisect
+import re
+from array import array
+
+TOKEN_RE = re.compile(r"\w+")
+# Queries this long (stripped) also match as substrings, as databasemanager.TRIGRAM_MIN_LENGTH
+SUBSTRING_MIN_LENGTH = 3
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(str(text).lower()) if text else []
+
+
+def _intersect(a, b):
+    """Intersection of two sorted id sequences, walking the shorter one with binary search."""
+    if len(a) > len(b):
+        a, b = b, a
+    result = array('i')
+    lo = 0
+    for book_id in a:
+        lo = bisect.bisect_left(b, book_id, lo)
+        if lo == len(b):
+            break
+        if b[lo] == book_id:
+            result.append(book_id)
+    return result
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class _TrieNode:
+    __slots__ = ('children', 'terminal')
+
+    def __init__(self):
+        self.children = {}
+        self.terminal = False
+
+
+class PrefixTrie:
+    """Set of tokens supporting 'every token starting with ...' lookups."""
+
+    def __init__(self):
+        self.root = _TrieNode()
+
+    def add(self, token):
+        node = self.root
+        for ch in token:
+            node = node.children.setdefault(ch, _TrieNode())
+        node.terminal = True
+
+    def remove(self, token):
+        path = [self.root]
+        for ch in token:
+            node = path[-1].children.get(ch)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].terminal = False
+        # Prune branches that no longer lead to any token
+        for depth in range(len(token), 0, -1):
+            node = path[depth]
+            if node.terminal or node.children:
+                break
+            del path[depth - 1].children[token[depth - 1]]
+
+    def with_prefix(self, prefix):
+        node = self.root
+        for ch in prefix:
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        tokens, stack = [], [(node, prefix)]
+        while stack:
+            node, text = stack.pop()
+            if node.terminal:
+                tokens.append(text)
+            stack.extend((child, text + ch) for ch, child in node.children.items())
+        return tokens
+
+
+class CatalogSearchIndex:
+    """Inverted index over title, genre and author tokens.
+
+    search() returns ids of books where every query word is a prefix of one of the
+    book's tokens or, from SUBSTRING_MIN_LENGTH characters, where the whole query appears
+    in the title, genre or an author's name. add/update/remove keep the index current one
+    book at a time.
+    """
+
+    def __init__(self, rows=()):
+        self._postings = {}    # token -> array('i') of book ids, ascending
+        self._doc_tokens = {}  # book id -> tokens it was indexed under
+        self._trie = PrefixTrie()
+        self._token_trigrams = {}  # trigram -> set of tokens containing it
+        self._doc_texts = {}       # book id -> lowercased title, genre and author names
+        for row in rows:
+            self.add(row)
+
+    def __len__(self):
+        return len(self._doc_tokens)
+
+    def __contains__(self, book_id):
+        return book_id in self._doc_tokens
+
+    @staticmethod
+    def _row_tokens(row):
+        _, title, genre, _, _, authors = row[:6]
+        if authors == 'N/A':
+            authors = None
+        return frozenset(tokenize(title) + tokenize(genre) + tokenize(authors))
+
+    @staticmethod
+    def _row_texts(row):
+        """The fields a substring may match, each on its own so no match spans two of them."""
+        _, title, genre, _, _, authors = row[:6]
+        names = authors.split(', ') if authors and authors != 'N/A' else []
+        return tuple(str(text).lower() for text in [title, genre, *names] if text)
+
+    def add(self, row):
+        book_id = row[0]
+        if book_id in self._doc_tokens:
+            self.remove(book_id)
+        tokens = self._row_tokens(row)
+        self._doc_tokens[book_id] = tokens
+        self._doc_texts[book_id] = self._row_texts(row)
+        for token in tokens:
+            postings = self._postings.get(token)
+            if postings is None:
+                self._postings[token] = array('i', [book_id])
+                self._trie.add(token)
+                for gram in trigrams(token):
+                    self._token_trigrams.setdefault(gram, set()).add(token)
+            else:
+                bisect.insort(postings, book_id)
+
+    update = add
+
+    def remove(self, book_id):
+        tokens = self._doc_tokens.pop(book_id, ())
+        self._doc_texts.pop(book_id, None)
+        for token in tokens:
+            postings = self._postings[token]
+            del postings[bisect.bisect_left(postings, book_id)]
+            if not postings:
+                del self._postings[token]
+                self._trie.remove(token)
+                for gram in trigrams(token):
+                    grams = self._token_trigrams[gram]
+                    grams.discard(token)
+                    if not grams:
+                        del self._token_trigrams[gram]
+
+    def _prefix_postings(self, prefix):
+        return self._union_postings(self._trie.with_prefix(prefix))
+
+    def _substring_postings(self, word):
+        """Books with a token containing `word`, which is all a one-word substring can match;
+        the trigram index narrows the tokens to check."""
+        if len(word) < 3:
+            tokens = self._postings
+        else:
+            tokens = set.intersection(*(self._token_trigrams.get(gram, set()) for gram in trigrams(word)))
+        return self._union_postings([token for token in tokens if word in token])
+
+    def _union_postings(self, tokens):
+        if len(tokens) == 1:
+            return self._postings[tokens[0]]
+        ids = set()
+        for token in tokens:
+            ids.update(self._postings[token])
+        return array('i', sorted(ids))
+
+    @staticmethod
+    def _intersect_all(lists):
+        # Most selective (shortest) posting list first keeps the intersections small
+        lists = sorted(lists, key=len)
+        result = lists[0]
+        for postings in lists[1:]:
+            if not result:
+                break
+            result = _intersect(result, postings)
+        return result
+
+    def _substring_ids(self, text, words):
+        """Ids of books whose title, genre or an author's name contains `text` (of several words)."""
+        # Each word lies inside some token of a match; confirm the whole text on those books
+        candidates = self._intersect_all([self._substring_postings(word) for word in set(words)])
+        return [book_id for book_id in candidates if any(text in field for field in self._doc_texts[book_id])]
+
+    def search(self, query, limit=None):
+        """Ascending ids of books matching every word of `query` as a prefix, or the whole
+        query as a substring (all books if it has no words)."""
+        words = tokenize(query)
+        if not words:
+            ids = sorted(self._doc_tokens)
+            return ids[:limit] if limit is not None else ids
+
+        text = str(query).strip().lower()
+        if len(text) < SUBSTRING_MIN_LENGTH:
+            ids = list(self._intersect_all([self._prefix_postings(word) for word in set(words)]))
+        elif [text] == words:
+            # A word's prefix matches are among its substring matches
+            ids = list(self._substring_postings(text))
+        else:
+            ids = sorted(set(self._intersect_all([self._prefix_postings(word) for word in set(words)]))
+                         .union(self._substring_ids(text, words)))
+        return ids[:limit] if limit is not None else ids
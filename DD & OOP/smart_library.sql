@@ -1,4 +1,5 @@
 Create the database smart_library;
+-- This is the baseline schema. Later changes are in migrations/; apply them with: python migrate.py
 
 
 SET search_path to smart_library, public;
@@ -0,0 +1,188 @@
+-- SmartLibrary schema for the embedded SQLite backend (sqlitedatabasemanager.py).
+-- Mirrors smart_library.sql: same tables and columns, and the borrowing rules (availability,
+-- max 3 active loans, one active loan per book) as SQLite triggers and indexes.
+-- Dashboard counts and 7/30-day popularity are computed at read time instead of kept in
+-- counter tables, which is cheap at single-branch scale.
+-- Applied automatically by SQLiteDatabaseManager when it opens an empty database file.
+
+-- 1. TABLES
+CREATE TABLE Roles (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL
+);
+
+CREATE TABLE Users (
+    id INTEGER PRIMARY KEY,
+    username TEXT UNIQUE NOT NULL,
+    password_hash TEXT NOT NULL,
+    role_id INTEGER NOT NULL REFERENCES Roles(id) ON DELETE RESTRICT,
+    email TEXT UNIQUE,
+    full_name TEXT NOT NULL,
+    active_loans INTEGER NOT NULL DEFAULT 0 CHECK (active_loans BETWEEN 0 AND 3) -- maintained by triggers
+);
+
+CREATE TABLE Authors (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    bio TEXT
+);
+
+CREATE TABLE Books (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    genre TEXT,
+    publication_year INTEGER,
+    available BOOLEAN NOT NULL DEFAULT 1
+);
+
+CREATE TABLE BookAuthors (
+    book_id INTEGER NOT NULL REFERENCES Books(id) ON DELETE CASCADE,
+    author_id INTEGER NOT NULL REFERENCES Authors(id) ON DELETE CASCADE,
+    PRIMARY KEY (book_id, author_id)
+);
+
+CREATE TABLE Loans (
+    id INTEGER PRIMARY KEY,
+    book_id INTEGER NOT NULL REFERENCES Books(id) ON DELETE RESTRICT,
+    user_id INTEGER NOT NULL REFERENCES Users(id) ON DELETE RESTRICT,
+    borrow_date DATE NOT NULL DEFAULT (date('now', 'localtime')),
+    due_date DATE NOT NULL,
+    return_date DATE, -- NULL means the book is currently borrowed (active loan)
+    CHECK (due_date = date(borrow_date, '+7 days'))
+);
+
+CREATE TABLE BookClubs (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    description TEXT,
+    created_by INTEGER NOT NULL REFERENCES Users(id) ON DELETE RESTRICT
+);
+
+CREATE TABLE ClubMemberships (
+    id INTEGER PRIMARY KEY,
+    club_id INTEGER NOT NULL REFERENCES BookClubs(id) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL REFERENCES Users(id) ON DELETE CASCADE,
+    join_date DATE DEFAULT (date('now', 'localtime')),
+    UNIQUE (club_id, user_id)
+);
+
+-- All-time loans per book, maintained by the Loans trigger below
+CREATE TABLE BookLoanStats (
+    book_id INTEGER PRIMARY KEY REFERENCES Books(id) ON DELETE CASCADE,
+    total_loans INTEGER NOT NULL DEFAULT 0
+);
+
+-- 2. INDEXES
+CREATE UNIQUE INDEX idx_loans_one_active_per_book ON Loans (book_id) WHERE return_date IS NULL;
+CREATE INDEX idx_loans_active_user ON Loans (user_id) WHERE return_date IS NULL;
+CREATE INDEX idx_loans_active_due_date ON Loans (due_date) WHERE return_date IS NULL;
+CREATE INDEX idx_loans_borrow_date ON Loans (borrow_date, book_id);
+CREATE INDEX idx_loans_user_book ON Loans (user_id, book_id);
+CREATE INDEX idx_books_title_id ON Books (title, id);
+CREATE INDEX idx_books_year_id ON Books (COALESCE(publication_year, 0), id);
+CREATE INDEX idx_bookauthors_author ON BookAuthors (author_id);
+CREATE INDEX idx_club_memberships_user ON ClubMemberships (user_id);
+CREATE INDEX idx_bookloanstats_top ON BookLoanStats (total_loans DESC, book_id);
+
+-- 3. TRIGGERS (the rules smart_library.sql implements in PL/pgSQL)
+-- Max 3 active loans, checked against the member's counter
+CREATE TRIGGER enforce_loan_limit BEFORE INSERT ON Loans
+WHEN NEW.return_date IS NULL
+BEGIN
+    SELECT RAISE(ABORT, 'Member cannot have more than 3 active loans')
+    WHERE (SELECT active_loans FROM Users WHERE id = NEW.user_id) >= 3;
+END;
+
+-- A new active loan takes a slot and makes the book unavailable
+CREATE TRIGGER tr_book_borrow AFTER INSERT ON Loans
+WHEN NEW.return_date IS NULL
+BEGIN
+    UPDATE Users SET active_loans = active_loans + 1 WHERE id = NEW.user_id;
+    UPDATE Books SET available = 0 WHERE id = NEW.book_id;
+END;
+
+-- A return gives the slot back and makes the book available again
+CREATE TRIGGER tr_book_return AFTER UPDATE OF return_date ON Loans
+WHEN OLD.return_date IS NULL AND NEW.return_date IS NOT NULL
+BEGIN
+    UPDATE Users SET active_loans = active_loans - 1 WHERE id = NEW.user_id;
+    UPDATE Books SET available = 1 WHERE id = NEW.book_id;
+END;
+
+CREATE TRIGGER tr_loan_release_slot AFTER DELETE ON Loans
+WHEN OLD.return_date IS NULL
+BEGIN
+    UPDATE Users SET active_loans = active_loans - 1 WHERE id = OLD.user_id;
+END;
+
+CREATE TRIGGER tr_loans_count_popularity AFTER INSERT ON Loans
+BEGIN
+    INSERT INTO BookLoanStats (book_id, total_loans) VALUES (NEW.book_id, 1)
+    ON CONFLICT (book_id) DO UPDATE SET total_loans = total_loans + 1;
+END;
+
+-- 4. VIEWS
+CREATE VIEW OverdueBooksReport AS
+SELECT b.title, u.full_name, l.due_date,
+       CAST(julianday('now', 'localtime', 'start of day') - julianday(l.due_date) AS INTEGER) AS days_overdue
+FROM Loans l
+JOIN Books b ON l.book_id = b.id
+JOIN Users u ON l.user_id = u.id
+WHERE l.return_date IS NULL AND l.due_date < date('now', 'localtime');
+
+CREATE VIEW PopularBooksReport AS
+SELECT b.title, b.genre, s.total_loans AS times_borrowed, b.id AS book_id
+FROM BookLoanStats s
+JOIN Books b ON b.id = s.book_id
+WHERE s.total_loans > 0
+ORDER BY s.total_loans DESC, s.book_id;
+
+-- 5. DATA (same seed as smart_library.sql)
+INSERT INTO Roles (name) VALUES ('Librarian'), ('Member');
+
+INSERT INTO Authors (name, bio) VALUES
+('Chinua Achebe', 'Nigerian novelist, known for "Things Fall Apart".'),
+('Chimamanda Ngozi Adichie', 'Nigerian novelist, known for "Half of a Yellow Sun".'),
+('James Clear', 'Author of "Atomic Habits".'),
+('Robert Kiyosaki', 'Author of "Rich Dad Poor Dad".'),
+('Yuval Noah Harari', 'Author of "Sapiens".'),
+('George Orwell', 'Author of "1984".'),
+('Harper Lee', 'Author of "To Kill a Mockingbird".'),
+('Jane Austen', 'Author of "Pride and Prejudice".'),
+('F. Scott Fitzgerald', 'Author of "The Great Gatsby".'),
+('Masashi Kishimoto', 'Creator of Naruto.'),
+('Eiichiro Oda', 'Creator of One Piece.');
+
+-- usernames must be unique here too, so the third user is 'mohamed_kamara'
+INSERT INTO Users (username, password_hash, full_name, email, role_id) VALUES
+('benefit_jr', '5440', 'Osman Sheriff', 'osmansheriff@limkokwing.sl', 1),
+('Henry_Faylo', '5437', 'Henry Bangura', 'henryb@limkokwing.sl', 1),
+('mohamed_kamara', '1234', 'Mohamed Kamara', 'mohamed@limkokwing.sl', 2),
+('Selwyn', 'sel123', 'Selwyn Sheriff', 'selwyn@gmail.com', 2),
+('mohamed_koroma', 'mohamed123', 'Mohamed Koroma', 'mohamed@gmail.com', 2),
+('zainab_kamara', 'zainab123', 'Zainab Kamara', 'zainab@gmail.com', 2);
+
+INSERT INTO Books (title, genre, publication_year, available) VALUES
+('Things Fall Apart', 'African Literature', 1958, 1),
+('Half of a Yellow Sun', 'Historical Fiction', 2006, 1),
+('Americanah', 'Contemporary Fiction', 2013, 1),
+('Atomic Habits', 'Self-Help', 2018, 1),
+('Rich Dad Poor Dad', 'Finance', 1997, 1),
+('Sapiens: A Brief History of Humankind', 'Non-Fiction', 2011, 1),
+('1984', 'Dystopian', 1949, 1),
+('To Kill a Mockingbird', 'Classic', 1960, 1),
+('Pride and Prejudice', 'Romance', 1813, 1),
+('The Great Gatsby', 'Classic', 1925, 1),
+('Naruto Vol.1', 'Manga', 1999, 1),
+('One Piece Vol.1', 'Manga', 1997, 1);
+
+INSERT INTO BookAuthors (book_id, author_id) VALUES
+(1, 1), (2, 2), (3, 2), (4, 3), (5, 4), (6, 5), (7, 6), (8, 7), (9, 8), (10, 9), (11, 10), (12, 11);
+
+INSERT INTO BookClubs (name, description, created_by) VALUES
+('Manga Lovers Club', 'Weekly manga discussions', 1),
+('African Literature Circle', 'Reading Chinua Achebe, Adichie, etc.', 2),
+('Self-Improvement Society', 'Atomic Habits, Rich Dad Poor Dad', 3);
+
+INSERT INTO ClubMemberships (club_id, user_id) VALUES
+(1, 3), (1, 4), (2, 5), (3, 6);
@@ -0,0 +1,233 @@
+"""
+snapshot.py
+Columnar snapshots of SmartLibrary for off-box analytics. Streams Loans, Books, BookAuthors,
+Users, ClubMemberships and their deletions out of PostgreSQL into compressed Parquet (or Arrow IPC) files, so
+heavy queries run against the files instead of competing with checkouts:
+
+    python snapshot.py --output /data/smartlibrary            # rows changed since the last run
+    python snapshot.py --output /data/smartlibrary --full     # everything
+    python snapshot.py --output /data/smartlibrary --format arrow
+
+Layout under --output (Hive-style partitions, readable by pyarrow.dataset, DuckDB, Spark):
+
+    loans/borrow_month=2024-05/part-20261018T101500Z-3f9c2a1b.parquet
+    books/part-20261018T101500Z-3f9c2a1b.parquet
+    book_authors/part-20261018T101500Z-3f9c2a1b.parquet
+    users/..., club_memberships/..., deletions/...
+    _watermark.json
+
+Each run exports the rows whose updated_at (migration 0005) lies after the previous run's
+watermark, as new part files named after the run (its watermark and a random suffix, so
+runs never overwrite each other's parts). Readers take the union of the parts and keep the
+row with the newest updated_at per id. Deleted rows leave no updated_at behind: migration
+0009 records them in DeletedRows, exported as `deletions` (table_name, row_id, deleted_at),
+and readers drop the ids listed there for each table. BookAuthors links are deleted in place
+without tombstones, so book_authors is exported whole every run and readers use only its
+newest part.
+The watermark trails the clock by SNAPSHOT_LAG_SECONDS so that transactions still in flight
+are picked up by the next run. Changes are stamped with clock_timestamp() (migration 0011),
+so a long transaction is only missed if it commits more than the lag after its last change;
+run --full now and then to catch those. Tombstones older than every snapshot's watermark
+are pruned by `python maintenance.py prune-tombstones --snapshot DIR`.
+
+Needs pyarrow (pip install pyarrow); the rest of SmartLibrary does not.
+"""
+import argparse
+import datetime
+import json
+import os
+import time
+import uuid
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pa = None
+
+SNAPSHOT_BATCH_ROWS = 250_000   # rows buffered before they are written out as row groups
+SNAPSHOT_LAG_SECONDS = 60       # the watermark trails now() by this much
+SNAPSHOT_COMPRESSION = 'zstd'
+WATERMARK_FILE = "_watermark.json"
+FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+# Table name -> (query, [(column, type)], column the watermark applies to (None: exported
+# whole every run), partitioned by borrow month?)
+# Users leaves out password hashes and e-mail addresses; analytics has no use for them.
+TABLES = {
+    'loans': ("SELECT id, book_id, user_id, borrow_date, due_date, return_date, updated_at FROM Loans",
+              [('id', 'int32'), ('book_id', 'int32'), ('user_id', 'int32'), ('borrow_date', 'date'),
+               ('due_date', 'date'), ('return_date', 'date'), ('updated_at', 'timestamptz')], 'updated_at', True),
+    'books': ("SELECT id, title, genre, publication_year, available, updated_at FROM Books",
+              [('id', 'int32'), ('title', 'text'), ('genre', 'text'), ('publication_year', 'int32'),
+               ('available', 'bool'), ('updated_at', 'timestamptz')], 'updated_at', False),
+    'book_authors': ("SELECT book_id, author_id FROM BookAuthors",
+                     [('book_id', 'int32'), ('author_id', 'int32')], None, False),
+    'users': ("SELECT id, username, role_id, active_loans, updated_at FROM Users",
+              [('id', 'int32'), ('username', 'text'), ('role_id', 'int32'), ('active_loans', 'int32'),
+               ('updated_at', 'timestamptz')], 'updated_at', False),
+    'club_memberships': ("SELECT id, club_id, user_id, join_date, updated_at FROM ClubMemberships",
+                         [('id', 'int32'), ('club_id', 'int32'), ('user_id', 'int32'), ('join_date', 'date'),
+                          ('updated_at', 'timestamptz')], 'updated_at', False),
+    'deletions': ("SELECT table_name, row_id, deleted_at FROM DeletedRows",
+                  [('table_name', 'text'), ('row_id', 'int32'), ('deleted_at', 'timestamptz')], 'deleted_at', False),
+}
+
+
+def arrow_schema(columns):
+    types = {'int32': pa.int32(), 'text': pa.string(), 'bool': pa.bool_(), 'date': pa.date32(),
+             'timestamptz': pa.timestamp('us', tz='UTC')}
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+
+class PartFile:
+    """One output file, written batch by batch under a temporary name and renamed on close.
+    Refuses to replace a file that is already there."""
+
+    def __init__(self, path, schema, fmt):
+        if os.path.exists(path):
+            raise FileExistsError(f"Snapshot part {path} already exists")
+        self.path = path
+        self.temp_path = path + ".tmp"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if fmt == 'parquet':
+            self.writer = pyarrow.parquet.ParquetWriter(self.temp_path, schema, compression=SNAPSHOT_COMPRESSION)
+        else:
+            options = pyarrow.ipc.IpcWriteOptions(compression=SNAPSHOT_COMPRESSION)
+            self.writer = pyarrow.ipc.new_file(self.temp_path, schema, options=options)
+        self.schema = schema
+
+    def write(self, rows):
+        arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), self.schema)]
+        self.writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+
+    def close(self, keep=True):
+        self.writer.close()
+        if keep:
+            os.replace(self.temp_path, self.path)
+        else:
+            os.remove(self.temp_path)
+
+
+def read_watermark(output):
+    """The watermark of the last finished run into `output`, or None if there has been none."""
+    try:
+        with open(os.path.join(output, WATERMARK_FILE), encoding='utf-8') as f:
+            return datetime.datetime.fromisoformat(json.load(f)['watermark'])
+    except FileNotFoundError:
+        return None
+
+
+class SnapshotExporter:
+    """Exports the TABLES to `output` in `fmt` ('parquet' or 'arrow') through a DatabaseManager."""
+
+    def __init__(self, db, output, fmt='parquet', batch_rows=SNAPSHOT_BATCH_ROWS, lag_seconds=SNAPSHOT_LAG_SECONDS,
+                 progress=print):
+        if pa is None:
+            raise RuntimeError("Snapshots need pyarrow: pip install pyarrow")
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format '{fmt}'. Expected one of {sorted(FORMATS)}")
+        self.db = db
+        self.output = output
+        self.fmt = fmt
+        self.batch_rows = batch_rows
+        self.lag_seconds = lag_seconds
+        self.progress = progress
+
+    def load_watermark(self):
+        return read_watermark(self.output)
+
+    def save_watermark(self, watermark, rows):
+        path = os.path.join(self.output, WATERMARK_FILE)
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump({'watermark': watermark.isoformat(), 'rows': rows,
+                       'finished_at': datetime.datetime.now(datetime.timezone.utc).isoformat()}, f, indent=2)
+        os.replace(path + ".tmp", path)
+
+    def run(self, full=False):
+        """Exports every table; returns {table: rows written}. The watermark advances only if all succeed."""
+        os.makedirs(self.output, exist_ok=True)
+        since = None if full else self.load_watermark()
+        with self.db.cursor() as cur:
+            cur.execute("SELECT now() - make_interval(secs => %s)", (self.lag_seconds,))
+            until = cur.fetchone()[0]
+        run_id = f"{until.astimezone(datetime.timezone.utc):%Y%m%dT%H%M%SZ}-{uuid.uuid4().hex[:8]}"
+        self.progress(f"Exporting changes {'since ' + since.isoformat() if since else 'from the beginning'} "
+                      f"up to {until.isoformat()}")
+
+        rows = {}
+        for table in TABLES:
+            rows[table] = self.export_table(table, since, until, run_id)
+        self.save_watermark(until, rows)
+        return rows
+
+    def export_table(self, table, since, until, run_id):
+        query, columns, changed_at, partitioned = TABLES[table]
+        params = []
+        if changed_at:
+            query += f" WHERE {changed_at} <= %s"
+            params.append(until)
+            if since is not None:
+                query += f" AND {changed_at} > %s"
+                params.append(since)
+        schema = arrow_schema(columns)
+        borrow_date = [name for name, _ in columns].index('borrow_date') if partitioned else None
+
+        parts, buffers, buffered, written = {}, {}, 0, 0
+        start = time.perf_counter()
+
+        def flush():
+            for partition, batch in buffers.items():
+                if partition not in parts:
+                    path = os.path.join(self.output, table, partition, f"part-{run_id}{FORMATS[self.fmt]}")
+                    parts[partition] = PartFile(path, schema, self.fmt)
+                parts[partition].write(batch)
+            buffers.clear()
+
+        ok = False
+        try:
+            for row in self.db.stream_query(query, tuple(params), itersize=min(self.batch_rows, 10_000)):
+                partition = f"borrow_month={row[borrow_date]:%Y-%m}" if partitioned else ""
+                buffers.setdefault(partition, []).append(row)
+                buffered += 1
+                if buffered >= self.batch_rows:
+                    written += buffered
+                    buffered = 0
+                    flush()
+                    self.progress(f"  {table}: {written:,} rows ({time.perf_counter() - start:.1f} s)")
+            written += buffered
+            flush()
+            ok = True
+        finally:
+            for part in parts.values():
+                part.close(keep=ok)
+        self.progress(f"  {table}: {written:,} rows in {len(parts)} file(s) ({time.perf_counter() - start:.1f} s)")
+        return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", required=True, help="snapshot directory")
+    parser.add_argument("--format", choices=sorted(FORMATS), default='parquet')
+    parser.add_argument("--full", action="store_true", help="export everything, ignoring the watermark")
+    parser.add_argument("--batch-rows", type=int, default=SNAPSHOT_BATCH_ROWS)
+    parser.add_argument("--lag", type=int, default=SNAPSHOT_LAG_SECONDS, help="seconds the watermark trails now()")
+    args = parser.parse_args()
+    if pa is None:
+        raise SystemExit("snapshot.py needs pyarrow: pip install pyarrow")
+
+    from databasemanager import DatabaseManager
+    db = DatabaseManager(minconn=1, maxconn=2)
+    if not db.pool:
+        raise SystemExit(1)
+    start = time.perf_counter()
+    try:
+        rows = SnapshotExporter(db, args.output, args.format, args.batch_rows, args.lag).run(full=args.full)
+    finally:
+        db.close()
+    print(f"Exported {sum(rows.values()):,} rows in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,700 @@
+"""
+sqlitedatabasemanager.py
+Embedded SQLite counterpart of DatabaseManager for kiosks, single-desk branches and tests.
+Same operations, arguments and return shapes; the database is one file (smart_library.db by
+default) in WAL mode, so readers never block the desk that is lending a book. An empty file
+is initialised from smart_library_sqlite.sql on first open. Standard library only.
+"""
+import datetime
+import os
+import re
+import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
+
+from backends import (CATALOG_PAGE_SIZE, CATALOG_SORT_KEYS, CHECKOUT_MESSAGES, POPULAR_BOOKS_LIMIT,
+                      RETURN_MESSAGES, SEARCH_RESULT_LIMIT, SQLITE_PATH, STREAM_ITERSIZE, batch_result,
+                      like_pattern)
+from instrumentation import instrument_methods, registry
+
+SQLITE_SCHEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "smart_library_sqlite.sql")
+SQLITE_BUSY_TIMEOUT = 30  # seconds a writer waits for another desk's transaction, like POOL_CHECKOUT_TIMEOUT
+MAX_ACTIVE_LOANS = 3
+LOAN_DAYS = 7
+
+# Window -> days of loan history counted (None = all-time counters)
+POPULARITY_WINDOWS = {
+    '7d': 7,
+    '30d': 30,
+    'all': None,
+}
+
+sqlite3.register_adapter(datetime.date, datetime.date.isoformat)
+sqlite3.register_converter("DATE", lambda value: datetime.date.fromisoformat(value.decode()))
+sqlite3.register_converter("BOOLEAN", lambda value: value not in (b"0", b""))
+
+
+def _error_message(e):
+    return str(e).split('\n')[0]
+
+
+class _Interrupter:
+    """Lets a QueryCanceller abort a running SQLite statement (raises OperationalError 'interrupted')."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def cancel(self):
+        self.conn.interrupt()
+
+
+class _ThreadConnection:
+    """A thread's connection, held in the thread-local; closed once the thread ends and drops it."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+
+class SQLiteConnections:
+    """One connection per thread, opened on first use (sqlite3 connections are not shareable)
+    and closed when the thread ends, so worker threads retired by the pool take theirs along.
+
+    ':memory:' has to be a single connection to be a single database, so it is shared and
+    handed to one thread at a time instead.
+    """
+    maxconn = None  # no cap, unlike DatabaseManager's pool: any number of threads may read
+
+    def __init__(self, path, timeout=SQLITE_BUSY_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self.shared = path == ':memory:'
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._all = []
+        if self.shared:
+            self._all.append(self._connect())
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                               detect_types=sqlite3.PARSE_DECLTYPES,
+                               check_same_thread=False)  # closeall() runs on another thread
+        conn.execute("PRAGMA foreign_keys = ON")
+        if not self.shared:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")  # durable at checkpoints; safe with WAL
+        return conn
+
+    def getconn(self):
+        if self.shared:
+            self._lock.acquire()
+            return self._all[0]
+        held = getattr(self._local, 'held', None)
+        if held is None:
+            held = self._local.held = _ThreadConnection(self._connect())
+            with self._lock:
+                self._all.append(held.conn)
+            weakref.finalize(held, self._release, held.conn)
+        return held.conn
+
+    def _release(self, conn):
+        """Closes the connection of a thread that has ended, unless closeall() got there first."""
+        with self._lock:
+            if conn not in self._all:
+                return
+            self._all.remove(conn)
+        conn.close()
+
+    def putconn(self, conn):
+        if self.shared:
+            self._lock.release()
+
+    def closeall(self):
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all.clear()
+
+
+@instrument_methods(exclude=('cursor', 'transaction', 'close', 'prepared_statement_stats'))
+class SQLiteDatabaseManager:
+    """DatabaseManager over an embedded SQLite file. Check `.pool` after construction, as with DatabaseManager."""
+    backend_name = 'sqlite'
+
+    def __init__(self, path=SQLITE_PATH, timeout=SQLITE_BUSY_TIMEOUT):
+        self.path = path
+        try:
+            self.pool = SQLiteConnections(path, timeout)
+            self._create_schema()
+            print(f"Database opened successfully ({path}).")
+        except (sqlite3.Error, OSError) as e:
+            print(f"Error opening SQLite database '{path}': {e}")
+            self.pool = None
+        self.metrics = registry
+
+    def _create_schema(self):
+        with self.transaction() as conn:
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'Books'").fetchone():
+                return
+            with open(SQLITE_SCHEMA, encoding='utf-8') as f:
+                script = f.read()
+            # executescript() commits first; run the statements inside this transaction instead
+            for statement in self._split_script(script):
+                conn.execute(statement)
+
+    @staticmethod
+    def _split_script(script):
+        statement = ""
+        for line in script.splitlines(keepends=True):
+            if not statement and (not line.strip() or line.lstrip().startswith('--')):
+                continue
+            statement += line
+            if sqlite3.complete_statement(statement):
+                yield statement
+                statement = ""
+
+    def prepared_statement_stats(self):
+        """sqlite3 caches compiled statements per connection itself; nothing to count here."""
+        return {'hits': 0, 'misses': 0, 'evictions': 0, 'reprepares': 0}
+
+    @contextmanager
+    def cursor(self, canceller=None):
+        """Yields a cursor on this thread's connection for a single autocommit call.
+
+        If a QueryCanceller is given, it can interrupt whatever runs on the cursor.
+        """
+        conn = self.pool.getconn()
+        cur = conn.cursor()
+        interrupter = _Interrupter(conn)
+        try:
+            if canceller:
+                canceller.attach(interrupter)
+            yield cur
+        finally:
+            if canceller:
+                canceller.detach(interrupter)
+            cur.close()
+            self.pool.putconn(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Yields this thread's connection inside BEGIN IMMEDIATE.
+
+        The write lock is taken up front, so concurrent desks queue (up to the busy timeout)
+        instead of failing halfway. Commits when the block exits, rolls back if it raises.
+        """
+        conn = self.pool.getconn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                if conn.in_transaction:  # the block may have rolled back itself
+                    conn.execute("COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+        finally:
+            self.pool.putconn(conn)
+
+    def stream_query(self, query, params=(), itersize=STREAM_ITERSIZE, canceller=None):
+        """Yields the rows of `query` one at a time; SQLite steps the statement as rows are fetched.
+
+        Consume it on the thread that created it, promptly: the read snapshot stays open
+        until the generator is exhausted or closed.
+        """
+        with self.cursor(canceller) as cur:
+            cur.arraysize = itersize
+            cur.execute(query, params)
+            while True:
+                rows = cur.fetchmany()
+                if not rows:
+                    return
+                yield from rows
+
+    def close(self):
+        """Closes every thread's connection."""
+        if self.pool:
+            self.pool.closeall()
+
+    def authenticate_user(self, username, password):
+        """Checks credentials and returns user details."""
+        if not self.pool: return None
+        query = "SELECT id, username, full_name, email, role_id FROM Users WHERE username = ? AND password_hash = ?"
+        with self.cursor() as cur:
+            cur.execute(query, (username, password))
+            row = cur.fetchone()
+            if row:
+                return {"id": row[0], "username": row[1], "full_name": row[2], "email": row[3], "role_id": row[4]}
+            return None
+
+    # --- BOOK CATALOG & LOANS ---
+
+    # Catalog row shape of get_all_books; authors are aggregated per book with a correlated subquery
+    _BOOK_COLUMNS = """
+        b.id, b.title, b.genre, b.publication_year, b.available,
+        COALESCE((SELECT group_concat(name, ', ') FROM (
+            SELECT a.name FROM BookAuthors ba JOIN Authors a ON a.id = ba.author_id
+            WHERE ba.book_id = b.id ORDER BY a.name)), 'N/A') AS authors
+    """
+
+    @staticmethod
+    def _catalog_filter(search_query):
+        """SQL condition (and its params): every word appears in the title, genre or an author's name.
+
+        Case-insensitive substring matching with LIKE; returns (None, []) when there is
+        nothing to filter on.
+        """
+        words = re.findall(r"\w+", (search_query or "").lower())
+        if not words:
+            return None, []
+        word_condition = """
+            (b.title LIKE ? ESCAPE '\\' OR b.genre LIKE ? ESCAPE '\\' OR b.id IN (
+                SELECT fba.book_id FROM BookAuthors fba JOIN Authors fa ON fba.author_id = fa.id
+                WHERE fa.name LIKE ? ESCAPE '\\'))
+        """
+        params = []
+        for word in words:
+            params += [like_pattern(word)] * 3
+        return " AND ".join([word_condition] * len(words)), params
+
+    def get_all_books(self, search_query=None):
+        """Retrieves all books with their authors, optionally filtering."""
+        query = f"SELECT {self._BOOK_COLUMNS} FROM Books b"
+        condition, params = self._catalog_filter(search_query)
+        if condition:
+            query += f" WHERE {condition}"
+        with self.cursor() as cur:
+            cur.execute(query + " ORDER BY b.id", params)
+            return cur.fetchall()
+
+    def get_books_by_ids(self, book_ids):
+        """Catalog rows (same shape as get_all_books) for just these books, in one query."""
+        book_ids = [int(book_id) for book_id in book_ids]
+        if not book_ids:
+            return []
+        with self.cursor() as cur:
+            cur.execute(f"SELECT {self._BOOK_COLUMNS} FROM Books b WHERE b.id IN (SELECT value FROM json_each(?)) "
+                        "ORDER BY b.id",
+                        (str(book_ids),))
+            return cur.fetchall()
+
+    def search_books(self, search_query, limit=SEARCH_RESULT_LIMIT, offset=0, canceller=None):
+        """Ranked search over titles, authors and genres; same rows as DatabaseManager.search_books.
+
+        Rank counts where each word matched (title words weigh most, whole-word and prefix
+        matches more than inner substrings). The snippet wraps matches in <b></b>.
+        """
+        condition, params = self._catalog_filter(search_query)
+        if not condition:
+            return []
+        with self.cursor(canceller) as cur:
+            cur.execute(f"SELECT {self._BOOK_COLUMNS} FROM Books b WHERE {condition}", params)
+            rows = cur.fetchall()
+
+        words = re.findall(r"\w+", search_query.lower())
+        ranked = sorted(((row, self._rank(row, words)) for row in rows), key=lambda item: (-item[1], item[0][0]))
+        highlight = re.compile("|".join(re.escape(word) for word in sorted(words, key=len, reverse=True)),
+                               re.IGNORECASE)
+        results = []
+        for row, rank in ranked[offset:offset + limit]:
+            text = " — ".join(part for part in (row[1], row[5], row[2]) if part)
+            results.append(row + (rank, highlight.sub(lambda m: f"<b>{m.group()}</b>", text)))
+        return results
+
+    @staticmethod
+    def _rank(row, words):
+        rank = 0.0
+        for text, weight in ((row[1], 1.0), (row[5], 0.6), (row[2], 0.4)):
+            text = (text or "").lower()
+            for word in words:
+                if re.search(rf"\b{re.escape(word)}", text):
+                    rank += weight
+                elif word in text:
+                    rank += weight / 2
+        return rank
+
+    def get_books_page(self, search_query=None, sort='title', page_size=CATALOG_PAGE_SIZE, after=None,
+                       canceller=None):
+        """Keyset-paginated catalog: returns (rows, next_cursor), as DatabaseManager.get_books_page."""
+        if sort not in CATALOG_SORT_KEYS:
+            raise ValueError(f"Unknown sort '{sort}'. Expected one of {sorted(CATALOG_SORT_KEYS)}")
+        sort_key = CATALOG_SORT_KEYS[sort]
+
+        conditions, params = [], []
+        condition, filter_params = self._catalog_filter(search_query)
+        if condition:
+            conditions.append(condition)
+            params += filter_params
+        if after is not None:
+            conditions.append(f"({sort_key}, b.id) > (?, ?)")
+            params += list(after)
+        where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+        query = f"""
+            SELECT {self._BOOK_COLUMNS}, {sort_key} AS sort_key
+            FROM Books b
+            {where}
+            ORDER BY {sort_key}, b.id
+            LIMIT ?
+        """
+        params.append(page_size + 1)  # one extra row tells us whether another page exists
+
+        with self.cursor(canceller) as cur:
+            cur.execute(query, params)
+            rows = cur.fetchall()
+
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = (rows[-1][6], rows[-1][0])
+        return [row[:6] for row in rows], next_cursor
+
+    def estimate_book_count(self, search_query=None, canceller=None):
+        """Number of matching books. SQLite keeps no row estimates, so this counts (fine at branch scale)."""
+        condition, params = self._catalog_filter(search_query)
+        with self.cursor(canceller) as cur:
+            cur.execute(f"SELECT COUNT(*) FROM Books b {'WHERE ' + condition if condition else ''}", params)
+            return cur.fetchone()[0]
+
+    @staticmethod
+    def _checkout(conn, user_id, book_id):
+        """The checks and insert of checkout_book() (migration 0000). Returns (status, loan_id, due_date)."""
+        row = conn.execute("SELECT active_loans FROM Users WHERE id = ?", (user_id,)).fetchone()
+        if row is None:
+            return 'user_not_found', None, None
+        if row[0] >= MAX_ACTIVE_LOANS:
+            return 'loan_limit', None, None
+        book = conn.execute("SELECT available FROM Books WHERE id = ?", (book_id,)).fetchone()
+        if book is None:
+            return 'book_not_found', None, None
+        if not book[0]:
+            return 'book_unavailable', None, None
+        borrow_date = datetime.date.today()
+        due_date = borrow_date + datetime.timedelta(days=LOAN_DAYS)
+        loan_id = conn.execute("INSERT INTO Loans (book_id, user_id, borrow_date, due_date) VALUES (?, ?, ?, ?)",
+                               (book_id, user_id, borrow_date, due_date)).lastrowid
+        return 'ok', loan_id, due_date
+
+    def checkout_book(self, user_id, book_id):
+        """Atomically lends a book to a member; same checks and result as DatabaseManager.checkout_book.
+
+        Runs under the database write lock, so concurrent desks are serialised and
+        'book_busy' never occurs: the second desk gets 'book_unavailable' instead.
+        """
+        try:
+            with self.transaction() as conn:
+                status, loan_id, due_date = self._checkout(conn, user_id, book_id)
+        except sqlite3.Error as e:
+            return {'status': 'error', 'message': _error_message(e), 'loan_id': None, 'due_date': None}
+        return {'status': status, 'message': CHECKOUT_MESSAGES[status], 'loan_id': loan_id, 'due_date': due_date}
+
+    def borrow_book(self, user_id, book_id):
+        """Attempts to borrow a book. Returns (success, message); see checkout_book for the details."""
+        result = self.checkout_book(user_id, book_id)
+        return result['status'] == 'ok', result['message']
+
+    def borrow_books(self, user_id, book_ids):
+        """Checks out several books in one transaction, all or none; same result as DatabaseManager.borrow_books."""
+        book_ids = list(dict.fromkeys(int(book_id) for book_id in book_ids))
+        items = []
+        try:
+            with self.transaction() as conn:
+                for book_id in book_ids:
+                    status, loan_id, due_date = self._checkout(conn, user_id, book_id)
+                    items.append({'book_id': book_id, 'status': status, 'message': CHECKOUT_MESSAGES[status],
+                                  'loan_id': loan_id, 'due_date': due_date})
+                if any(item['status'] != 'ok' for item in items):
+                    conn.execute("ROLLBACK")
+        except sqlite3.Error as e:
+            message = _error_message(e)
+            items = [{'book_id': book_id, 'status': 'error', 'message': message, 'loan_id': None, 'due_date': None}
+                     for book_id in book_ids]
+            return {'ok': False, 'message': message, 'items': items}
+        return batch_result(items, CHECKOUT_MESSAGES, 'borrowed', cleared=('loan_id', 'due_date'))
+
+    def return_book(self, loan_id):
+        """Returns a book by setting return_date; the Loans triggers free the copy and the member's slot."""
+        try:
+            with self.cursor() as cur:
+                cur.execute("UPDATE Loans SET return_date = ? WHERE id = ?", (datetime.date.today(), loan_id))
+                return True, "Book returned successfully."
+        except Exception as e:
+            return False, str(e)
+
+    def return_loans(self, loan_ids):
+        """Returns several loans in one transaction, all or none; same result as DatabaseManager.return_loans."""
+        loan_ids = list(dict.fromkeys(int(loan_id) for loan_id in loan_ids))
+        id_list = str(loan_ids)
+        try:
+            with self.transaction() as conn:
+                returned = dict(conn.execute(
+                    "SELECT id, return_date IS NOT NULL FROM Loans WHERE id IN (SELECT value FROM json_each(?))",
+                    (id_list,)))
+                statuses = [('loan_not_found' if loan_id not in returned else
+                             'already_returned' if returned[loan_id] else 'ok') for loan_id in loan_ids]
+                if loan_ids and all(status == 'ok' for status in statuses):
+                    conn.execute("UPDATE Loans SET return_date = ? WHERE id IN (SELECT value FROM json_each(?))",
+                                 (datetime.date.today(), id_list))
+        except sqlite3.Error as e:
+            message = _error_message(e)
+            items = [{'loan_id': loan_id, 'status': 'error', 'message': message} for loan_id in loan_ids]
+            return {'ok': False, 'message': message, 'items': items}
+        items = [{'loan_id': loan_id, 'status': status, 'message': RETURN_MESSAGES[status]}
+                 for loan_id, status in zip(loan_ids, statuses)]
+        return batch_result(items, RETURN_MESSAGES, 'returned')
+
+    def get_user_loans(self, user_id):
+        """A member's active loans as (loan_id, title, borrow_date, due_date, return_date, book_id)."""
+        query = """
+            SELECT l.id, b.title, l.borrow_date, l.due_date, l.return_date, l.book_id
+            FROM Loans l JOIN Books b ON l.book_id = b.id
+            WHERE l.user_id = ? AND l.return_date IS NULL
+        """
+        with self.cursor() as cur:
+            cur.execute(query, (user_id,))
+            return cur.fetchall()
+
+    # --- LIBRARIAN: BOOK CRUD ---
+    # Same (success, message, delta) results as DatabaseManager.
+
+    @staticmethod
+    def _link_authors(conn, book_id, author_ids):
+        conn.executemany("INSERT INTO BookAuthors (book_id, author_id) VALUES (?, ?)",
+                         [(book_id, author_id) for author_id in author_ids])
+
+    def add_book(self, title, genre, year, author_ids):
+        """Adds a new book and links it to authors, in one transaction."""
+        author_ids = sorted({int(author_id) for author_id in author_ids})
+        try:
+            with self.transaction() as conn:
+                book_id = conn.execute("INSERT INTO Books (title, genre, publication_year) VALUES (?, ?, ?)",
+                                       (title, genre, year)).lastrowid
+                self._link_authors(conn, book_id, author_ids)
+
+            delta = {'book_id': book_id, 'created': True, 'fields_changed': True,
+                     'authors_added': author_ids, 'authors_removed': []}
+            return True, f"Book '{title}' added successfully with ID {book_id}.", delta
+        except Exception as e:
+            return False, str(e), None
+
+    def update_book(self, book_id, title, genre, year, author_ids):
+        """Updates book details and author links, touching only what actually changed."""
+        desired = {int(author_id) for author_id in author_ids}
+        try:
+            with self.transaction() as conn:
+                row = conn.execute("SELECT title, genre, publication_year FROM Books WHERE id = ?",
+                                   (book_id,)).fetchone()
+                if row is None:
+                    return False, f"Book ID {book_id} no longer exists.", None
+
+                fields_changed = tuple(row) != (title, genre, year)
+                if fields_changed:
+                    conn.execute("UPDATE Books SET title = ?, genre = ?, publication_year = ? WHERE id = ?",
+                                 (title, genre, year, book_id))
+
+                current = {r[0] for r in conn.execute("SELECT author_id FROM BookAuthors WHERE book_id = ?",
+                                                      (book_id,))}
+                removed = sorted(current - desired)
+                added = sorted(desired - current)
+                conn.executemany("DELETE FROM BookAuthors WHERE book_id = ? AND author_id = ?",
+                                 [(book_id, author_id) for author_id in removed])
+                self._link_authors(conn, book_id, added)
+
+            delta = {'book_id': book_id, 'created': False, 'fields_changed': fields_changed,
+                     'authors_added': added, 'authors_removed': removed}
+            if not (fields_changed or added or removed):
+                return True, f"No changes to save for Book ID {book_id}.", delta
+            return True, f"Book ID {book_id} updated successfully.", delta
+        except Exception as e:
+            return False, str(e), None
+
+    def delete_book(self, book_id):
+        """Deletes a book. Cascades to BookAuthors. Will fail if loans reference it (RESTRICT)."""
+        try:
+            with self.cursor() as cur:
+                cur.execute("DELETE FROM Books WHERE id = ?", (book_id,))
+                return True, f"Book ID {book_id} deleted successfully."
+        except sqlite3.IntegrityError as e:
+            if 'FOREIGN KEY' in str(e):
+                return False, "Cannot delete book. There are active loans associated with it."
+            return False, str(e)
+        except sqlite3.Error as e:
+            return False, str(e)
+
+    # --- LIBRARIAN: AUTHOR CRUD ---
+    def get_all_authors(self):
+        """Retrieves all authors."""
+        with self.cursor() as cur:
+            cur.execute("SELECT id, name, bio FROM Authors ORDER BY name")
+            return cur.fetchall()
+
+    def add_author(self, name, bio):
+        """Adds a new author."""
+        try:
+            with self.cursor() as cur:
+                cur.execute("INSERT INTO Authors (name, bio) VALUES (?, ?)", (name, bio))
+                return True, f"Author '{name}' added successfully."
+        except sqlite3.Error as e:
+            if 'UNIQUE constraint failed' in str(e):
+                return False, f"Author name '{name}' already exists."
+            return False, str(e)
+
+    def delete_author(self, author_id):
+        """Deletes an author. Cascades to BookAuthors links."""
+        try:
+            with self.cursor() as cur:
+                cur.execute("DELETE FROM Authors WHERE id = ?", (author_id,))
+                return True, "Author deleted successfully."
+        except sqlite3.Error as e:
+            return False, str(e)
+
+    # --- DASHBOARD & CLUB METHODS ---
+    def get_library_stats(self):
+        """All dashboard counters in one query, counted directly (indexed, cheap at branch scale)."""
+        with self.cursor() as cur:
+            cur.execute("""
+                SELECT (SELECT COUNT(*) FROM Books), (SELECT COUNT(*) FROM Books WHERE available),
+                       (SELECT COUNT(*) FROM Users WHERE role_id = 2), (SELECT COUNT(*) FROM BookClubs),
+                       (SELECT COUNT(*) FROM Loans WHERE return_date IS NULL),
+                       (SELECT COUNT(*) FROM Loans WHERE return_date IS NULL AND due_date < ?)
+            """, (datetime.date.today(),))
+            books, available, members, clubs, active_loans, overdue = cur.fetchone()
+        return {'books': books, 'available': available, 'borrowed': books - available, 'members': members,
+                'clubs': clubs, 'active_loans': active_loans, 'overdue': overdue}
+
+    def get_dashboard_stats(self):
+        return self.get_library_stats()
+
+    def reconcile_library_stats(self):
+        """Rebuilds the trigger-maintained Books.available and Users.active_loans. Returns True if they had drifted."""
+        with self.transaction() as conn:
+            drifted = conn.execute("""
+                UPDATE Books SET available = NOT available
+                WHERE available = (id IN (SELECT book_id FROM Loans WHERE return_date IS NULL))
+            """).rowcount
+            drifted += conn.execute("""
+                UPDATE Users SET active_loans = (
+                    SELECT COUNT(*) FROM Loans l WHERE l.user_id = Users.id AND l.return_date IS NULL)
+                WHERE active_loans != (
+                    SELECT COUNT(*) FROM Loans l WHERE l.user_id = Users.id AND l.return_date IS NULL)
+            """).rowcount
+        return drifted > 0
+
+    def get_popular_books(self, window='all', limit=POPULAR_BOOKS_LIMIT):
+        """Top books as (title, genre, times borrowed) for a window of '7d', '30d' or 'all'.
+
+        'all' reads the trigger-maintained counters; the 7/30-day windows are counted from
+        Loans through idx_loans_borrow_date, so they are always current.
+        """
+        if window not in POPULARITY_WINDOWS:
+            raise ValueError(f"Unknown window '{window}'. Expected one of {sorted(POPULARITY_WINDOWS)}")
+        days = POPULARITY_WINDOWS[window]
+        if days is None:
+            query, params = "SELECT title, genre, times_borrowed FROM PopularBooksReport LIMIT ?", (limit,)
+        else:
+            query = """
+                SELECT b.title, b.genre, recent.loans
+                FROM (SELECT book_id, COUNT(*) AS loans FROM Loans WHERE borrow_date > ?
+                      GROUP BY book_id) recent
+                JOIN Books b ON b.id = recent.book_id
+                ORDER BY recent.loans DESC, recent.book_id
+                LIMIT ?
+            """
+            params = (datetime.date.today() - datetime.timedelta(days=days), limit)
+        try:
+            with self.cursor() as cur:
+                cur.execute(query, params)
+                return cur.fetchall()
+        except sqlite3.Error:
+            return []
+
+    def refresh_popular_books(self):
+        """Nothing to refresh: the windows are computed at read time. Kept for API parity."""
+        return True
+
+    def get_overdue_books(self):
+        try:
+            with self.cursor() as cur:
+                cur.execute("SELECT * FROM OverdueBooksReport")
+                return cur.fetchall()
+        except sqlite3.Error:
+            return []
+
+    # --- STREAMING REPORTS ---
+    # Same generators and row shapes as DatabaseManager's iter_* methods.
+
+    def iter_all_books(self, search_query=None, itersize=STREAM_ITERSIZE):
+        query = f"SELECT {self._BOOK_COLUMNS} FROM Books b"
+        condition, params = self._catalog_filter(search_query)
+        if condition:
+            query += f" WHERE {condition}"
+        yield from self.stream_query(query + " ORDER BY b.id", params, itersize)
+
+    def iter_overdue_books(self, itersize=STREAM_ITERSIZE):
+        yield from self.stream_query("SELECT * FROM OverdueBooksReport ORDER BY due_date, title", (), itersize)
+
+    def iter_club_members(self, club_id, itersize=STREAM_ITERSIZE):
+        query = """
+            SELECT u.full_name, u.email, cm.join_date
+            FROM ClubMemberships cm
+            JOIN Users u ON cm.user_id = u.id
+            WHERE cm.club_id = ?
+            ORDER BY cm.join_date, cm.id
+        """
+        yield from self.stream_query(query, (club_id,), itersize)
+
+    def iter_loan_history(self, since=None, until=None, itersize=STREAM_ITERSIZE):
+        conditions, params = [], []
+        if since is not None:
+            conditions.append("l.borrow_date >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("l.borrow_date < ?")
+            params.append(until)
+        query = f"""
+            SELECT l.id, l.book_id, b.title, l.user_id, u.full_name, l.borrow_date, l.due_date, l.return_date
+            FROM Loans l
+            JOIN Books b ON b.id = l.book_id
+            JOIN Users u ON u.id = l.user_id
+            {"WHERE " + " AND ".join(conditions) if conditions else ""}
+            ORDER BY l.id
+        """
+        yield from self.stream_query(query, params, itersize)
+
+    def get_all_clubs(self):
+        query = """
+            SELECT c.id, c.name, c.description, u.full_name as creator
+            FROM BookClubs c
+            JOIN Users u ON c.created_by = u.id
+        """
+        with self.cursor() as cur:
+            cur.execute(query)
+            return cur.fetchall()
+
+    def join_club(self, user_id, club_id):
+        try:
+            with self.cursor() as cur:
+                cur.execute("INSERT INTO ClubMemberships (club_id, user_id) VALUES (?, ?)", (club_id, user_id))
+                return True, "Joined club successfully!"
+        except sqlite3.Error:
+            return False, "You are already a member of this club."
+
+    def create_club(self, name, description, user_id):
+        try:
+            with self.cursor() as cur:
+                cur.execute("INSERT INTO BookClubs (name, description, created_by) VALUES (?, ?, ?)",
+                            (name, description, user_id))
+                return True, "Club created successfully!"
+        except sqlite3.Error as e:
+            return False, f"Error: {e}"
+
+    def get_club_members(self, club_id):
+        query = """
+            SELECT u.full_name, u.email, cm.join_date
+            FROM ClubMemberships cm
+            JOIN Users u ON cm.user_id = u.id
+            WHERE cm.club_id = ?
+        """
+        with self.cursor() as cur:
+            cur.execute(query, (club_id,))
+            return cur.fetchall()
@@ -0,0 +1,167 @@
+"""
+tablemodels.py
+Model/view building blocks for the main window's tables.
+Rows stay plain tuples from DatabaseManager; buttons are painted by a delegate instead of
+being real widgets, so memory and draw time depend on the visible rows only.
+"""
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QEvent, QRectF, pyqtSignal
+from PyQt5.QtGui import QColor
+from PyQt5.QtWidgets import QStyledItemDelegate, QStyle
+
+# Custom data role: whether the action drawn in a cell can be clicked
+ACTION_ENABLED_ROLE = Qt.UserRole + 1
+
+
+class RowTableModel(QAbstractTableModel):
+    """Read-only table over a list of tuples.
+
+    `headers` name the data columns, which map to row[0], row[1], ... in order (extra
+    tuple fields are ignored). `actions` is a list of (header, label_fn) pairs appended
+    as extra columns; label_fn(row) returns (label, enabled) for that row's button.
+    `tooltip_fn(row, column)`, if given, supplies (rich-text) tooltips for data cells.
+    """
+
+    def __init__(self, headers, actions=(), tooltip_fn=None, parent=None):
+        super().__init__(parent)
+        self.headers = list(headers)
+        self.actions = list(actions)
+        self.tooltip_fn = tooltip_fn
+        self.rows = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers) + len(self.actions)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Vertical:
+            return section + 1
+        if section < len(self.headers):
+            return self.headers[section]
+        return self.actions[section - len(self.headers)][0]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        col = index.column()
+
+        if col < len(self.headers):
+            if role == Qt.DisplayRole:
+                return str(row[col])
+            if role == Qt.ToolTipRole and self.tooltip_fn:
+                return self.tooltip_fn(row, col)
+            return None
+
+        label, enabled = self.actions[col - len(self.headers)][1](row)
+        if role == Qt.DisplayRole:
+            return label
+        if role == ACTION_ENABLED_ROLE:
+            return enabled
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignCenter
+        return None
+
+    def row_data(self, row):
+        return self.rows[row]
+
+    def update_row(self, row, values):
+        """Replaces one row in place, e.g. when a cache reports the book changed."""
+        self.rows[row] = values
+        self.dataChanged.emit(self.index(row, 0), self.index(row, self.columnCount() - 1))
+
+    def refresh_actions(self):
+        """Repaints the action columns, e.g. after state their label_fns read has changed."""
+        if self.rows and self.actions:
+            self.dataChanged.emit(self.index(0, len(self.headers)),
+                                  self.index(len(self.rows) - 1, self.columnCount() - 1))
+
+    def set_rows(self, rows):
+        self.beginResetModel()
+        self.rows = list(rows)
+        self.endResetModel()
+
+    def append_rows(self, rows):
+        if not rows:
+            return
+        first = len(self.rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self.rows.extend(rows)
+        self.endInsertRows()
+
+
+class PagedTableModel(RowTableModel):
+    """RowTableModel that grows page by page as the view scrolls.
+
+    The view calls canFetchMore/fetchMore when it needs more rows; the model then emits
+    fetch_requested and the owner loads the next page in the background and hands it
+    to append_page.
+    """
+    fetch_requested = pyqtSignal()
+
+    def __init__(self, headers, actions=(), tooltip_fn=None, parent=None):
+        super().__init__(headers, actions, tooltip_fn, parent)
+        self._has_more = False
+        self._fetching = False
+
+    def reset(self):
+        """Clears all rows and marks the first page as being fetched."""
+        self.beginResetModel()
+        self.rows = []
+        self._has_more = True
+        self._fetching = True
+        self.endResetModel()
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._has_more and not self._fetching
+
+    def fetchMore(self, parent=QModelIndex()):
+        if self.canFetchMore(parent):
+            self._fetching = True
+            self.fetch_requested.emit()
+
+    def append_page(self, rows, has_more):
+        self._fetching = False
+        self._has_more = has_more
+        self.append_rows(rows)
+
+    def fetch_failed(self):
+        # Stop asking for pages until the next reset, or the view would retry forever
+        self._fetching = False
+        self._has_more = False
+
+
+class ButtonDelegate(QStyledItemDelegate):
+    """Paints an action column as themed buttons and reports clicks by row."""
+    clicked = pyqtSignal(int)
+
+    def paint(self, painter, option, index):
+        label = index.data(Qt.DisplayRole)
+        if not label:
+            return
+        if not index.data(ACTION_ENABLED_ROLE):
+            # Disabled actions (e.g. "Unavailable") render as plain centered text
+            super().paint(painter, option, index)
+            return
+
+        hovered = bool(option.state & QStyle.State_MouseOver)
+        rect = QRectF(option.rect.adjusted(4, 3, -4, -3))
+
+        painter.save()
+        painter.setRenderHint(painter.Antialiasing)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QColor("#778da9" if hovered else "#415a77"))
+        painter.drawRoundedRect(rect, 8, 8)
+        painter.setPen(QColor("#e0e1dd"))
+        painter.drawText(rect, Qt.AlignCenter, label)
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        if (event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton
+                and index.data(ACTION_ENABLED_ROLE) and option.rect.contains(event.pos())):
+            self.clicked.emit(index.row())
+            return True
+        return super().editorEvent(event, model, option, index)
@@ -0,0 +1,168 @@
+"""
+test_sqlite_backend.py
+The BACKEND_API contract, checked against the embedded SQLite backend on a throwaway
+in-memory database seeded by smart_library_sqlite.sql.
+
+    python -m pytest test_sqlite_backend.py
+"""
+import datetime
+import gc
+import threading
+
+import pytest
+
+from backends import BACKEND_API, QueryCanceller, QueryCancelled, missing_methods, open_database
+
+MEMBER = 3        # mohamed_kamara in the seed data
+OTHER_MEMBER = 4  # Selwyn
+ATOMIC_HABITS = 4
+
+
+@pytest.fixture
+def db():
+    db = open_database('sqlite', path=':memory:')
+    assert db.pool
+    yield db
+    db.close()
+
+
+def test_implements_backend_api(db):
+    assert missing_methods(db) == []
+    assert db.backend_name == 'sqlite'
+    assert len(BACKEND_API) == len(set(BACKEND_API))
+
+
+def test_authenticate_user(db):
+    user = db.authenticate_user('mohamed_kamara', '1234')
+    assert user == {'id': MEMBER, 'username': 'mohamed_kamara', 'full_name': 'Mohamed Kamara',
+                    'email': 'mohamed@limkokwing.sl', 'role_id': 2}
+    assert db.authenticate_user('mohamed_kamara', 'wrong') is None
+    assert db.authenticate_user('nobody', '1234') is None
+
+
+@pytest.mark.parametrize('sort', ['title', 'year', 'id'])
+def test_books_page_walks_the_whole_catalog(db, sort):
+    everything = db.get_all_books()
+    seen, after = [], None
+    while True:
+        rows, after = db.get_books_page(sort=sort, page_size=5, after=after)
+        assert len(rows) <= 5
+        seen += rows
+        if after is None:
+            break
+    assert sorted(seen) == sorted(everything)
+    assert len({row[0] for row in seen}) == len(everything)
+    key = {'title': lambda row: (row[1], row[0]), 'year': lambda row: (row[3] or 0, row[0]),
+           'id': lambda row: row[0]}[sort]
+    assert seen == sorted(seen, key=key)
+
+
+def test_books_page_search_matches_substrings(db):
+    rows, after = db.get_books_page('tomic')
+    assert [row[0] for row in rows] == [ATOMIC_HABITS] and after is None
+    assert db.estimate_book_count('tomic') == 1
+    assert db.estimate_book_count() == len(db.get_all_books())
+    assert db.get_books_page('no such book') == ([], None)
+
+
+def test_cancelled_canceller_refuses_to_run(db):
+    canceller = QueryCanceller()
+    canceller.cancel()
+    with pytest.raises(QueryCancelled):
+        db.get_books_page(canceller=canceller)
+
+
+def test_canceller_shared_by_concurrent_calls_cancels_each():
+    class Conn:
+        cancelled = False
+
+        def cancel(self):
+            self.cancelled = True
+
+    canceller, first, second = QueryCanceller(), Conn(), Conn()
+    canceller.attach(first)
+    canceller.attach(second)
+    canceller.detach(first)  # the first call finishing must not orphan the second
+    canceller.cancel()
+    assert (first.cancelled, second.cancelled) == (False, True)
+
+
+def test_thread_connections_close_with_their_threads(tmp_path):
+    db = open_database('sqlite', path=str(tmp_path / 'library.db'))
+    try:
+        opened = len(db.pool._all)
+        for _ in range(5):
+            worker = threading.Thread(target=db.get_all_books)
+            worker.start()
+            worker.join()
+        gc.collect()
+        assert len(db.pool._all) == opened
+    finally:
+        db.close()
+
+
+def test_checkout_book(db):
+    result = db.checkout_book(MEMBER, ATOMIC_HABITS)
+    assert result['status'] == 'ok'
+    assert result['due_date'] == datetime.date.today() + datetime.timedelta(days=7)
+    assert [loan[0] for loan in db.get_user_loans(MEMBER)] == [result['loan_id']]
+    assert not db.get_books_by_ids([ATOMIC_HABITS])[0][4]
+
+    assert db.checkout_book(OTHER_MEMBER, ATOMIC_HABITS)['status'] == 'book_unavailable'
+    assert db.checkout_book(MEMBER, 999)['status'] == 'book_not_found'
+    assert db.checkout_book(999, 1)['status'] == 'user_not_found'
+
+
+def test_checkout_book_enforces_loan_limit(db):
+    for book_id in (1, 2, 3):
+        assert db.checkout_book(MEMBER, book_id)['status'] == 'ok'
+    assert db.checkout_book(MEMBER, 5)['status'] == 'loan_limit'
+    assert db.borrow_book(MEMBER, 5)[0] is False
+
+
+def test_borrow_books_lends_all(db):
+    result = db.borrow_books(MEMBER, [1, 2, 2])
+    assert result['ok']
+    assert [(item['book_id'], item['status']) for item in result['items']] == [(1, 'ok'), (2, 'ok')]
+    assert sorted(loan[5] for loan in db.get_user_loans(MEMBER)) == [1, 2]
+
+
+def test_borrow_books_is_all_or_nothing(db):
+    assert db.checkout_book(OTHER_MEMBER, 2)['status'] == 'ok'
+    result = db.borrow_books(MEMBER, [1, 2])
+    assert not result['ok']
+    assert [item['status'] for item in result['items']] == ['rolled_back', 'book_unavailable']
+    assert result['items'][0]['loan_id'] is None
+    assert db.get_user_loans(MEMBER) == []
+    assert db.get_books_by_ids([1])[0][4]  # still available
+
+
+def test_return_loans(db):
+    loan_ids = [item['loan_id'] for item in db.borrow_books(MEMBER, [1, 2])['items']]
+    result = db.return_loans(loan_ids)
+    assert result['ok'] and [item['status'] for item in result['items']] == ['ok', 'ok']
+    assert db.get_user_loans(MEMBER) == []
+    assert all(row[4] for row in db.get_books_by_ids([1, 2]))
+    assert db.get_library_stats()['active_loans'] == 0
+
+
+def test_return_loans_is_all_or_nothing(db):
+    returned = db.checkout_book(MEMBER, 1)['loan_id']
+    assert db.return_book(returned)[0]
+    out = db.checkout_book(MEMBER, 2)['loan_id']
+
+    result = db.return_loans([out, returned, 999])
+    assert not result['ok']
+    assert [item['status'] for item in result['items']] == ['rolled_back', 'already_returned', 'loan_not_found']
+    assert [loan[0] for loan in db.get_user_loans(MEMBER)] == [out]
+
+
+def test_library_stats_follow_loans(db):
+    before = db.get_library_stats()
+    db.borrow_books(MEMBER, [1, 2])
+    after = db.get_library_stats()
+    assert after['active_loans'] == before['active_loans'] + 2
+    assert after['available'] == before['available'] - 2
+    assert after['borrowed'] == before['borrowed'] + 2
+    assert db.get_dashboard_stats() == after
+    assert db.reconcile_library_stats() is False
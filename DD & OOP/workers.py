@@ -0,0 +1,107 @@
+"""
+workers.py
+Background execution of DatabaseManager calls for the Qt GUI.
+Calls run on a QThreadPool; results come back to the GUI thread through signals.
+"""
+import itertools
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal, pyqtSlot
+
+
+class WorkerSignals(QObject):
+    """Signals emitted by a DbWorker. Each carries the task id it belongs to."""
+    result = pyqtSignal(int, object)
+    error = pyqtSignal(int, str)
+
+
+class DbWorker(QRunnable):
+    """Runs a single callable on a pool thread and reports back through WorkerSignals."""
+
+    def __init__(self, task_id, fn, *args, **kwargs):
+        super().__init__()
+        self.task_id = task_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            self.signals.error.emit(self.task_id, str(e))
+        else:
+            self.signals.result.emit(self.task_id, result)
+
+
+class DbTaskRunner(QObject):
+    """Submits database calls to a thread pool and delivers results on the GUI thread.
+
+    Tasks submitted under the same key supersede each other: only the newest one's result
+    is delivered, so a slow search can never overwrite the table with stale rows.
+    Tasks without a key (e.g. borrowing a book) are always delivered.
+    """
+    # key, is_loading. Emitted when the newest task for a key starts or finishes.
+    loading_changed = pyqtSignal(str, bool)
+
+    def __init__(self, max_threads=None, parent=None):
+        super().__init__(parent)
+        self.thread_pool = QThreadPool()
+        if max_threads:
+            self.thread_pool.setMaxThreadCount(max_threads)
+        self._ids = itertools.count(1)
+        self._latest = {}   # key -> newest task id
+        self._pending = {}  # task id -> (key, on_result, on_error, worker)
+
+    def submit(self, fn, *args, key=None, on_result=None, on_error=None, **kwargs):
+        """Runs fn(*args, **kwargs) in the background and returns the task id.
+
+        on_result(result) / on_error(message) are called on the GUI thread unless the task
+        has been superseded by a newer one with the same key, or discarded.
+        """
+        task_id = next(self._ids)
+        worker = DbWorker(task_id, fn, *args, **kwargs)
+        worker.signals.result.connect(self._on_result)
+        worker.signals.error.connect(self._on_error)
+        self._pending[task_id] = (key, on_result, on_error, worker)
+
+        if key is not None:
+            self._latest[key] = task_id
+            self.loading_changed.emit(key, True)
+
+        self.thread_pool.start(worker)
+        return task_id
+
+    def discard(self, key):
+        """Drops any in-flight result for `key`, e.g. when the widget waiting for it closes."""
+        if self._latest.pop(key, None) is not None:
+            self.loading_changed.emit(key, False)
+
+    def is_loading(self, key):
+        return key in self._latest
+
+    def _take(self, task_id):
+        """Returns the callbacks for a finished task, or None if its result is stale."""
+        key, on_result, on_error, _ = self._pending.pop(task_id, (None, None, None, None))
+        if key is None:
+            return on_result, on_error
+        if self._latest.get(key) != task_id:
+            return None
+        del self._latest[key]
+        self.loading_changed.emit(key, False)
+        return on_result, on_error
+
+    @pyqtSlot(int, object)
+    def _on_result(self, task_id, result):
+        callbacks = self._take(task_id)
+        if callbacks and callbacks[0]:
+            callbacks[0](result)
+
+    @pyqtSlot(int, str)
+    def _on_error(self, task_id, message):
+        callbacks = self._take(task_id)
+        if callbacks and callbacks[1]:
+            callbacks[1](message)
+        elif callbacks:
+            print(f"Background database task failed: {message}")